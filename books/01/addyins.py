@@ -9,6 +9,9 @@ Python版本 by msyloveldx, 2025/08
 
 import os
 import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Tuple, Dict
 from PyPDF2 import PdfReader, PdfWriter
@@ -16,6 +19,10 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from io import BytesIO
 
+# 叠加模块位于项目根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+from vrainOverlay import has_overlays
+
 class YinInserter:
     """印章插入器"""
     
@@ -95,14 +102,14 @@ class YinInserter:
                     position = parts[1]
                     yin_filename = parts[2]
                     
-                    # 解析位置信息: pid,col_begin,row_begin,cols
+                    # 解析位置信息: pid,col_begin,row_begin,cols（列、行位置和宽度比可为小数）
                     pos_parts = position.split(',')
                     if len(pos_parts) >= 4:
                         try:
                             pid = int(pos_parts[0])
-                            col_begin = int(pos_parts[1])
-                            row_begin = int(pos_parts[2])
-                            cols = int(pos_parts[3])
+                            col_begin = float(pos_parts[1])
+                            row_begin = float(pos_parts[2])
+                            cols = float(pos_parts[3])
                             
                             if pdf_name not in self.yins_config:
                                 self.yins_config[pdf_name] = []
@@ -170,61 +177,127 @@ class YinInserter:
         else:
             print(f"警告：印章文件 {yin_path} 不存在")
     
-    def process_pdfs(self):
-        """处理所有PDF文件"""
-        dims = self.calculate_dimensions()
+    def build_overlay(self, yins_by_page: Dict[int, List[Dict]], page_count: int,
+                      dims: Dict) -> Tuple[PdfReader, Dict[int, int]]:
+        """
+        生成印章叠加文档：每个有印章的页面对应一页，同一印章图片在文档中只嵌入一次
         
-        for pdf_name, yins_list in self.yins_config.items():
-            pdf_path = Path(f"{pdf_name}.pdf")
-            if not pdf_path.exists():
-                print(f"警告：PDF文件 {pdf_path} 不存在，跳过处理")
+        Returns:
+            (叠加文档, 原PDF页码 -> 叠加文档页序号)
+        """
+        packet = BytesIO()
+        overlay_canvas = canvas.Canvas(packet, pagesize=(dims['bg_width'], dims['bg_height']))
+        
+        overlay_pages = {}
+        for pid in sorted(yins_by_page):
+            if not 1 <= pid <= page_count:
+                print(f"警告：页码 {pid} 超出PDF页数 {page_count}，跳过")
                 continue
-            
-            print(f"打开PDF文件 '{pdf_name}' ...")
-            
-            # 读取原PDF
-            reader = PdfReader(str(pdf_path))
-            writer = PdfWriter()
-            
-            # 处理每一页
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                
-                # 检查是否需要在这一页插入印章
-                page_yins = [yin for yin in yins_list if yin['pid'] == page_num + 1]
-                
-                if page_yins:
-                    # 创建临时画布来添加印章
-                    packet = BytesIO()
-                    temp_canvas = canvas.Canvas(packet, 
-                                              pagesize=(dims['bg_width'], dims['bg_height']))
-                    
-                    # 在临时画布上添加印章
-                    for yin_info in page_yins:
-                        self.insert_yin(yin_info, temp_canvas, dims)
-                    
-                    temp_canvas.save()
-                    packet.seek(0)
-                    
-                    # 读取临时PDF并合并到原页面
-                    temp_pdf = PdfReader(packet)
-                    if temp_pdf.pages:
-                        page.merge_page(temp_pdf.pages[0])
-                
-                writer.add_page(page)
-            
-            # 保存结果
-            output_path = Path(f"{pdf_name}_印章.pdf")
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
-            
-            print(f"已保存到 {output_path}")
+            for yin_info in yins_by_page[pid]:
+                self.insert_yin(yin_info, overlay_canvas, dims)
+            overlay_canvas.showPage()
+            overlay_pages[pid] = len(overlay_pages)
+        
+        if not overlay_pages:
+            return None, overlay_pages
+        
+        overlay_canvas.save()
+        packet.seek(0)
+        return PdfReader(packet), overlay_pages
+    
+    def process_pdf(self, pdf_name: str, yins_list: List[Dict], dims: Dict) -> Dict:
+        """处理单个PDF文件：一次生成全部印章叠加页，再逐页合并，返回处理结果"""
+        pdf_path = Path(f"{pdf_name}.pdf")
+        if not pdf_path.exists():
+            print(f"警告：PDF文件 {pdf_path} 不存在，跳过处理")
+            return {'status': 'missing'}
+        
+        print(f"打开PDF文件 '{pdf_name}' ...")
+        
+        # 读取原PDF
+        reader = PdfReader(str(pdf_path))
+        if has_overlays(reader):
+            print(f"警告：PDF文件 {pdf_path} 生成时已叠加印章和插图，跳过处理")
+            return {'status': 'overlaid'}
+        writer = PdfWriter()
+        
+        # 页码 -> 印章列表
+        yins_by_page: Dict[int, List[Dict]] = {}
+        for yin in yins_list:
+            yins_by_page.setdefault(yin['pid'], []).append(yin)
+        
+        overlay, overlay_pages = self.build_overlay(yins_by_page, len(reader.pages), dims)
+        
+        # 处理每一页
+        for page_num, page in enumerate(reader.pages):
+            overlay_index = overlay_pages.get(page_num + 1)
+            if overlay_index is not None:
+                page.merge_page(overlay.pages[overlay_index])
+            writer.add_page(page)
+        
+        # 保存结果
+        output_path = Path(f"{pdf_name}_印章.pdf")
+        with open(output_path, 'wb') as output_file:
+            writer.write(output_file)
+        
+        print(f"已保存到 {output_path}")
+        return {'status': 'done', 'pages': len(reader.pages), 'stamped': len(overlay_pages)}
+    
+    def process_pdf_job(self, pdf_name: str, yins_list: List[Dict], dims: Dict) -> Dict:
+        """处理单个PDF文件并计时（可在工作进程中执行），出错时不影响其他文件"""
+        start = time.time()
+        result = {'pdf': pdf_name, 'status': 'failed', 'pages': 0, 'stamped': 0}
+        try:
+            result.update(self.process_pdf(pdf_name, yins_list, dims))
+        except Exception as e:
+            print(f"错误：处理PDF文件 '{pdf_name}' 失败: {e}")
+            result['error'] = str(e)
+        result['elapsed'] = time.time() - start
+        return result
+    
+    def process_pdfs(self, jobs: int = 1) -> List[Dict]:
+        """处理所有PDF文件，jobs大于1时各PDF文件在进程池中并行处理"""
+        dims = self.calculate_dimensions()
+        start = time.time()
+        
+        tasks = list(self.yins_config.items())
+        jobs = max(1, min(jobs, len(tasks)))
+        if jobs == 1:
+            results = [self.process_pdf_job(pdf_name, yins_list, dims) for pdf_name, yins_list in tasks]
+        else:
+            print(f"共 {len(tasks)} 个PDF文件，{jobs} 个进程并行处理")
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(self.process_pdf_job, pdf_name, yins_list, dims)
+                           for pdf_name, yins_list in tasks]
+                results = [future.result() for future in futures]
+        
+        self.print_summary(results, time.time() - start)
+        return results
+    
+    def print_summary(self, results: List[Dict], elapsed: float):
+        """输出每个PDF文件的处理耗时和汇总"""
+        status_names = {'done': '完成', 'missing': '不存在', 'overlaid': '已叠加', 'failed': '失败'}
+        print("处理结果：")
+        for result in results:
+            print(f"\t{result['pdf']}：{status_names[result['status']]}，{result['pages']}页，"
+                  f"叠加{result['stamped']}页，耗时{result['elapsed']:.2f}秒")
+        
+        done = sum(1 for r in results if r['status'] == 'done')
+        busy = sum(r['elapsed'] for r in results)
+        print(f"共 {len(results)} 个PDF文件：完成 {done} 个，其余 {len(results) - done} 个未处理；"
+              f"总耗时{elapsed:.2f}秒（各文件耗时合计{busy:.2f}秒）")
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='印章添加工具')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                       help='并行处理的进程数，默认为CPU核数，1为逐个处理')
+    
+    args = parser.parse_args()
+    
     try:
         inserter = YinInserter()
-        inserter.process_pdfs()
+        inserter.process_pdfs(args.jobs)
         
     except Exception as e:
         print(f"错误：{e}")
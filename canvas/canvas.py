@@ -4,27 +4,121 @@
 古籍刻本背景图生成工具
 Python版本 by msyloveldx, 2025/08
 原作者: shanleiguang, 2024.1.5
+
+同一套几何（版框、界行、鱼尾、书房名）既可栅格化为JPEG背景图，
+也可输出为reportlab画布上的矢量PDF表单，供排版引擎代替canvas/<id>.jpg引用。
+
+批量模式（--generate-all）多进程处理目录下全部配置，配置文件、书房名字体和本程序均未变化
+且输出文件齐全的背景图直接跳过；一次绘制可输出多种分辨率。
 """
 
 import os
+import io
 import sys
+import time
 import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Any, List, Optional
 from PIL import Image, ImageDraw, ImageFont
 import math
 
+# 清单与哈希工具位于项目根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vrainSession import file_hash, load_manifest, save_manifest
+
+# 输出分辨率：名称 -> (相对配置尺寸的缩放比例, 文件名后缀)，print即配置尺寸的canvas/<id>.jpg
+RESOLUTIONS = {
+    'print': (1.0, ''),
+    'screen': (0.5, '_screen'),
+    'phone': (0.35, '_phone'),
+}
+# 批量生成清单文件名，保存在背景图目录下
+MANIFEST_NAME = '.canvas.json'
+
+class PDFDraw:
+    """
+    矢量绘图适配器
+    
+    提供与PIL ImageDraw相同的line、rectangle、polygon、text接口，
+    把背景图的绘制输出为reportlab画布上的矢量路径，坐标原点由左上角换算为左下角。
+    """
+    
+    def __init__(self, c, height: float):
+        self.c = c
+        self.height = height
+    
+    def _y(self, y: float) -> float:
+        return self.height - y
+    
+    def line(self, xy, fill='black', width=1):
+        x1, y1, x2, y2 = xy
+        self.c.setStrokeColor(fill)
+        self.c.setLineWidth(width)
+        self.c.line(x1, self._y(y1), x2, self._y(y2))
+    
+    def rectangle(self, xy, fill=None, outline=None, width=1):
+        # PIL的矩形包含右下角像素，边框向内占width像素
+        x0, y0, x1, y1 = xy
+        w, h = x1 - x0 + 1, y1 - y0 + 1
+        if fill:
+            self.c.setFillColor(fill)
+            self.c.rect(x0, self._y(y1 + 1), w, h, stroke=0, fill=1)
+        if outline and width:
+            self.c.setStrokeColor(outline)
+            self.c.setLineWidth(width)
+            self.c.rect(x0 + width / 2, self._y(y1 + 1) + width / 2, w - width, h - width,
+                        stroke=1, fill=0)
+    
+    def polygon(self, xy, fill=None, outline=None, width=1):
+        path = self.c.beginPath()
+        path.moveTo(xy[0][0], self._y(xy[0][1]))
+        for x, y in xy[1:]:
+            path.lineTo(x, self._y(y))
+        path.close()
+        
+        stroke = 1 if outline and width else 0
+        if fill:
+            self.c.setFillColor(fill)
+        if stroke:
+            self.c.setStrokeColor(outline)
+            self.c.setLineWidth(width)
+        self.c.drawPath(path, stroke=stroke, fill=1 if fill else 0)
+    
+    def text(self, xy, text, fill=None, font=None):
+        # 只有字体文件可以嵌入PDF，PIL内置的默认字体跳过
+        font_path = getattr(font, 'path', None)
+        if not isinstance(font_path, (str, os.PathLike)):
+            return
+        
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        
+        font_name = f"canvas_{Path(font_path).stem}"
+        if font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(font_name, str(font_path)))
+        
+        # PIL以字顶为文字位置，PDF以基线为文字位置
+        x, y = xy
+        ascent = font.getmetrics()[0]
+        self.c.setFillColor(fill)
+        self.c.setFont(font_name, font.size)
+        self.c.drawString(x, self._y(y + ascent), text)
+
 class CanvasGenerator:
     """背景图生成器"""
     
-    def __init__(self, config_id: str):
+    def __init__(self, config_id: str, config_dir='.'):
         self.config_id = config_id
+        self.config_dir = Path(config_dir)
         self.config = {}
         
         self._load_config()
     
     def _load_config(self):
         """加载配置文件"""
-        config_path = Path(f"{self.config_id}.cfg")
+        config_path = self.config_dir / f"{self.config_id}.cfg"
         if not config_path.exists():
             raise FileNotFoundError(f"错误: 未找到配置文件 {config_path}")
         
@@ -51,12 +145,93 @@ class CanvasGenerator:
                     else:
                         self.config[key] = value
     
-    def create_canvas(self):
-        """创建背景图"""
-        # 获取配置参数
+    def create_canvas(self, resolutions=('print',)) -> List[Path]:
+        """创建背景图：按配置尺寸绘制一次，再缩放输出各分辨率，返回输出文件列表"""
+        cw = int(self.config.get('canvas_width', 2480))
+        ch = int(self.config.get('canvas_height', 1860))
+        cc = self.config.get('canvas_color', 'white')
+        
+        print("创建背景图...")
+        
+        # 创建图像
+        img = Image.new('RGB', (cw, ch), color=cc)
+        draw = ImageDraw.Draw(img)
+        self.draw_canvas(draw)
+        
+        # 保存图像
+        outputs = []
+        for resolution in resolutions:
+            scale, suffix = RESOLUTIONS[resolution]
+            output_path = self.output_path(resolution)
+            out = img
+            if scale != 1.0:
+                out = img.resize((max(1, round(cw * scale)), max(1, round(ch * scale))), Image.LANCZOS)
+            print(f"保存 '{output_path}' ...", end=' ')
+            out.save(output_path, 'JPEG', quality=95)
+            print("完成")
+            outputs.append(output_path)
+        return outputs
+    
+    def output_path(self, resolution: str = 'print') -> Path:
+        """指定分辨率的背景图路径"""
+        return self.config_dir / f"{self.config_id}{RESOLUTIONS[resolution][1]}.jpg"
+    
+    def source_hashes(self) -> Dict[str, str]:
+        """决定背景图内容的输入：配置文件、书房名字体和绘制程序本身"""
+        return {
+            'cfg_hash': file_hash(self.config_dir / f"{self.config_id}.cfg"),
+            'font_hash': file_hash(self._find_font(self.config.get('logo_font', 'qiji-combo.ttf'))),
+            'code_hash': file_hash(Path(__file__)),
+        }
+    
+    def create_form(self, c, name: str = None) -> str:
+        """
+        在reportlab画布上把背景定义为矢量PDF表单，各页用c.doForm(name)引用
+        
+        表单在文档中只保存一份，每页只增加一条引用，缩放不失真，也无需解码背景图。
+        
+        Returns:
+            str: 表单名称
+        """
         cw = int(self.config.get('canvas_width', 2480))
         ch = int(self.config.get('canvas_height', 1860))
         cc = self.config.get('canvas_color', 'white')
+        name = name or f"canvas_{self.config_id}"
+        
+        c.beginForm(name, lowerx=0, lowery=0, upperx=cw, uppery=ch)
+        draw = PDFDraw(c, ch)
+        draw.rectangle([0, 0, cw - 1, ch - 1], fill=cc)
+        self.draw_canvas(draw)
+        c.endForm()
+        return name
+    
+    def create_pdf(self):
+        """输出单页矢量背景PDF，便于检查矢量背景效果"""
+        from reportlab.pdfgen import canvas as pdf_canvas
+        
+        cw = int(self.config.get('canvas_width', 2480))
+        ch = int(self.config.get('canvas_height', 1860))
+        output_path = self.config_dir / f"{self.config_id}.pdf"
+        
+        c = pdf_canvas.Canvas(str(output_path), pagesize=(cw, ch))
+        c.doForm(self.create_form(c))
+        c.showPage()
+        c.save()
+        print(f"保存 '{output_path}' ...完成")
+    
+    def _find_font(self, font_file: str):
+        """查找书房名字体：背景图配置目录，其次是项目的fonts目录"""
+        candidates = (self.config_dir / font_file, self.config_dir.absolute().parent / 'fonts' / font_file)
+        for font_path in candidates:
+            if font_path.exists():
+                return font_path
+        return None
+    
+    def draw_canvas(self, draw):
+        """按配置绘制版框、界行、鱼尾和书房名，draw为PIL ImageDraw或PDFDraw"""
+        # 获取配置参数
+        cw = int(self.config.get('canvas_width', 2480))
+        ch = int(self.config.get('canvas_height', 1860))
         
         mt = int(self.config.get('margins_top', 200))
         mb = int(self.config.get('margins_bottom', 50))
@@ -101,12 +276,6 @@ class CanvasGenerator:
         
         clw = (cw - ml - mr - lcw) / cln
         
-        print("创建背景图...")
-        
-        # 创建图像
-        img = Image.new('RGB', (cw, ch), color=cc)
-        draw = ImageDraw.Draw(img)
-        
         # 绘制外框
         draw.rectangle([ml - olw//2 - moh, mt - olw//2 - mov, 
                        cw - mr + olw//2 + moh, ch - mb + olw//2 + mov],
@@ -139,12 +308,9 @@ class CanvasGenerator:
         # 绘制文字
         if lgt:
             try:
-                font_path = Path(lgf)
-                if not font_path.exists():
-                    # 尝试在当前目录查找字体文件
-                    font_path = Path(f"./{lgf}")
+                font_path = self._find_font(lgf)
                 
-                if font_path.exists():
+                if font_path:
                     font = ImageFont.truetype(str(font_path), lgs)
                 else:
                     # 使用默认字体
@@ -159,12 +325,6 @@ class CanvasGenerator:
                     
             except Exception as e:
                 print(f"绘制文字时出错: {e}")
-        
-        # 保存图像
-        output_path = Path(f"{self.config_id}.jpg")
-        print(f"保存 '{output_path}' ...", end=' ')
-        img.save(output_path, 'JPEG', quality=95)
-        print("完成")
     
     def _draw_fish_top(self, draw, cw, fy, dy1, dy2, flc, flw, ftc, lcw, flm):
         """绘制上鱼尾"""
@@ -235,17 +395,124 @@ class CanvasGenerator:
         draw.line([cw//2, fy - dy1 - flm, cw//2 + lcw//2, fy - dy1 - dy2 - flm], 
                  fill=flc, width=1)
 
+def generate_job(config_id: str, config_dir: str, resolutions: List[str],
+                 entry: Optional[Dict[str, Any]], pdf: bool = False) -> Dict[str, Any]:
+    """
+    生成单个背景图（在工作进程中执行），输入与清单记录一致且输出文件齐全时跳过
+    
+    Returns:
+        Dict[str, Any]: 处理结果，status为'done'、'skipped'或'failed'
+    """
+    start = time.time()
+    result = {'config_id': config_id, 'status': 'failed'}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator = CanvasGenerator(config_id, config_dir)
+            hashes = generator.source_hashes()
+            result['entry'] = dict(hashes, resolutions=sorted(resolutions))
+            
+            outputs = [generator.output_path(r) for r in resolutions]
+            if pdf:
+                outputs.append(generator.config_dir / f"{config_id}.pdf")
+            if (entry and all(entry.get(k) == v for k, v in hashes.items())
+                    and set(resolutions) <= set(entry.get('resolutions', []))
+                    and all(p.exists() for p in outputs)):
+                result['entry'] = entry
+                result.update(status='skipped', elapsed=time.time() - start)
+                return result
+            
+            generator.create_canvas(resolutions)
+            if pdf:
+                generator.create_pdf()
+        result.update(status='done', elapsed=time.time() - start)
+    except Exception as e:
+        result.update(error=str(e), elapsed=time.time() - start)
+    return result
+
+def generate_all(config_dir: Path, resolutions: List[str], jobs: int, force: bool = False,
+                 pdf: bool = False):
+    """批量生成目录下全部配置的背景图"""
+    config_ids = sorted(p.stem for p in config_dir.glob('*.cfg'))
+    if not config_ids:
+        print("未找到背景图配置文件")
+        return
+    
+    jobs = max(1, min(jobs, len(config_ids)))
+    print(f"找到 {len(config_ids)} 个背景图配置，{jobs} 个进程并行，分辨率：{', '.join(resolutions)}")
+    
+    # 生成清单：配置ID -> {cfg_hash, font_hash, code_hash, resolutions}
+    manifest_path = config_dir / MANIFEST_NAME
+    manifest = {} if force else load_manifest(manifest_path, "生成清单无法读取，将全部重新生成")
+    start = time.time()
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    
+    def finish(result: Dict[str, Any]):
+        """记录单个背景图的生成结果"""
+        status = result['status']
+        counts[status] += 1
+        if status == 'failed':
+            print(f"生成背景图'{result['config_id']}'...失败！{result.get('error', '')}")
+            return
+        manifest[result['config_id']] = result['entry']
+        if status == 'skipped':
+            print(f"生成背景图'{result['config_id']}'...未变化，跳过")
+        else:
+            print(f"生成背景图'{result['config_id']}'...完成！耗时{result['elapsed']:.2f}秒")
+    
+    try:
+        if jobs == 1:
+            for config_id in config_ids:
+                finish(generate_job(config_id, str(config_dir), resolutions,
+                                    manifest.get(config_id), pdf))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(generate_job, config_id, str(config_dir), resolutions,
+                                           manifest.get(config_id), pdf)
+                           for config_id in config_ids]
+                for future in as_completed(futures):
+                    finish(future.result())
+    finally:
+        save_manifest(manifest_path, manifest)
+    
+    print(f"共 {len(config_ids)} 个背景图：生成 {counts['done']} 个，跳过 {counts['skipped']} 个，"
+          f"失败 {counts['failed']} 个，耗时{time.time() - start:.1f}秒")
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='古籍刻本背景图生成工具')
-    parser.add_argument('-c', '--config', required=True, 
+    parser.add_argument('-c', '--config',
                        help='配置文件ID（不含扩展名）')
+    parser.add_argument('--generate-all', action='store_true',
+                       help='批量生成当前目录下全部配置的背景图，未变化的跳过')
+    parser.add_argument('-r', '--resolutions',
+                       help=f"输出分辨率，逗号分隔，可选{'、'.join(RESOLUTIONS)}；"
+                            f"单个配置默认print，批量模式默认全部")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                       help='批量模式并行的进程数，默认为CPU核数')
+    parser.add_argument('--force', action='store_true',
+                       help='批量模式忽略生成清单，全部重新生成')
+    parser.add_argument('--pdf', action='store_true',
+                       help='同时输出单页矢量背景PDF')
     
     args = parser.parse_args()
     
+    if not args.config and not args.generate_all:
+        parser.error("需要指定'-c'配置文件ID或'--generate-all'")
+    
+    resolutions = args.resolutions.split(',') if args.resolutions else None
+    for resolution in resolutions or []:
+        if resolution not in RESOLUTIONS:
+            parser.error(f"未知分辨率'{resolution}'，可选{'、'.join(RESOLUTIONS)}")
+    
+    if args.generate_all:
+        generate_all(Path('.'), resolutions or list(RESOLUTIONS), args.jobs, args.force, args.pdf)
+        return
+    
     try:
         generator = CanvasGenerator(args.config)
-        generator.create_canvas()
+        generator.create_canvas(resolutions or ['print'])
+        if args.pdf:
+            generator.create_pdf()
         
     except Exception as e:
         print(f"错误：{e}")
@@ -36,9 +36,24 @@ except ImportError:
     print("警告：无法导入vrainNovel.py模块")
     VRainPDFGenerator = None
 
+from vrainProgress import BuildCancelled, CancelToken, format_progress, progress_percent
+from vrainSession import EngineSession
+from vrainJobs import (JobQueue, JOB_PERFECT, JOB_NOVEL, STATUS_NAMES, STATUS_QUEUED, STATUS_RUNNING,
+                       STATUS_DONE, build_perfect, build_novel)
+
 # 全局变量
 SOFTWARE = 'vRain'
 VERSION = 'v1.4-ModernGUI'
+# 日志框最多保留的行数，超出时删除最早的行
+MAX_LOG_LINES = 5000
+# 日志级别图标
+LOG_LEVEL_ICONS = {
+    'INFO': '📝',
+    'SUCCESS': '✅',
+    'WARNING': '⚠️',
+    'ERROR': '❌',
+    'DEBUG': '🔍'
+}
 
 # 现代化主题配置
 class ModernTheme:
@@ -238,6 +253,7 @@ class VRainDualGUI:
         self.perfect_test_pages_var = tk.IntVar()
         self.perfect_compress_var = tk.BooleanVar(value=False)
         self.perfect_verbose_var = tk.BooleanVar(value=True)
+        self.perfect_profile_var = tk.BooleanVar(value=False)
         
         # 小说章节模式变量
         self.novel_text_file_var = tk.StringVar()
@@ -248,6 +264,17 @@ class VRainDualGUI:
         self.novel_test_pages_var = tk.IntVar()
         self.novel_compress_var = tk.BooleanVar(value=False)
         self.novel_verbose_var = tk.BooleanVar(value=True)
+        self.novel_profile_var = tk.BooleanVar(value=False)
+        
+        # 当前构建的取消令牌，没有构建时为None
+        self.cancel_token = None
+        
+        # 引擎会话：多次生成之间复用已注册的字体、字符支持情况、简繁转换器和预处理文本
+        self.engine_session = EngineSession()
+        
+        # 批量任务队列，首次加入任务时创建
+        self.job_queue = None
+        self.job_workers_var = tk.IntVar(value=max(1, (os.cpu_count() or 2) // 2))
     
     def create_widgets(self):
         """创建GUI组件"""
@@ -283,9 +310,10 @@ class VRainDualGUI:
         style = ttk.Style()
         style.configure('TNotebook.Tab', padding=[20, 10], font=('Segoe UI', 11, 'bold'))
         
-        # 创建两个标签页
+        # 创建标签页
         self.create_perfect_tab()
         self.create_novel_tab()
+        self.create_queue_tab()
         
         # 日志输出区域（共享）
         self.create_log_frame(main_frame)
@@ -353,6 +381,54 @@ class VRainDualGUI:
         # 快速示例
         self.create_novel_examples(self.novel_frame)
     
+    def create_queue_tab(self):
+        """创建批量任务队列标签页"""
+        # 创建标签页框架
+        self.queue_frame = ttk.Frame(self.notebook, padding="15")
+        self.notebook.add(self.queue_frame, text="🗂 批量任务")
+        
+        # 配置网格权重
+        self.queue_frame.columnconfigure(0, weight=1)
+        self.queue_frame.rowconfigure(1, weight=1)
+        
+        # 说明文字
+        desc_label = ttk.Label(self.queue_frame,
+                              text="在两个模式页点击“加入队列”排入多个任务，由多个工作进程并行生成",
+                              font=("Segoe UI", 10))
+        desc_label.grid(row=0, column=0, pady=(0, 15), sticky=tk.W)
+        
+        # 任务列表
+        list_frame = ttk.LabelFrame(self.queue_frame, text="📋 任务列表")
+        list_frame.grid(row=1, column=0, sticky=tk.W+tk.E+tk.N+tk.S, pady=(0, 15))
+        list_frame.columnconfigure(0, weight=1)
+        list_frame.rowconfigure(0, weight=1)
+        
+        columns = ('id', 'task', 'status', 'progress')
+        self.job_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=10)
+        for column, text, width in (('id', '#', 40), ('task', '任务', 320), ('status', '状态', 80), ('progress', '进度', 320)):
+            self.job_tree.heading(column, text=text)
+            self.job_tree.column(column, width=width, stretch=(column != 'id'))
+        self.job_tree.grid(row=0, column=0, sticky=tk.W+tk.E+tk.N+tk.S, padx=(10, 0), pady=10)
+        self.job_tree.bind('<Double-1>', lambda event: self.show_job_log())
+        
+        job_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.job_tree.yview)
+        job_scrollbar.grid(row=0, column=1, sticky=tk.N+tk.S, pady=10)
+        self.job_tree.configure(yscrollcommand=job_scrollbar.set)
+        
+        # 控制按钮
+        control_frame = ttk.Frame(self.queue_frame)
+        control_frame.grid(row=2, column=0, sticky=tk.W+tk.E)
+        
+        ttk.Button(control_frame, text="⬆ 上移", command=lambda: self.move_job(-1)).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(control_frame, text="⬇ 下移", command=lambda: self.move_job(1)).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(control_frame, text="✖ 取消任务", command=self.cancel_job).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(control_frame, text="🧹 清除已结束", command=self.clear_finished_jobs).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(control_frame, text="📄 查看日志", command=self.show_job_log).pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Label(control_frame, text="并行进程数:", font=("Segoe UI", 10)).pack(side=tk.LEFT, padx=(20, 5))
+        ttk.Spinbox(control_frame, from_=1, to=max(2, os.cpu_count() or 2), textvariable=self.job_workers_var,
+                    width=5, command=self.on_job_workers_change).pack(side=tk.LEFT)
+    
     def create_perfect_book_selection(self, parent):
         """创建传统古籍模式的书籍选择区域"""
         # 书籍选择框架
@@ -437,7 +513,10 @@ class VRainDualGUI:
         compress_cb.pack(side=tk.LEFT, padx=(0, 30))
         
         verbose_cb = ttk.Checkbutton(option_container, text="📝 详细输出", variable=self.perfect_verbose_var)
-        verbose_cb.pack(side=tk.LEFT)
+        verbose_cb.pack(side=tk.LEFT, padx=(0, 30))
+        
+        profile_cb = ttk.Checkbutton(option_container, text="⏱ 性能分析", variable=self.perfect_profile_var)
+        profile_cb.pack(side=tk.LEFT)
     
     def create_perfect_controls(self, parent):
         """创建传统古籍模式的控制按钮区域"""
@@ -453,6 +532,8 @@ class VRainDualGUI:
         self.perfect_generate_btn = ttk.Button(button_container, text="📝 生成PDF", command=self.generate_perfect_pdf)
         self.perfect_generate_btn.pack(side=tk.LEFT, padx=(0, 15))
         
+        ttk.Button(button_container, text="➕ 加入队列", command=self.queue_perfect_pdf).pack(side=tk.LEFT, padx=(0, 15))
+        
         # 辅助按钮
         ttk.Button(button_container, text="📁 打开书籍目录", command=self.open_book_dir).pack(side=tk.LEFT, padx=(0, 15))
         
@@ -556,7 +637,8 @@ class VRainDualGUI:
         
         # 复选框
         ttk.Checkbutton(option_container, text="📋 压缩PDF", variable=self.novel_compress_var).pack(side=tk.LEFT, padx=(0, 30))
-        ttk.Checkbutton(option_container, text="📝 详细输出", variable=self.novel_verbose_var).pack(side=tk.LEFT)
+        ttk.Checkbutton(option_container, text="📝 详细输出", variable=self.novel_verbose_var).pack(side=tk.LEFT, padx=(0, 30))
+        ttk.Checkbutton(option_container, text="⏱ 性能分析", variable=self.novel_profile_var).pack(side=tk.LEFT)
     def create_novel_controls(self, parent):
         """创建小说章节模式的控制按钮区域"""
         # 控制框架
@@ -566,6 +648,7 @@ class VRainDualGUI:
         # 按钮
         self.novel_generate_btn = ttk.Button(control_frame, text="生成PDF", command=self.generate_novel_pdf)
         self.novel_generate_btn.pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(control_frame, text="加入队列", command=self.queue_novel_pdf).pack(side=tk.LEFT, padx=(0, 10))
         
         ttk.Button(control_frame, text="验证配置", command=self.validate_novel_config).pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(control_frame, text="预览章节", command=self.preview_chapters).pack(side=tk.LEFT, padx=(0, 10))
@@ -614,6 +697,10 @@ class VRainDualGUI:
         self.progress_bar = ttk.Progressbar(status_frame, variable=self.progress_var, maximum=100)
         self.progress_bar.grid(row=0, column=1, sticky=tk.W+tk.E, padx=(10, 0))
         status_frame.columnconfigure(1, weight=1)
+        
+        # 停止按钮，构建进行中可用
+        self.stop_btn = ttk.Button(status_frame, text="⏹ 停止", command=self.stop_build, state='disabled')
+        self.stop_btn.grid(row=0, column=2, padx=(10, 0))
     def refresh_book_list(self):
         """刷新书籍列表"""
         try:
@@ -640,39 +727,54 @@ class VRainDualGUI:
                 self.log_message(f"📚 已选择书籍: {book_id}", 'INFO')
         except Exception as e:
             self.log_message(f"选择书籍失败: {e}", 'ERROR')
+    def get_perfect_params(self):
+        """检查并读取传统古籍模式的参数，有误时提示并返回None"""
+        book_id = self.perfect_book_id_var.get().strip()
+        if not book_id:
+            messagebox.showerror("错误", "请选择或输入书籍ID")
+            return None
+        
+        if VRainPerfect is None:
+            messagebox.showerror("错误", "无法加载 vrain.py 模块")
+            return None
+        
+        # 检查书籍目录是否存在
+        book_path = Path('books') / book_id
+        if not book_path.exists():
+            messagebox.showerror("错误", f"书籍目录不存在: {book_path}")
+            return None
+        
+        return {
+            'book_id': book_id,
+            'from_page': self.perfect_from_page_var.get(),
+            'to_page': self.perfect_to_page_var.get(),
+            'test_pages': self.perfect_test_pages_var.get(),
+            'compress': self.perfect_compress_var.get(),
+            'verbose': self.perfect_verbose_var.get(),
+            'profile': 'cprofile' if self.perfect_profile_var.get() else None
+        }
     def generate_perfect_pdf(self):
         """生成传统古籍模式PDF"""
         try:
-            book_id = self.perfect_book_id_var.get().strip()
-            if not book_id:
-                messagebox.showerror("错误", "请选择或输入书籍ID")
-                return
-            
-            if VRainPerfect is None:
-                messagebox.showerror("错误", "无法加载 vrain.py 模块")
-                return
-            
-            # 检查书籍目录是否存在
-            book_path = Path('books') / book_id
-            if not book_path.exists():
-                messagebox.showerror("错误", f"书籍目录不存在: {book_path}")
+            params = self.get_perfect_params()
+            if params is None:
                 return
             
             # 禁用按钮
             self.perfect_generate_btn.configure(state='disabled')
-            self.update_progress(0)
-            self.status_var.set("正在生成PDF...")
+            self.start_build()
             
             # 在新线程中生成PDF
-            thread = threading.Thread(target=self._generate_perfect_pdf_thread, args=(book_id,), daemon=True)
+            thread = threading.Thread(target=self._generate_perfect_pdf_thread, args=(params,), daemon=True)
             thread.start()
             
         except Exception as e:
             self.log_message(f"生成PDF失败: {e}")
             self.perfect_generate_btn.configure(state='normal')
             self.status_var.set("就绪")
-    def _generate_perfect_pdf_thread(self, book_id):
+    def _generate_perfect_pdf_thread(self, params):
         """在后台线程中生成完美复刿PDF"""
+        book_id = params['book_id']
         try:
             # 检查 VRainPerfect 模块是否可用
             if VRainPerfect is None:
@@ -681,46 +783,18 @@ class VRainDualGUI:
                 return
             
             self.message_queue.put(('log', f"开始生成书籍: {book_id}"))
-            self.message_queue.put(('progress', 10))
-            
-            # 创建 VRainPerfect 实例
-            vrain = VRainPerfect()
-            
-            # 设置参数 - 模拟命令行参数
-            vrain.opts = {
-                'b': book_id,
-                'f': self.perfect_from_page_var.get(),
-                't': self.perfect_to_page_var.get(),
-                'z': self.perfect_test_pages_var.get() if self.perfect_test_pages_var.get() > 0 else None,
-                'c': self.perfect_compress_var.get(),
-                'v': self.perfect_verbose_var.get()
-            }
-            
-            self.message_queue.put(('progress', 30))
             
-            # 加载配置
-            vrain.load_zh_numbers()
-            vrain.check_directories(book_id)
-            vrain.load_book_config(book_id)
-            vrain.validate_config()
-            vrain.setup_fonts()
-            vrain.load_canvas_config()
-            vrain.calculate_positions()
+            # 与命令行流程相同，排版进度经消息队列报告给界面
+            pdf_file = build_perfect(params, self.engine_session, self.post_build_progress, self.cancel_token,
+                                     profile_log=self.post_build_log)
             
-            self.message_queue.put(('progress', 60))
-            
-            # 加载文本
-            dats, if_text000, if_text999 = vrain.load_texts(book_id, vrain.opts['f'], vrain.opts['t'])
-            
-            self.message_queue.put(('progress', 80))
-            
-            # 生成PDF
-            pdf_file = vrain.create_pdf(book_id, vrain.opts['f'], vrain.opts['t'], dats, if_text000, if_text999)
-            
-            self.message_queue.put(('progress', 100))
             self.message_queue.put(('log', f"PDF生成完成: {pdf_file}"))
+            self.message_queue.put(('log', f"引擎会话: {self.engine_session.summary()}"))
             self.message_queue.put(('status', "生成完成"))
             
+        except BuildCancelled:
+            self.message_queue.put(('log', f"已停止生成书籍: {book_id}"))
+            self.message_queue.put(('status', "已停止"))
         except Exception as e:
             self.message_queue.put(('log', f"生成PDF错误: {e}"))
             self.message_queue.put(('status', "生成失败"))
@@ -812,48 +886,65 @@ class VRainDualGUI:
         if filename:
             self.novel_cover_file_var.set(filename)
             self.log_message(f"已选择封面文件: {filename}")
+    def get_novel_params(self):
+        """检查并读取小说章节模式的参数，有误时提示并返回None"""
+        text_file = self.novel_text_file_var.get().strip()
+        book_cfg = self.novel_book_cfg_var.get().strip()
+        
+        if not text_file:
+            messagebox.showerror("错误", "请选择文本文件")
+            return None
+            
+        if not book_cfg:
+            messagebox.showerror("错误", "请选择书籍配置文件")
+            return None
+        
+        if VRainPDFGenerator is None:
+            messagebox.showerror("错误", "无法加载 vrainNovel.py 模块")
+            return None
+        
+        # 检查文件是否存在
+        if not Path(text_file).exists():
+            messagebox.showerror("错误", f"文本文件不存在: {text_file}")
+            return None
+            
+        if not Path(book_cfg).exists():
+            messagebox.showerror("错误", f"配置文件不存在: {book_cfg}")
+            return None
+        
+        return {
+            'text_file': text_file,
+            'book_cfg': book_cfg,
+            'cover_file': self.novel_cover_file_var.get() or None,
+            'from_page': self.novel_from_page_var.get(),
+            'to_page': self.novel_to_page_var.get(),
+            'test_pages': self.novel_test_pages_var.get(),
+            'compress': self.novel_compress_var.get(),
+            'verbose': self.novel_verbose_var.get(),
+            'profile': 'cprofile' if self.novel_profile_var.get() else None
+        }
     def generate_novel_pdf(self):
         """生成小说章节模式PDF"""
         try:
-            text_file = self.novel_text_file_var.get().strip()
-            book_cfg = self.novel_book_cfg_var.get().strip()
-            
-            if not text_file:
-                messagebox.showerror("错误", "请选择文本文件")
-                return
-                
-            if not book_cfg:
-                messagebox.showerror("错误", "请选择书籍配置文件")
-                return
-            
-            if VRainPDFGenerator is None:
-                messagebox.showerror("错误", "无法加载 vrainNovel.py 模块")
-                return
-            
-            # 检查文件是否存在
-            if not Path(text_file).exists():
-                messagebox.showerror("错误", f"文本文件不存在: {text_file}")
-                return
-                
-            if not Path(book_cfg).exists():
-                messagebox.showerror("错误", f"配置文件不存在: {book_cfg}")
+            params = self.get_novel_params()
+            if params is None:
                 return
             
             # 禁用按钮
             self.novel_generate_btn.configure(state='disabled')
-            self.update_progress(0)
-            self.status_var.set("正在生成PDF...")
+            self.start_build()
             
             # 在新线程中生成PDF
-            thread = threading.Thread(target=self._generate_novel_pdf_thread, daemon=True)
+            thread = threading.Thread(target=self._generate_novel_pdf_thread, args=(params,), daemon=True)
             thread.start()
             
         except Exception as e:
             self.log_message(f"生成PDF失败: {e}")
             self.novel_generate_btn.configure(state='normal')
             self.status_var.set("就绪")
-    def _generate_novel_pdf_thread(self):
+    def _generate_novel_pdf_thread(self, params):
         """在后台线程中生成小说PDF"""
+        text_file = params['text_file']
         try:
             # 检查 VRainPDFGenerator 模块是否可用
             if VRainPDFGenerator is None:
@@ -861,40 +952,19 @@ class VRainDualGUI:
                 self.message_queue.put(('status', "模块加载失败"))
                 return
             
-            # 获取参数
-            text_file = self.novel_text_file_var.get()
-            book_cfg = self.novel_book_cfg_var.get()
-            cover_file = self.novel_cover_file_var.get() if self.novel_cover_file_var.get() else None
-            from_page = self.novel_from_page_var.get()
-            to_page = self.novel_to_page_var.get() if self.novel_to_page_var.get() > 0 else None
-            test_pages = self.novel_test_pages_var.get() if self.novel_test_pages_var.get() > 0 else None
-            compress = self.novel_compress_var.get()
-            verbose = self.novel_verbose_var.get()
-            
             self.message_queue.put(('log', f"开始生成小说PDF: {Path(text_file).name}"))
-            self.message_queue.put(('progress', 10))
-            
-            # 创建 VRainPDFGenerator 实例，使用正确的参数
-            generator = VRainPDFGenerator(
-                text_file=text_file,
-                book_cfg_path=book_cfg,
-                cover_path=cover_file,
-                from_page=from_page,
-                to_page=to_page,
-                test_pages=test_pages,
-                compress=compress,
-                verbose=verbose
-            )
-            
-            self.message_queue.put(('progress', 30))
             
-            # 调用生成方法
-            result = generator.generate_pdf(Path(text_file))
+            # 排版进度经消息队列报告给界面
+            result = build_novel(params, self.engine_session, self.post_build_progress, self.cancel_token,
+                                 profile_log=self.post_build_log)
             
-            self.message_queue.put(('progress', 100))
             self.message_queue.put(('log', f"小说PDF生成完成: {result}"))
+            self.message_queue.put(('log', f"引擎会话: {self.engine_session.summary()}"))
             self.message_queue.put(('status', "生成完成"))
             
+        except BuildCancelled:
+            self.message_queue.put(('log', f"已停止生成小说PDF: {Path(text_file).name}"))
+            self.message_queue.put(('status', "已停止"))
         except Exception as e:
             self.message_queue.put(('log', f"生成小说PDF错误: {e}"))
             self.message_queue.put(('status', "生成失败"))
@@ -1008,28 +1078,138 @@ class VRainDualGUI:
         messagebox.showinfo("小说章节模式帮助", help_text)
     def log_message(self, message, level='INFO'):
         """记录日志消息"""
+        self.append_log([(message, level)])
+    def append_log(self, entries):
+        """批量记录日志：一次插入日志框并滚动，超出MAX_LOG_LINES时删除最早的行"""
         try:
-            if hasattr(self, 'log_text'):
+            if hasattr(self, 'log_text') and entries:
                 import time
                 timestamp = time.strftime('%H:%M:%S')
                 
                 # 根据日志级别添加图标
-                level_icons = {
-                    'INFO': '📝',
-                    'SUCCESS': '✅',
-                    'WARNING': '⚠️',
-                    'ERROR': '❌',
-                    'DEBUG': '🔍'
-                }
+                text = ''.join(f"[{timestamp}] {LOG_LEVEL_ICONS.get(level, '📝')} {message}\n"
+                               for message, level in entries)
                 
-                icon = level_icons.get(level, '📝')
-                log_entry = f"[{timestamp}] {icon} {message}\n"
-                
-                self.log_text.insert(tk.END, log_entry)
+                self.log_text.insert(tk.END, text)
+                lines = int(self.log_text.index('end-1c').split('.')[0])
+                if lines > MAX_LOG_LINES:
+                    self.log_text.delete('1.0', f"{lines - MAX_LOG_LINES + 1}.0")
                 self.log_text.see(tk.END)
-                print(f"LOG: {message}")  # 也输出到控制台
+                print('\n'.join(f"LOG: {message}" for message, level in entries))  # 也输出到控制台
         except Exception as e:
             print(f"日志记录失败: {e}")
+    def start_build(self):
+        """开始构建：重置进度，创建取消令牌并启用停止按钮"""
+        self.cancel_token = CancelToken()
+        self.update_progress(0)
+        self.status_var.set("正在生成PDF...")
+        self.stop_btn.configure(state='normal')
+    def stop_build(self):
+        """停止当前构建：排版引擎在下一个页边界停止"""
+        if self.cancel_token and not self.cancel_token.cancelled:
+            self.cancel_token.cancel()
+            self.stop_btn.configure(state='disabled')
+            self.status_var.set("正在停止...")
+            self.log_message("正在停止生成...", 'WARNING')
+    def get_job_queue(self):
+        """批量任务队列，首次使用时创建，事件经消息队列回到界面"""
+        if self.job_queue is None:
+            self.job_queue = JobQueue(self.message_queue.put, self.job_workers_var.get())
+        return self.job_queue
+    def queue_perfect_pdf(self):
+        """把当前传统古籍模式参数加入批量任务队列"""
+        params = self.get_perfect_params()
+        if params is None:
+            return
+        title = f"古籍 {params['book_id']} 文本{params['from_page']}至{params['to_page']}"
+        job = self.get_job_queue().add(JOB_PERFECT, params, title)
+        self.log_message(f"已加入队列 #{job.job_id}: {title}")
+    def queue_novel_pdf(self):
+        """把当前小说章节模式参数加入批量任务队列"""
+        params = self.get_novel_params()
+        if params is None:
+            return
+        title = f"小说 {Path(params['text_file']).name}"
+        job = self.get_job_queue().add(JOB_NOVEL, params, title)
+        self.log_message(f"已加入队列 #{job.job_id}: {title}")
+    def selected_job_id(self):
+        """任务列表中选中的任务编号"""
+        selection = self.job_tree.selection()
+        return int(selection[0]) if selection else None
+    def move_job(self, delta):
+        """在排队中的任务之间调整选中任务的顺序"""
+        job_id = self.selected_job_id()
+        if job_id is not None and self.job_queue and self.job_queue.move(job_id, delta):
+            self.refresh_job_list()
+    def cancel_job(self):
+        """取消选中的任务"""
+        job_id = self.selected_job_id()
+        if job_id is not None and self.job_queue and self.job_queue.cancel(job_id):
+            self.log_message(f"正在取消任务 #{job_id}", 'WARNING')
+    def clear_finished_jobs(self):
+        """从列表中移除已结束的任务"""
+        if self.job_queue:
+            self.job_queue.clear_finished()
+            self.refresh_job_list()
+    def on_job_workers_change(self):
+        """调整并行进程数"""
+        if self.job_queue:
+            self.job_queue.set_workers(self.job_workers_var.get())
+    def show_job_log(self):
+        """在新窗口中显示选中任务的完整日志"""
+        job_id = self.selected_job_id()
+        job = self.job_queue.get(job_id) if job_id is not None and self.job_queue else None
+        if job is None:
+            return
+        window = tk.Toplevel(self.root)
+        window.title(f"任务 #{job.job_id} 日志 - {job.title}")
+        log_text = scrolledtext.ScrolledText(window, width=100, height=30)
+        log_text.pack(fill='both', expand=True)
+        log_text.insert(tk.END, '\n'.join(job.logs))
+        if job.error:
+            log_text.insert(tk.END, f"\n错误: {job.error}")
+        log_text.configure(state='disabled')
+    def refresh_job_row(self, job_id):
+        """更新任务列表中的一行"""
+        job = self.job_queue.get(job_id) if self.job_queue else None
+        if job is None:
+            return
+        if job.status == STATUS_RUNNING and job.progress:
+            progress = format_progress(job.progress)
+        elif job.status == STATUS_DONE:
+            progress = Path(job.output).name if job.output else ''
+        else:
+            progress = job.error or ''
+        values = (job.job_id, job.title, STATUS_NAMES[job.status], progress)
+        iid = str(job.job_id)
+        if self.job_tree.exists(iid):
+            self.job_tree.item(iid, values=values)
+        else:
+            self.job_tree.insert('', tk.END, iid=iid, values=values)
+    def refresh_job_list(self):
+        """按队列顺序重建任务列表"""
+        jobs = list(self.job_queue.jobs) if self.job_queue else []
+        ids = {str(job.job_id) for job in jobs}
+        for iid in self.job_tree.get_children():
+            if iid not in ids:
+                self.job_tree.delete(iid)
+        for index, job in enumerate(jobs):
+            self.refresh_job_row(job.job_id)
+            self.job_tree.move(str(job.job_id), '', index)
+    def on_close(self):
+        """关闭窗口：取消批量任务并关闭工作进程"""
+        if self.job_queue and self.job_queue.running():
+            if not messagebox.askyesno("确认", "仍有任务在运行，确定取消全部任务并退出吗？"):
+                return
+        if self.job_queue:
+            self.job_queue.shutdown()
+        self.root.destroy()
+    def post_build_progress(self, info):
+        """排版引擎的进度回调（在后台线程中调用），转发到消息队列"""
+        self.message_queue.put(('build_progress', info))
+    def post_build_log(self, message):
+        """排版引擎的日志输出（在后台线程中调用），转发到消息队列"""
+        self.message_queue.put(('log', message))
     def update_progress(self, progress):
         """更新进度条"""
         try:
@@ -1069,19 +1249,38 @@ class VRainDualGUI:
         except Exception as e:
             self.log_message(f"打开结果目录失败: {e}")
     def process_messages(self):
-        """处理消息队列中的消息"""
+        """处理消息队列中的消息，本轮的日志合并后一次写入日志框"""
+        log_entries = []
         try:
             while True:
                 try:
                     message_type, message_data = self.message_queue.get_nowait()
                     
                     if message_type == 'log':
-                        self.log_message(message_data)
+                        log_entries.append((message_data, 'INFO'))
                     elif message_type == 'progress':
                         self.update_progress(message_data)
+                    elif message_type == 'build_progress':
+                        self.update_progress(progress_percent(message_data))
+                        if not (self.cancel_token and self.cancel_token.cancelled):
+                            self.status_var.set(format_progress(message_data))
                     elif message_type == 'status':
                         self.status_var.set(message_data)
+                    elif message_type == 'job_progress':
+                        self.refresh_job_row(message_data[0])
+                    elif message_type == 'job_log':
+                        job_id, lines = message_data
+                        log_entries.extend((f"[#{job_id}] {line}", 'INFO') for line in lines.split('\n'))
+                    elif message_type == 'job_state':
+                        self.refresh_job_row(message_data)
+                        job = self.job_queue.get(message_data) if self.job_queue else None
+                        if job and job.status not in (STATUS_QUEUED, STATUS_RUNNING):
+                            result = job.output or job.error or ''
+                            log_entries.append((f"任务 #{job.job_id} {STATUS_NAMES[job.status]}: {job.title} {result}",
+                                                'SUCCESS' if job.status == STATUS_DONE else 'WARNING'))
                     elif message_type == 'enable_button':
+                        self.cancel_token = None
+                        self.stop_btn.configure(state='disabled')
                         if message_data == 'perfect':
                             self.perfect_generate_btn.configure(state='normal')
                         elif message_data == 'novel':
@@ -1093,6 +1292,8 @@ class VRainDualGUI:
         except Exception as e:
             print(f"处理消息失败: {e}")
         
+        self.append_log(log_entries)
+        
         # 每100毫秒检查一次消息队列
         self.root.after(100, self.process_messages)
 
@@ -1101,6 +1302,7 @@ def main():
     """主函数"""
     root = tk.Tk()
     app = VRainDualGUI(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
     
     # 欢迎信息
     app.log_message(f"🎆 欢迎使用古籍刻本电子书制作工具 {VERSION}", 'SUCCESS')
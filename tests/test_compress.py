@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+vrainCompress往返测试
+
+用书籍01的排版配置生成一本小书（字体换成reportlab自带的Vera.ttf，不依赖fonts目录中的字体），
+像合并分片时一样写入目录，压缩后检查页数、每页提取的文字和目录与压缩前相同。
+"""
+
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from vrainAPI import render_book
+from vrainCompress import compress_pdf
+
+TEST_FONT = 'Vera.ttf'
+
+# 三个文本，每个文本另起一页，目录指向各文本的第一页
+TEXTS = ['\n'.join([f"Chapter {i}"] + [f"lorem ipsum dolor sit amet {j}, consectetur {i}." for j in range(40)])
+         for i in range(1, 4)]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """临时工作目录：canvas和db指向仓库，fonts中只有测试字体，books/t的book.cfg复制自书籍01"""
+    import reportlab
+
+    for name in ('canvas', 'db'):
+        (tmp_path / name).symlink_to(REPO / name)
+    (tmp_path / 'fonts').mkdir()
+    (tmp_path / 'fonts' / TEST_FONT).symlink_to(Path(reportlab.__file__).parent / 'fonts' / TEST_FONT)
+
+    book_dir = tmp_path / 'books' / 't'
+    (book_dir / 'text').mkdir(parents=True)
+    cfg = (REPO / 'books' / '01' / 'book.cfg').read_text(encoding='utf-8')
+    cfg = re.sub(r'(?m)^font1=.*$', f"font1={TEST_FONT}", cfg)
+    cfg = re.sub(r'(?m)^font([2-5])=.*$', r'font\1=', cfg)
+    (book_dir / 'book.cfg').write_text(cfg, encoding='utf-8')
+
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def add_outlines(path: Path, outlines):
+    """像merge_shards一样写入目录，outlines为(标题, 页序号)"""
+    reader = PdfReader(str(path))
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    for title, index in outlines:
+        writer.add_outline_item(title, index)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def snapshot(path: Path):
+    """页数、每页提取的文字和目录（标题与页序号）"""
+    reader = PdfReader(str(path))
+    texts = [page.extract_text() for page in reader.pages]
+    outlines = [(item.title, reader.get_destination_page_number(item)) for item in reader.outline]
+    return len(reader.pages), texts, outlines
+
+
+def test_compress_round_trip(workdir):
+    source = workdir / 'book.pdf'
+    output = workdir / 'book_已压缩.pdf'
+    render_book('t', texts=TEXTS, output=source)
+
+    pages = len(PdfReader(str(source)).pages)
+    assert pages > len(TEXTS) + 1
+    add_outlines(source, [('封面', 0), ('Chapter 1', 1), ('末页', pages - 1)])
+    before = snapshot(source)
+
+    stats = compress_pdf(source, output)
+    after = snapshot(output)
+
+    assert after[0] == before[0]
+    assert after[1] == before[1]
+    assert after[2] == before[2]
+    assert any(text.strip() for text in after[1])
+    assert stats['output_size'] <= stats['input_size']
@@ -4,13 +4,19 @@
 PDF插图工具 - 将图片插入到PDF文件的指定位置
 Python版本 by msyloveldx, 2025/08
 原作者: shanleiguang, 2024.1.5
+
+插图按输出分辨率预先缩放到图框大小并缓存在images/.cache/下；
+全部插图页绘制在同一个叠加文档中，相同图片在输出PDF中只嵌入一次。
 """
 
 import os
 import sys
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
@@ -18,11 +24,16 @@ from PyPDF2 import PdfReader, PdfWriter
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
+# 插图缩放缓存位于项目根目录的叠加模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vrainOverlay import DEFAULT_IMAGE_DPI, prepare_image, has_overlays
+
 class PDFImageInserter:
     """PDF插图工具类"""
     
-    def __init__(self, pdf_name: str):
+    def __init__(self, pdf_name: str, dpi: int = DEFAULT_IMAGE_DPI):
         self.pdf_name = pdf_name
+        self.dpi = dpi
         self.book_config = {}
         self.canvas_config = {}
         self.images_config = []
@@ -154,6 +165,9 @@ class PDFImageInserter:
         # 插入图片
         img_path = Path(f"images/{img_id}.jpg")
         if img_path.exists():
+            img_path = prepare_image(img_path, iw - 20,
+                                     dims['bg_height'] - dims['bg_top'] - dims['bg_bottom'] - 20,
+                                     self.dpi)
             c.drawImage(str(img_path), 
                        ix + 10, iy + 10, 
                        iw - 20, 
@@ -161,8 +175,8 @@ class PDFImageInserter:
         else:
             print(f"警告：图片文件 {img_path} 不存在")
     
-    def process_pdf(self):
-        """处理PDF文件"""
+    def process_pdf(self) -> Dict:
+        """处理PDF文件，返回处理结果"""
         pdf_path = Path(f"{self.pdf_name}.pdf")
         if not pdf_path.exists():
             raise FileNotFoundError(f"错误：PDF文件 {pdf_path} 不存在")
@@ -174,36 +188,38 @@ class PDFImageInserter:
         
         # 读取原PDF
         reader = PdfReader(str(pdf_path))
+        if has_overlays(reader):
+            print(f"警告：PDF文件 {pdf_path} 生成时已叠加印章和插图，跳过处理")
+            return {'status': 'overlaid', 'pages': len(reader.pages)}
         writer = PdfWriter()
         
-        # 处理每一页
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            
-            # 检查是否需要在这一页插入图片
-            page_images = [img for img in self.images_config if img[0] == page_num + 1]
-            
-            if page_images:
-                # 创建临时画布来添加图片
-                from io import BytesIO
-                from reportlab.pdfgen import canvas as pdf_canvas
-                
-                packet = BytesIO()
-                temp_canvas = pdf_canvas.Canvas(packet, 
-                                              pagesize=(dims['bg_width'], dims['bg_height']))
-                
-                # 在临时画布上添加图片
-                for pid, col_begin, col_end, img_id in page_images:
+        # 页码 -> 插图列表
+        images_by_page = {}
+        for img in self.images_config:
+            if 1 <= img[0] <= len(reader.pages):
+                images_by_page.setdefault(img[0], []).append(img)
+            else:
+                print(f"警告：页码 {img[0]} 超出PDF页数 {len(reader.pages)}，跳过")
+        
+        # 全部插图页绘制在同一个叠加文档中，相同图片只嵌入一次
+        overlay_pages = {}
+        if images_by_page:
+            packet = BytesIO()
+            temp_canvas = canvas.Canvas(packet, pagesize=(dims['bg_width'], dims['bg_height']))
+            for pid in sorted(images_by_page):
+                for _, col_begin, col_end, img_id in images_by_page[pid]:
                     self.insert_image(pid, col_begin, col_end, img_id, temp_canvas, dims)
-                
-                temp_canvas.save()
-                packet.seek(0)
-                
-                # 读取临时PDF并合并到原页面
-                temp_pdf = PdfReader(packet)
-                if temp_pdf.pages:
-                    page.merge_page(temp_pdf.pages[0])
-            
+                temp_canvas.showPage()
+                overlay_pages[pid] = len(overlay_pages)
+            temp_canvas.save()
+            packet.seek(0)
+            overlay = PdfReader(packet)
+        
+        # 处理每一页
+        for page_num, page in enumerate(reader.pages):
+            overlay_index = overlay_pages.get(page_num + 1)
+            if overlay_index is not None:
+                page.merge_page(overlay.pages[overlay_index])
             writer.add_page(page)
         
         # 保存结果
@@ -212,21 +228,60 @@ class PDFImageInserter:
             writer.write(output_file)
         
         print(f"已保存到 {output_path}")
+        return {'status': 'done', 'pages': len(reader.pages), 'inserted': len(overlay_pages)}
+
+def process_pdf_job(pdf_name: str, dpi: int = DEFAULT_IMAGE_DPI) -> Dict:
+    """处理单个PDF文件并计时（可在工作进程中执行），出错时不影响其他文件"""
+    start = time.time()
+    result = {'pdf': pdf_name, 'status': 'failed', 'pages': 0, 'inserted': 0}
+    try:
+        result.update(PDFImageInserter(pdf_name, dpi).process_pdf())
+    except Exception as e:
+        print(f"错误：处理PDF文件 '{pdf_name}' 失败: {e}")
+        result['error'] = str(e)
+    result['elapsed'] = time.time() - start
+    return result
+
+def process_pdfs(pdf_names: List[str], jobs: int = 1, dpi: int = DEFAULT_IMAGE_DPI) -> List[Dict]:
+    """处理多个PDF文件，jobs大于1时各PDF文件在进程池中并行处理"""
+    start = time.time()
+    jobs = max(1, min(jobs, len(pdf_names)))
+    if jobs == 1:
+        results = [process_pdf_job(pdf_name, dpi) for pdf_name in pdf_names]
+    else:
+        print(f"共 {len(pdf_names)} 个PDF文件，{jobs} 个进程并行处理")
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(process_pdf_job, pdf_names, [dpi] * len(pdf_names)))
+    
+    # 每个文件的耗时和汇总
+    print("处理结果：")
+    status_names = {'done': '完成', 'overlaid': '已叠加，跳过', 'failed': '失败'}
+    for result in results:
+        status = status_names[result['status']]
+        print(f"\t{result['pdf']}：{status}，{result['pages']}页，"
+              f"插图{result['inserted']}页，耗时{result['elapsed']:.2f}秒")
+    
+    done = sum(1 for r in results if r['status'] == 'done')
+    skipped = sum(1 for r in results if r['status'] == 'overlaid')
+    busy = sum(r['elapsed'] for r in results)
+    print(f"共 {len(results)} 个PDF文件：完成 {done} 个，跳过 {skipped} 个，失败 {len(results) - done - skipped} 个；"
+          f"总耗时{time.time() - start:.2f}秒（各文件耗时合计{busy:.2f}秒）")
+    return results
 
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='PDF插图工具')
-    parser.add_argument('-i', '--input', required=True, 
-                       help='输入PDF文件名（不含扩展名）')
+    parser.add_argument('-i', '--input', required=True, nargs='+',
+                       help='输入PDF文件名（不含扩展名），可指定多个')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                       help='并行处理的进程数，默认为CPU核数，1为逐个处理')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_IMAGE_DPI,
+                       help=f'插图预缩放的输出分辨率，0表示使用原图，默认{DEFAULT_IMAGE_DPI}')
     
     args = parser.parse_args()
     
-    try:
-        inserter = PDFImageInserter(args.input)
-        inserter.process_pdf()
-        
-    except Exception as e:
-        print(f"错误：{e}")
+    results = process_pdfs(args.input, args.jobs, args.dpi)
+    if any(r['status'] == 'failed' for r in results):
         sys.exit(1)
 
 if __name__ == '__main__':
@@ -4,38 +4,83 @@
 压缩某一目录下的文件名不是以'_已压缩'结尾的PDF文件
 Python版本 by msyloveldx, 2025/08
 原作者: shanleiguang, 2025.4
+
+支持多进程并行压缩；目录下的清单文件记录每个输入文件的哈希与对应压缩结果的哈希，
+重新生成但内容未变的PDF直接跳过，不再重复压缩。reportlab每次生成都会写入新的创建、修改时间和
+随机的文件ID，输入文件的哈希不计这几项，只比较内容。
 """
 
 import os
 import sys
+import time
 import argparse
-import subprocess
+import re
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Any, Optional
+
+# 压缩模块位于项目根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vrainCompress import DEFAULT_DPI, DEFAULT_JPEG_QUALITY
+from vrainCompress import compress_pdf as compress_pdf_file, format_stats
+from vrainSession import file_hash, load_manifest, save_manifest
+
+# 压缩清单文件名，保存在目标目录下
+MANIFEST_NAME = '.pdfcompress.json'
+# 每完成多少个文件保存一次清单，中断后可从清单继续
+MANIFEST_SAVE_INTERVAL = 20
+
+# 每次生成都不同的PDF字段：文档信息中的创建、修改时间，以及尾部的文件ID
+VOLATILE_PDF_FIELDS = re.compile(rb"(/(?:CreationDate|ModDate)\s*)\([^)]*\)|(/ID\s*)\[[^\]]*\]")
 
-def compress_pdf(input_path: Path, output_path: Path) -> bool:
-    """使用Ghostscript压缩PDF文件"""
+def pdf_content_hash(path: Path) -> str:
+    """计算PDF内容的SHA-256哈希，不计创建、修改时间和文件ID，内容相同的两次生成哈希相同"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    data = VOLATILE_PDF_FIELDS.sub(lambda m: (m.group(1) or m.group(2)) + b'-', data)
+    return hashlib.sha256(data).hexdigest()
+
+def compress_job(input_path: Path, output_path: Path, entry: Optional[Dict[str, Any]],
+                 dpi: int, quality: int) -> Dict[str, Any]:
+    """
+    压缩单个文件（在工作进程中执行），输入与清单记录一致且压缩结果完好时跳过
+    
+    Returns:
+        Dict[str, Any]: 处理结果，status为'done'、'skipped'或'failed'
+    """
+    start = time.time()
+    result = {'input': input_path.name, 'output': output_path.name, 'status': 'failed'}
     try:
-        cmd = [
-            'gs', '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.4',
-            '-dPDFSETTINGS=/screen', '-dNOPAUSE', '-dQUIET', '-dBATCH',
-            f'-sOutputFile={output_path}', str(input_path)
-        ]
+        input_hash = pdf_content_hash(input_path)
+        result['input_hash'] = input_hash
         
-        subprocess.run(cmd, check=True)
-        return True
+        if (entry and entry.get('input_hash') == input_hash and output_path.exists()
+                and file_hash(output_path) == entry.get('output_hash')):
+            result.update(status='skipped', output_hash=entry['output_hash'],
+                          elapsed=time.time() - start)
+            return result
         
-    except subprocess.CalledProcessError as e:
-        print(f"压缩失败: {e}")
-        return False
-    except FileNotFoundError:
-        print("错误：未找到Ghostscript，请先安装Ghostscript")
-        return False
+        stats = compress_pdf_file(input_path, output_path, dpi=dpi, jpeg_quality=quality)
+        result.update(status='done', stats=stats, output_hash=file_hash(output_path),
+                      elapsed=time.time() - start)
+    except Exception as e:
+        result.update(error=str(e), elapsed=time.time() - start)
+    return result
 
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='批量压缩PDF文件')
-    parser.add_argument('-d', '--directory', required=True, 
+    parser.add_argument('-d', '--directory', required=True,
                        help='目标目录路径')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI,
+                       help=f'图片降采样的目标分辨率，0表示不降采样，默认{DEFAULT_DPI}')
+    parser.add_argument('-q', '--quality', type=int, default=DEFAULT_JPEG_QUALITY,
+                       help=f'降采样后JPEG的编码质量，默认{DEFAULT_JPEG_QUALITY}')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                       help='并行压缩的进程数，默认为CPU核数')
+    parser.add_argument('--force', action='store_true',
+                       help='忽略压缩清单，全部重新压缩')
     
     args = parser.parse_args()
     
@@ -55,24 +100,75 @@ def main():
         print("未找到需要压缩的PDF文件")
         return
     
-    print(f"找到 {len(pdf_files)} 个PDF文件需要压缩")
+    jobs = max(1, min(args.jobs, len(pdf_files)))
+    print(f"找到 {len(pdf_files)} 个PDF文件需要压缩，{jobs} 个进程并行")
+    
+    # 压缩清单：输入文件名 -> {input_hash, output, output_hash}
+    manifest_path = target_dir / MANIFEST_NAME
+    manifest = {} if args.force else load_manifest(manifest_path, "压缩清单无法读取，将全部重新压缩")
+    start = time.time()
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    size_before = size_after = 0
     
-    # 压缩每个PDF文件
-    for pdf_file in pdf_files:
-        stem = pdf_file.stem
-        output_file = pdf_file.parent / f"{stem}_已压缩.pdf"
+    def finish(pdf_file: Path, result: Dict[str, Any]):
+        """记录单个文件的处理结果，成功或跳过时删除原文件"""
+        nonlocal size_before, size_after
+        status = result['status']
+        counts[status] += 1
         
-        print(f"压缩PDF文件'{output_file.name}'...", end='')
+        if status == 'failed':
+            print(f"压缩PDF文件'{result['output']}'...失败！{result.get('error', '')}")
+            return
         
-        if compress_pdf(pdf_file, output_file):
-            # 删除原文件
-            try:
-                pdf_file.unlink()
-                print("完成！")
-            except Exception as e:
-                print(f"警告：无法删除原文件 {pdf_file}: {e}")
+        manifest[result['input']] = {
+            'input_hash': result['input_hash'],
+            'output': result['output'],
+            'output_hash': result['output_hash'],
+        }
+        
+        if status == 'skipped':
+            print(f"压缩PDF文件'{result['output']}'...未变化，跳过")
         else:
-            print("失败！")
+            stats = result['stats']
+            size_before += stats['input_size']
+            size_after += stats['output_size']
+            print(f"压缩PDF文件'{result['output']}'...{format_stats(stats)}，完成！")
+            for warning in stats['warnings']:
+                print(f"\t警告：{warning}")
+        
+        # 删除原文件
+        try:
+            pdf_file.unlink()
+        except Exception as e:
+            print(f"警告：无法删除原文件 {pdf_file}: {e}")
+        
+        if sum(counts.values()) % MANIFEST_SAVE_INTERVAL == 0:
+            save_manifest(manifest_path, manifest)
+    
+    try:
+        if jobs == 1:
+            for pdf_file in pdf_files:
+                output_file = pdf_file.parent / f"{pdf_file.stem}_已压缩.pdf"
+                finish(pdf_file, compress_job(pdf_file, output_file, manifest.get(pdf_file.name),
+                                              args.dpi, args.quality))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {}
+                for pdf_file in pdf_files:
+                    output_file = pdf_file.parent / f"{pdf_file.stem}_已压缩.pdf"
+                    future = executor.submit(compress_job, pdf_file, output_file,
+                                             manifest.get(pdf_file.name), args.dpi, args.quality)
+                    futures[future] = pdf_file
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+    finally:
+        save_manifest(manifest_path, manifest)
+    
+    # 汇总
+    ratio = size_after / size_before * 100 if size_before else 100
+    print(f"共 {len(pdf_files)} 个文件：压缩 {counts['done']} 个，跳过 {counts['skipped']} 个，"
+          f"失败 {counts['failed']} 个；{size_before / 1024 / 1024:.1f}MB -> "
+          f"{size_after / 1024 / 1024:.1f}MB（{ratio:.0f}%），耗时{time.time() - start:.1f}秒")
 
 if __name__ == '__main__':
     main()
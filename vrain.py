@@ -11,6 +11,9 @@ import sys
 import re
 import argparse
 import math
+import time
+import contextlib
+import io
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional, Any
@@ -32,14 +35,28 @@ except ImportError as e:
     print("请运行: pip install reportlab pillow opencc-python-reimplemented")
     sys.exit(1)
 
+from vrainSession import EngineSession, file_stamp
+from vrainLog import Logger, DEBUG, INFO
+from vrainReport import BuildReport, report_path
+
 # 全局常量 - 完全对应Perl版本
 SOFTWARE = 'vRain'
 VERSION = 'v1.4'
 
+# 影响文本预处理结果的书籍配置项，变化时预处理文本缓存失效
+TEXT_CONFIG_KEYS = ('exp_replace_comma', 'exp_replace_number', 'exp_delete_comma',
+                    'if_nocomma', 'exp_nocomma', 'if_onlyperiod', 'exp_onlyperiod',
+                    'text_comma_nop', 'comment_comma_nop', 'if_book_vline', 'row_num')
+# 影响分页的排版配置项，变化时分页索引失效；标点偏移、字号、颜色等微调参数不影响分页
+LAYOUT_CONFIG_KEYS = ('text_comma_nop', 'comment_comma_nop', 'if_book_vline')
+
 class VRainPerfect:
     """完美复刻Perl版本的vRain工具"""
     
-    def __init__(self):
+    def __init__(self, session=None):
+        # 引擎会话（vrainSession），GUI传入长期持有的会话以便多次生成之间复用字体、文本等资源
+        self.session = session if session is not None else EngineSession()
+        
         # 程序参数
         self.opts = {}
         
@@ -65,13 +82,26 @@ class VRainPerfect:
         self.pos_r = []  # 对应Perl的@pos_r
         self.page_chars_num = 0  # 每页字符数
         
+        # 本次生成用到的各字体的字符支持情况，取自会话
+        self._font_coverage = {}
+        self._page_index = None
+        
+        # 后台压缩队列（由调用方创建，多本书或多卷共用），设置后-c压缩只提交不等待，单次生成时同步压缩
+        self.compress_queue = None
+        # 矢量背景表单名，未使用矢量背景时为None
+        self.bg_form = None
+        # PDF输出目标，None时写入books/<id>/下的PDF文件，也可以是BytesIO等文件对象（不压缩）
+        self.output = None
+        # 进度回调与取消令牌（vrainProgress），GUI等调用方设置
+        self.progress_callback = None
+        self.cancel_token = None
+        # 排版日志（vrainLog），按页批量输出；-v时输出每个字的字体
+        self.log = Logger()
+        # 构建报告（vrainReport），各阶段耗时和计数，生成后写入PDF旁的.report.json
+        self.report = BuildReport('perfect')
+        
         # 简繁转换
-        try:
-            self.s2t = opencc.OpenCC('s2t')
-            self.t2s = opencc.OpenCC('t2s')
-        except:
-            self.s2t = None
-            self.t2s = None
+        self.s2t, self.t2s = self.session.converters()
     
     def print_welcome(self):
         """打印欢迎信息 - 完全对应Perl版本"""
@@ -85,12 +115,23 @@ class VRainPerfect:
         help_text = f"""   ./{SOFTWARE}\t{VERSION}，兀雨古籍刻本直排电子书制作工具
 \t-h\t帮助信息
 \t-v\t显示更多信息
-\t-c\t压缩PDF（MacOS）
+\t-c\t压缩PDF（进程内流级压缩，无需Ghostscript）
 \t-z\t测试模式，仅输出指定页数，生成带test标识的PDF文件，用于调试参数
 \t-b\t书籍ID
 \t  \t书籍文本需保存在书籍ID的text目录下，多文本时采用001、002...不间断命名以确保顺序处理
 \t-f\t书籍文本的起始序号，注意不是文件名的数字编号，而是顺序排列的序号
 \t-t\t书籍文本的结束序号，注意不是文件名的数字编号，而是顺序排列的序号
+\t-r\t输出图片格式（png或webp），直接由排版结果渲染图片，不生成PDF
+\t-q\t图片质量（1-100，仅webp有效），默认90
+\t-j\t渲染图片或批量生成的并行进程数，默认为CPU核数
+\t-p\t预览模式，仅将第N页渲染为PNG图片（0为封面），用于快速调试排版参数
+\t--batch\t批量生成多本书，参数为书籍目录、书籍ID或清单文件，例如 --batch books/01 books/02
+\t  \t清单文件每行一本书：书籍目录或书籍ID [起始序号 [结束序号]]，未写范围时使用-f、-t
+\t--watch\t监视模式，文本、book.cfg、背景或字体保存后自动重新生成，可与-p同用只刷新预览图片
+\t--shard\t分片生成，参数为i/N，按总页数均分为N段只生成第i段，用于多台机器分别生成同一本书
+\t--merge\t合并books目录下-b、-f、-t对应的全部分片，生成完整的PDF
+\t--report\t打印构建报告汇总表（各阶段耗时和计数），报告总是写入PDF旁的.report.json
+\t--profile\t性能分析，在输出旁写入.pstats和折叠调用栈.collapsed.txt并打印热点函数；--profile sample为低开销的采样模式（只输出折叠调用栈）
 \t\t作者：GitHub@shanleiguang, 小红书@兀雨书屋，2025"""
         print(help_text)
     
@@ -104,14 +145,25 @@ class VRainPerfect:
         parser.add_argument('-b', type=str, help='书籍ID')
         parser.add_argument('-f', type=int, default=1, help='起始页')
         parser.add_argument('-t', type=int, default=1, help='结束页')
+        parser.add_argument('-r', type=str, choices=['png', 'webp'], help='输出图片格式')
+        parser.add_argument('-q', type=int, default=90, help='图片质量')
+        parser.add_argument('-j', type=int, help='并行进程数')
+        parser.add_argument('-p', type=int, help='预览页码')
+        parser.add_argument('--batch', nargs='+', help='批量生成的书籍或清单文件')
+        parser.add_argument('--watch', action='store_true', help='监视模式')
+        parser.add_argument('--shard', type=str, help='分片i/N')
+        parser.add_argument('--merge', action='store_true', help='合并分片')
+        parser.add_argument('--report', action='store_true', help='打印构建报告')
+        parser.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'sample'],
+                            help='性能分析模式')
         
         # 先检查是否有-h参数
         if '-h' in sys.argv:
             self.print_help()
             sys.exit(0)
         
-        # 检查是否有-b参数
-        if '-b' not in sys.argv:
+        # 检查是否有-b参数，批量模式不需要
+        if '-b' not in sys.argv and '--batch' not in sys.argv:
             print(f"错误：缺少必需参数 -b (书籍ID)")
             self.print_help()
             sys.exit(1)
@@ -125,7 +177,17 @@ class VRainPerfect:
             'z': args.z,
             'b': args.b,
             'f': args.f,
-            't': args.t
+            't': args.t,
+            'r': args.r,
+            'q': args.q,
+            'j': args.j,
+            'p': args.p,
+            'batch': args.batch,
+            'watch': args.watch,
+            'shard': args.shard,
+            'merge': args.merge,
+            'report': args.report,
+            'profile': args.profile
         }
     
     def load_zh_numbers(self):
@@ -320,14 +382,22 @@ class VRainPerfect:
         self.rh = rh
     
     def font_check(self, font_file, char):
-        """字体检查 - 对应Perl的font_check子程序"""
-        try:
-            font_path = f"fonts/{font_file}"
-            font = ImageFont.truetype(font_path, 40)
-            bbox = font.getbbox(char)
-            return bbox[2] > bbox[0] and bbox[3] > bbox[1]
-        except:
-            return False
+        """字体检查 - 对应Perl的font_check子程序，字体对象和检查结果均由会话缓存"""
+        coverage = self._font_coverage.get(font_file)
+        if coverage is None:
+            coverage = self.session.font_coverage(f"fonts/{font_file}")
+            self._font_coverage[font_file] = coverage
+        supported = coverage.get(char)
+        if supported is None:
+            self.report.count('font_probes')
+            try:
+                font = self.session.font_object(f"fonts/{font_file}", 40)
+                bbox = font.getbbox(char)
+                supported = bbox[2] > bbox[0] and bbox[3] > bbox[1]
+            except:
+                supported = False
+            coverage[char] = supported
+        return supported
     
     def get_font(self, char, font_list):
         """获取字体 - 完全对应Perl的get_font子程序"""
@@ -388,110 +458,121 @@ class VRainPerfect:
             if tfn.name.startswith('.'):
                 continue
             
-            dat = ""
-            with open(tfn, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    line = re.sub(r'\s', '', line)  # 去除所有空白字符
-                    
-                    # 标点符号替换 - 完全对应Perl版本
-                    exp_replace_comma = self.book.get('exp_replace_comma')
-                    if exp_replace_comma:
-                        for kv in exp_replace_comma.split('|'):
-                            if len(kv) >= 2:
-                                k, v = kv[0], kv[1]
-                                # 处理正则特殊字符
-                                if k in '.!?()[]':
-                                    k = '\\' + k
-                                line = re.sub(k, v, line)
-                    
-                    # 中文数字替换
-                    exp_replace_number = self.book.get('exp_replace_number')
-                    if exp_replace_number:
-                        for kv in exp_replace_number.split('|'):
-                            if len(kv) >= 2:
-                                k, v = kv[0], kv[1]
-                                line = re.sub(k, v, line)
-                    
-                    # 标点符号删除
-                    exp_delete_comma = self.book.get('exp_delete_comma')
-                    if exp_delete_comma:
-                        line = re.sub(exp_delete_comma, '', line)
-                    
-                    # 无标点模式
-                    if int(self.book.get('if_nocomma', 0)) == 1:
-                        exp_nocomma = self.book.get('exp_nocomma')
-                        if exp_nocomma:
-                            line = re.sub(exp_nocomma, '', line)
-                    
-                    # 标点符号归一化
-                    if int(self.book.get('if_onlyperiod', 0)) == 1:
-                        exp_onlyperiod = self.book.get('exp_onlyperiod')
-                        if exp_onlyperiod:
-                            line = re.sub(exp_onlyperiod, '。', line)
-                            line = re.sub(r'。+', '。', line)
-                            line = re.sub(r'^。', '', line)
-                    
-                    line = line.replace('@', ' ')  # @代表空格
-                    
-                    # 计算段落补齐空格 - 完全对应Perl版本的复杂逻辑
-                    tmpstr = line  # 保存原始文本
-                    rnum = 0  # 标注文本双排占用长度
-                    
-                    # 去除不占字符位的标点 - 完全对应Perl版本的逻辑
-                    text_comma_nop = self.book.get('text_comma_nop', '')
-                    comment_comma_nop = self.book.get('comment_comma_nop', '')
-                    comment_comma_nop_tmp = comment_comma_nop  # 保存原始值，对应Perl: my $comment_comma_nop_tmp = $comment_comma_nop;
-                    
-                    # 对应Perl: $text_comma_nop =~ s/\|//g; $comment_comma_nop =~ s/\|//g;
-                    text_comma_nop_clean = text_comma_nop.replace('|', '') if text_comma_nop else ''
-                    comment_comma_nop_clean = comment_comma_nop.replace('|', '') if comment_comma_nop else ''
-                    
-                    if text_comma_nop_clean:
-                        line = re.sub(f'[{re.escape(text_comma_nop_clean)}]', '', line)
-                    if comment_comma_nop_clean:
-                        line = re.sub(f'[{re.escape(comment_comma_nop_clean)}]', '', line)
-                    
-                    # 书名号处理
-                    if_book_vline = self.book.get('if_book_vline')
-                    if if_book_vline and int(if_book_vline) == 1:
-                        line = re.sub(r'《|》', '', line)
-                    
-                    # 计算标注文本占用的字符位 - 对应Perl的复杂正则处理
-                    for match in re.finditer(r'【(.*?)】', line):
-                        rdat = match.group(1)
-                        # 去除批注中不占字符位的标点 - 使用清理后的版本
-                        if comment_comma_nop_clean:
-                            rdat = re.sub(f'[{re.escape(comment_comma_nop_clean)}]', '', rdat)
-                        if if_book_vline and int(if_book_vline) == 1:
-                            rdat = re.sub(r'《|》', '', rdat)
-                        
-                        rchars_len = len(rdat)
-                        if rchars_len % 2 == 0:
-                            rnum += rchars_len // 2  # 偶数时
-                        else:
-                            rnum += rchars_len // 2 + 1  # 奇数时
-                    
-                    # 去除标注文字后的正文
-                    line = re.sub(r'【.*?】', '', line)
-                    
-                    chars_len = len(line)  # 正文字符数
-                    
-                    # 计算段落末尾需要补齐的空格数 - 完全对应Perl版本
-                    spaces_num = self.row_num - (chars_len + rnum) + ((chars_len + rnum) // self.row_num) * self.row_num
-                    
-                    dat += tmpstr
-                    if 0 < spaces_num < self.row_num:
-                        dat += ' ' * spaces_num
-            
+            # 每个文本文件的预处理结果单独缓存，修改一个文本时只重新处理该文本
+            key = (file_stamp(tfn), tuple(self.book.get(k) for k in TEXT_CONFIG_KEYS))
+            dat = self.session.cached('text', str(tfn), key, lambda: self.preprocess_text(tfn))
             dats.append(dat)
         
         print(f"{len(dats)-1}个文本文件")
         return dats, if_text000, if_text999
     
+    def preprocess_text(self, tfn):
+        """预处理一个文本文件"""
+        with open(tfn, 'r', encoding='utf-8') as f:
+            return self.preprocess_lines(f)
+    
+    def preprocess_lines(self, lines):
+        """预处理文本行 - 对应Perl版本文本加载循环的循环体：替换、删除标点并补齐段落末尾空格"""
+        dat = ""
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            
+            line = re.sub(r'\s', '', line)  # 去除所有空白字符
+            
+            # 标点符号替换 - 完全对应Perl版本
+            exp_replace_comma = self.book.get('exp_replace_comma')
+            if exp_replace_comma:
+                for kv in exp_replace_comma.split('|'):
+                    if len(kv) >= 2:
+                        k, v = kv[0], kv[1]
+                        # 处理正则特殊字符
+                        if k in '.!?()[]':
+                            k = '\\' + k
+                        line = re.sub(k, v, line)
+            
+            # 中文数字替换
+            exp_replace_number = self.book.get('exp_replace_number')
+            if exp_replace_number:
+                for kv in exp_replace_number.split('|'):
+                    if len(kv) >= 2:
+                        k, v = kv[0], kv[1]
+                        line = re.sub(k, v, line)
+            
+            # 标点符号删除
+            exp_delete_comma = self.book.get('exp_delete_comma')
+            if exp_delete_comma:
+                line = re.sub(exp_delete_comma, '', line)
+            
+            # 无标点模式
+            if int(self.book.get('if_nocomma', 0)) == 1:
+                exp_nocomma = self.book.get('exp_nocomma')
+                if exp_nocomma:
+                    line = re.sub(exp_nocomma, '', line)
+            
+            # 标点符号归一化
+            if int(self.book.get('if_onlyperiod', 0)) == 1:
+                exp_onlyperiod = self.book.get('exp_onlyperiod')
+                if exp_onlyperiod:
+                    line = re.sub(exp_onlyperiod, '。', line)
+                    line = re.sub(r'。+', '。', line)
+                    line = re.sub(r'^。', '', line)
+            
+            line = line.replace('@', ' ')  # @代表空格
+            
+            # 计算段落补齐空格 - 完全对应Perl版本的复杂逻辑
+            tmpstr = line  # 保存原始文本
+            rnum = 0  # 标注文本双排占用长度
+            
+            # 去除不占字符位的标点 - 完全对应Perl版本的逻辑
+            text_comma_nop = self.book.get('text_comma_nop', '')
+            comment_comma_nop = self.book.get('comment_comma_nop', '')
+            comment_comma_nop_tmp = comment_comma_nop  # 保存原始值，对应Perl: my $comment_comma_nop_tmp = $comment_comma_nop;
+            
+            # 对应Perl: $text_comma_nop =~ s/\|//g; $comment_comma_nop =~ s/\|//g;
+            text_comma_nop_clean = text_comma_nop.replace('|', '') if text_comma_nop else ''
+            comment_comma_nop_clean = comment_comma_nop.replace('|', '') if comment_comma_nop else ''
+            
+            if text_comma_nop_clean:
+                line = re.sub(f'[{re.escape(text_comma_nop_clean)}]', '', line)
+            if comment_comma_nop_clean:
+                line = re.sub(f'[{re.escape(comment_comma_nop_clean)}]', '', line)
+            
+            # 书名号处理
+            if_book_vline = self.book.get('if_book_vline')
+            if if_book_vline and int(if_book_vline) == 1:
+                line = re.sub(r'《|》', '', line)
+            
+            # 计算标注文本占用的字符位 - 对应Perl的复杂正则处理
+            for match in re.finditer(r'【(.*?)】', line):
+                rdat = match.group(1)
+                # 去除批注中不占字符位的标点 - 使用清理后的版本
+                if comment_comma_nop_clean:
+                    rdat = re.sub(f'[{re.escape(comment_comma_nop_clean)}]', '', rdat)
+                if if_book_vline and int(if_book_vline) == 1:
+                    rdat = re.sub(r'《|》', '', rdat)
+                
+                rchars_len = len(rdat)
+                if rchars_len % 2 == 0:
+                    rnum += rchars_len // 2  # 偶数时
+                else:
+                    rnum += rchars_len // 2 + 1  # 奇数时
+            
+            # 去除标注文字后的正文
+            line = re.sub(r'【.*?】', '', line)
+            
+            chars_len = len(line)  # 正文字符数
+            
+            # 计算段落末尾需要补齐的空格数 - 完全对应Perl版本
+            spaces_num = self.row_num - (chars_len + rnum) + ((chars_len + rnum) // self.row_num) * self.row_num
+            
+            dat += tmpstr
+            if 0 < spaces_num < self.row_num:
+                dat += ' ' * spaces_num
+    
+        return dat
+    
     def create_pdf(self, book_id, from_page, to_page, dats, if_text000, if_text999):
         """创建PDF - 完全对应Perl版本的PDF生成逻辑"""
         try:
@@ -509,41 +590,219 @@ class VRainPerfect:
         canvas_id = self.book.get('canvas_id')
         
         # 创建PDF文档 - 对应Perl的PDF::Builder->new
-        pdf_file = f"books/{book_id}/《{self.book.get('title', '')}》文本{from_page}至{to_page}"
+        pdf_name, pdf_file = self.pdf_path(book_id, from_page, to_page)
+        
+        # 创建reportlab canvas，图片输出模式下只记录绘制操作
+        raster_format = self.opts.get('r')
+        if raster_format:
+            from vrainRaster import RecordingCanvas
+            c = RecordingCanvas(pdf_file, pagesize=(canvas_width, canvas_height))
+        else:
+            target = self.output if self.output is not None else pdf_file
+            c = reportlab_canvas.Canvas(target, pagesize=(canvas_width, canvas_height))
+        
+        # 矢量背景 - 图片输出模式下仍使用背景图
+        self.bg_form = None if raster_format else self.load_vector_canvas(c, canvas_id)
+        
+        # 印章和插图 - 直接读取yins.cfg和images.cfg，每页结束前叠加到该页
+        overlays = self.load_overlays(book_id, pdf_name)
+        if overlays:
+            overlays.attach(c)
+        
+        # 进度报告 - 每排完一页报告一次，并检查是否已取消
+        from vrainProgress import ProgressReporter
+        reporter = ProgressReporter(self.progress_callback, self.cancel_token, raster=bool(raster_format))
+        reporter.set_total(self.estimate_pages(dats))
+        reporter.attach(c)
+        
+        # 排版日志每页输出一次
+        self.log.set_level(DEBUG if self.opts.get('v') else INFO)
+        self.log.attach(c)
+        
+        # 构建报告统计绘制字数、页数和reportlab绘制耗时
+        self.report.attach(c)
+        
+        # 注册字体
+        with self.report.stage('fonts'):
+            self.register_fonts()
+        
+        # PDF元数据 - 完全对应Perl版本
+        self.set_metadata(c)
+        
+        # 添加封面 - 对应Perl版本的封面处理
+        with self.report.stage('cover'):
+            self.add_cover(c, book_id, canvas_id, canvas_width, canvas_height)
+        
+        # 排版全部文本
+        try:
+            with self.report.stage('layout'):
+                outlines = self.layout_texts(c, book_id, from_page, to_page, dats, if_text000, if_text999)
+        finally:
+            self.log.flush()
+        
+        # 保存PDF
+        # 处理PDF目录 - 完全对应Perl版本的outline处理
+        title_directory = self.book.get('title_directory')
+        if title_directory and int(title_directory) == 1:
+            # 对应Perl: my %outlines_tmp; foreach my $ok (keys %outlines) { $outlines_tmp{$outlines{$ok}} = $ok; }
+            outlines_tmp = {}
+            for ok, page_num in outlines.items():
+                outlines_tmp[page_num] = ok
+            
+            # 对应Perl: my $otlines = $vpdf->outline();
+            # reportlab不支持直接的outline操作，但我们可以打印目录信息
+            for otpid in sorted(outlines_tmp.keys()):
+                ottitle = outlines_tmp[otpid]
+                print(f"\t{ottitle} -> {otpid}")
+                # 注意：reportlab不支持PDF书签，这里只能打印目录信息
+        
+        reporter.set_stage('save')
+        with self.report.stage('save'):
+            c.save()
+        
+        if overlays:
+            page_warning = overlays.check_pages(c.getPageNumber() - 1)
+            for warning in overlays.warnings + ([page_warning] if page_warning else []):
+                print(f"警告：{warning}")
+        
+        if raster_format:
+            reporter.set_stage('render')
+            with self.report.stage('render'):
+                out_dir = self.render_raster(c, pdf_file, raster_format, progress=reporter.page_rendered)
+            reporter.finish()
+            return out_dir
+        
+        if self.output is not None:
+            print(f"生成PDF'{pdf_name}'...完成！")
+            reporter.finish()
+            return self.output
+        
+        print(f"生成PDF文件'{pdf_file}'...完成！")
+        
+        # PDF压缩，报告和返回值指向压缩后的文件（原文件已删除）
+        if self.opts.get('c'):
+            reporter.set_stage('compress')
+            pdf_file = self.compress_pdf(pdf_file) or pdf_file
+        
+        reporter.finish()
+        return pdf_file
+    
+    def pdf_path(self, book_id, from_page, to_page):
+        """PDF名称和文件路径，测试模式带test标识"""
+        pdf_name = f"《{self.book.get('title', '')}》文本{from_page}至{to_page}"
+        pdf_file = f"books/{book_id}/{pdf_name}"
         if self.opts.get('z'):
             pdf_file += '_test'
         pdf_file += '.pdf'
-        
-        # 创建reportlab canvas
-        c = reportlab_canvas.Canvas(pdf_file, pagesize=(canvas_width, canvas_height))
-        
-        # 注册字体 - 对应Perl的ttfont注册
+        return pdf_name, pdf_file
+    
+    def register_fonts(self):
+        """注册字体 - 对应Perl的ttfont注册，字体文件未变化时复用会话中已注册的字体"""
         for font_file in self.fns:
             try:
                 font_path = f"fonts/{font_file}"
-                font_name = font_file.replace('.ttf', '').replace('.otf', '')
-                pdfmetrics.registerFont(TTFont(font_name, font_path))
+                font_name = self.get_font_name(font_file)
+                self.session.register_font(font_name, font_path)
                 self.vfonts[font_file] = font_name
             except Exception as e:
                 print(f"字体注册失败: {font_file} - {e}")
+    
+    def pdf_metadata(self):
+        """PDF元数据 - 完全对应Perl版本"""
+        return {
+            'Title': self.book.get('title', ''),
+            'Author': self.book.get('author', ''),
+            'Creator': self.canvas_config.get('logo_text', ''),
+            'Producer': f"{SOFTWARE}{VERSION}，古籍刻本直排电子书制作工具",
+        }
+    
+    def set_metadata(self, c):
+        """写入PDF元数据"""
+        metadata = self.pdf_metadata()
+        c.setTitle(metadata['Title'])
+        c.setAuthor(metadata['Author'])
+        c.setCreator(metadata['Creator'])
+        c.setProducer(metadata['Producer'])
+    
+    def estimate_pages(self, dats):
+        """预计总页数 - 封面加各文本按每页字数估算，用于显示进度"""
+        pages = 1 + sum(math.ceil(len(dat) / self.page_chars_num) for dat in dats[1:] if dat)
+        if self.opts.get('z'):
+            pages = min(pages, self.opts['z'] + 1)
+        return pages
+    
+    def load_vector_canvas(self, c, canvas_id):
+        """矢量背景 - book.cfg中canvas_vector=1时，按背景图配置把版框、界行、鱼尾定义为PDF表单"""
+        if not int(self.book.get('canvas_vector', 0)):
+            return None
         
-        # PDF元数据 - 完全对应Perl版本
+        print(f"使用矢量背景'canvas/{canvas_id}.cfg'...")
+        return self.session.canvas_generator(canvas_id, 'canvas').create_form(c)
+    
+    def get_background_image(self, canvas_id):
+        """背景图 - book.cfg中设置canvas_preset（screen、ebook、print）时使用按预设重采样的缓存背景图"""
+        bg_image = f"canvas/{canvas_id}.jpg"
+        preset = self.book.get('canvas_preset')
+        if not preset:
+            return bg_image
+        
+        from vrainBackground import DEFAULT_CANVAS_DPI
+        
+        canvas_dpi = float(self.canvas_config.get('canvas_dpi', DEFAULT_CANVAS_DPI))
+        try:
+            return str(self.session.background(bg_image, self.canvas_width, self.canvas_height, preset, canvas_dpi))
+        except ValueError as e:
+            print(f"错误：{e}")
+            sys.exit(1)
+    
+    def draw_background(self, c, bg_image, canvas_width, canvas_height):
+        """绘制背景 - 矢量背景时引用PDF表单，否则嵌入背景图"""
+        if self.bg_form:
+            c.doForm(self.bg_form)
+        elif Path(bg_image).exists():
+            c.drawImage(bg_image, 0, 0, width=canvas_width, height=canvas_height)
+    
+    def load_overlays(self, book_id, pdf_name):
+        """读取印章（yins.cfg）和插图（images.cfg）配置，与addyins.py、insertimg.py使用相同的尺寸计算"""
+        from vrainOverlay import PageOverlays
+        
+        dims = PageOverlays.calculate_dimensions(self.canvas_config, self.row_num)
+        overlays = PageOverlays(f"books/{book_id}", dims, (pdf_name, f"{pdf_name}_已压缩"))
+        if overlays:
+            print(f"读取印章和插图配置...{overlays.summary()}")
+        return overlays
+    
+    def get_font_name(self, font_file):
+        """字体文件对应的注册名"""
+        return font_file.replace('.ttf', '').replace('.otf', '')
+    
+    def get_title_chars(self, tid, dats, if_text000, if_text999):
+        """版心标题字符 - 对应Perl版本的标题处理"""
         title = self.book.get('title', '')
-        author = self.book.get('author', '')
-        logo_text = self.canvas_config.get('logo_text', '')
+        title_postfix = self.book.get('title_postfix')
+        if title_postfix:
+            cid = tid - 1 if if_text000 else tid
+            tpost = title_postfix.replace('X', self.zhnums.get(cid, str(cid)))
+            if cid == 0:
+                tpost = '序'
+            if if_text999 and tid == len(dats) - 1:
+                tpost = '附'
+            return list(title + tpost)
+        return list(title)
+    
+    def layout_texts(self, c, book_id, from_page, to_page, dats, if_text000, if_text999, start_pid=0):
+        """排版全部文本 - 对应Perl版本的foreach主循环，返回目录（标题 -> 页码）
         
-        c.setTitle(title)
-        c.setAuthor(author)
-        c.setCreator(logo_text)
-        c.setProducer(f"{SOFTWARE}{VERSION}，古籍刻本直排电子书制作工具")
+        start_pid为第from_page个文本之前已有的正文页数，监视模式只重新排版修改的文本及之后的页时使用。
+        """
+        canvas_width = int(self.canvas_config.get('canvas_width', 2480))
+        canvas_height = int(self.canvas_config.get('canvas_height', 1860))
+        canvas_id = self.book.get('canvas_id')
         
         outlines = {}  # 目录
         
-        # 添加封面 - 对应Perl版本的封面处理
-        self.add_cover(c, book_id, canvas_id, canvas_width, canvas_height)
-        
         # 处理每个文本 - 完全对应Perl版本的主循环
-        pid = 0  # 页码，从封面后开始
+        pid = start_pid  # 页码，从封面后开始
         pcnt = 0  # 每页写入文字的当前标准字位指针
         
         # 处理所有文本数据 - 对应Perl版本的foreach循环
@@ -553,7 +812,7 @@ class VRainPerfect:
             if self.opts.get('z') and pid >= self.opts['z']:
                 break
             
-            print(f"读取'books/{book_id}/text/'目录下第 {tid} 个文本文件...")
+            self.log.info("读取'books/%s/text/'目录下第 %d 个文本文件...", book_id, tid)
             
             if tid >= len(dats):
                 break
@@ -563,32 +822,21 @@ class VRainPerfect:
             rchars = []  # 标注文本字符
             
             # 标题处理 - 对应Perl版本
-            title_postfix = self.book.get('title_postfix')
-            if title_postfix:
-                cid = tid - 1 if if_text000 else tid
-                tpost = title_postfix.replace('X', self.zhnums.get(cid, str(cid)))
-                if cid == 0:
-                    tpost = '序'
-                if if_text999 and tid == len(dats) - 1:
-                    tpost = '附'
-                tpchars = list(title + tpost)
-            else:
-                tpchars = list(title)
+            tpchars = self.get_title_chars(tid, dats, if_text000, if_text999)
             
             tptitle = ''.join(tpchars)
             if tptitle not in outlines:
                 outlines[tptitle] = pid + 2  # 目录页码
             
-            print(f"创建新PDF页[{pid}]...")
+            self.log.info("创建新PDF页[%d]...", pid)
             
             # 对应Perl版本的逻辑：每个文本文件都创建新页面
             # 第一个文本也要创建新页面，因为封面已经占用了第一页
             c.showPage()  # 为当前文本创建新页面
             
             # 添加背景图
-            bg_image = f"canvas/{canvas_id}.jpg"
-            if Path(bg_image).exists():
-                c.drawImage(bg_image, 0, 0, width=canvas_width, height=canvas_height)
+            bg_image = self.get_background_image(canvas_id)
+            self.draw_background(c, bg_image, canvas_width, canvas_height)
             
             # 添加标题
             self.add_page_title(c, tpchars)
@@ -597,32 +845,10 @@ class VRainPerfect:
             # 这里是核心：处理字符直到所有字符处理完，期间会创建多个页面
             pid, pcnt = self.process_text_layout_complete(c, chars, rchars, pcnt, pid, 
                                                         canvas_width, canvas_height, 
-                                                        tpchars, bg_image, canvas_id)
+                                                        tpchars, bg_image, canvas_id,
+                                                        tid=tid)
         
-        # 保存PDF
-        # 处理PDF目录 - 完全对应Perl版本的outline处理
-        title_directory = self.book.get('title_directory')
-        if title_directory and int(title_directory) == 1:
-            # 对应Perl: my %outlines_tmp; foreach my $ok (keys %outlines) { $outlines_tmp{$outlines{$ok}} = $ok; }
-            outlines_tmp = {}
-            for ok, page_num in outlines.items():
-                outlines_tmp[page_num] = ok
-            
-            # 对应Perl: my $otlines = $vpdf->outline();
-            # reportlab不支持直接的outline操作，但我们可以打印目录信息
-            for otpid in sorted(outlines_tmp.keys()):
-                ottitle = outlines_tmp[otpid]
-                print(f"\t{ottitle} -> {otpid}")
-                # 注意：reportlab不支持PDF书签，这里只能打印目录信息
-        
-        c.save()
-        print(f"生成PDF文件'{pdf_file}'...完成！")
-        
-        # PDF压缩
-        if self.opts.get('c'):
-            self.compress_pdf(pdf_file)
-        
-        return pdf_file
+        return outlines
     
     def add_cover(self, c, book_id, canvas_id, canvas_width, canvas_height):
         """添加封面 - 完全对应Perl版本的封面处理逻辑"""
@@ -789,12 +1015,26 @@ class VRainPerfect:
                 py = pager_y - pager_font_size * i * title_ydis
                 c.drawString(px, py, char)
     
-    def process_text_layout_complete(self, c, chars, rchars, pcnt, pid, canvas_width, canvas_height, tpchars, bg_image, canvas_id):
-        """完整的文字排版处理 - 完全对应Perl版本的while(1)循环逻辑"""
+    def process_text_layout_complete(self, c, chars, rchars, pcnt, pid, canvas_width, canvas_height, tpchars, bg_image, canvas_id,
+                                     tid=None, state=None, stop_pid=None):
+        """完整的文字排版处理 - 完全对应Perl版本的while(1)循环逻辑
+        
+        tid/state/stop_pid供预览模式使用：state为从页首恢复的(正文书名号标记, 批注书名号标记, 上一字符位置)，
+        stop_pid指定排到第几页为止（缺省时沿用-z测试模式）。记录分页索引时，每个页首的排版状态存入self._page_index。
+        """
         # 初始化变量
         flag_tbook = 0  # 正文书名号标记
         flag_rbook = 0  # 批注书名号标记
         last = [0, 0]   # 上一字符位置
+        if state:
+            flag_tbook, flag_rbook, last = state[0], state[1], list(state[2])
+        
+        if stop_pid is None:
+            stop_pid = self.opts.get('z')
+        
+        # 记录本页页首状态（第pid+1页），正文只从头部取字，记剩余字数即可
+        if self._page_index is not None:
+            self._page_index[pid + 1] = (tid, len(chars), list(rchars), flag_tbook, flag_rbook, list(last))
         
         # 获取配置参数 - 完全对应Perl版本的处理逻辑
         text_comma_nop = self.book.get('text_comma_nop', '')
@@ -841,7 +1081,7 @@ class VRainPerfect:
         # 主循环 - 完全对应Perl版本的while(1)逻辑
         while True:
             # 检查测试模式 - 在循环开始时检查，对应Perl: last if(defined $opts{'z'} and $pid == $opts{'z'});
-            if self.opts.get('z') and pid == self.opts['z']:
+            if stop_pid and pid == stop_pid:
                 break
                 
             # 核心跳转机制 - 对应Perl的RCHARS标签
@@ -854,21 +1094,23 @@ class VRainPerfect:
                 self.add_page_number(c, pid)
                 
                 # 测试模式检查 - 对应Perl: last if(defined $opts{'z'} and $pid == $opts{'z'});
-                if self.opts.get('z') and pid == self.opts['z']:
+                if stop_pid and pid == stop_pid:
                     break
                 
                 if not chars:  # 所有字符处理完时退出while循环
                     break
                 
-                print(f"创建新PDF页[{pid}]...")
+                self.log.info("创建新PDF页[%d]...", pid)
                 c.showPage()  # 新页
                 
                 # 添加背景图
-                if Path(bg_image).exists():
-                    c.drawImage(bg_image, 0, 0, width=canvas_width, height=canvas_height)
+                self.draw_background(c, bg_image, canvas_width, canvas_height)
                 
                 # 添加标题
                 self.add_page_title(c, tpchars)
+                
+                if self._page_index is not None:
+                    self._page_index[pid + 1] = (tid, len(chars), list(rchars), flag_tbook, flag_rbook, list(last))
             
             # 优先处理批注文字 - 完全对应Perl的RCHARS标签逻辑
             if rchars:
@@ -929,10 +1171,14 @@ class VRainPerfect:
                         if try_char:
                             rc = try_char
                             fn = self.cfns[0] if self.cfns else None
+                            self.report.count('st_conversions')
                     
                     if not fn:
                         rc = '□'
                         fn = self.get_font(rc, self.cfns)
+                        self.report.count('missing_glyphs')
+                    elif fn != self.cfns[0]:
+                        self.report.count('fallback_fonts')
                     
                     if fn and fn in self.vfonts:
                         font_name = self.vfonts[fn]
@@ -940,8 +1186,8 @@ class VRainPerfect:
                         fcolor = comment_font_color
                         fdegrees = self.fonts[fn][2]  # 对应Perl: $fonts{$fn}->[2]
                         
-                        if self.opts.get('v'):
-                            print(f"\t[{pid}/{pcnt}] {rc} -> {fn}")
+                        if self.log.debug_enabled:
+                            self.log.debug("\t[%d/%s] %s -> %s", pid, pcnt, rc, fn)
                         
                         # 不占字符位的标点 - 完全对应Perl版本
                         if comment_comma_nop and rc in comment_comma_nop:  # 对应Perl: if($comment_comma_nop =~ m/$rc/)
@@ -956,8 +1202,8 @@ class VRainPerfect:
                             if not r_pos:
                                 # 对应Perl: if(not $rpref) { unshift @rchars, $rc; goto RCHARS; }
                                 # 没有更多位置了，这个字符处理失败，停止当前批注处理
-                                if self.opts.get('v'):
-                                    print(f"\t[{pid}/{pcnt}] 批注位置不足，跳过字符: {rc}")
+                                if self.log.debug_enabled:
+                                    self.log.debug("\t[%d/%s] 批注位置不足，跳过字符: %s", pid, pcnt, rc)
                                 break  # 跳出批注处理循环，而不是重新插入字符导致无限循环
                             
                             rpref = r_pos.pop(0)
@@ -968,8 +1214,8 @@ class VRainPerfect:
                                 fy += (self.rh - fsize) / 4      # 对应Perl: $fy+= ($rh-$fsize)/4;
                             else:
                                 # 如果 rpref 为 None，跳过这个字符
-                                if self.opts.get('v'):
-                                    print(f"\t[{pid}/{pcnt}] 批注位置为空，跳过字符: {rc}")
+                                if self.log.debug_enabled:
+                                    self.log.debug("\t[%d/%s] 批注位置为空，跳过字符: %s", pid, pcnt, rc)
                                 break
                             
                             # 90度旋转的标点 - 完全对应Perl版本
@@ -1070,6 +1316,7 @@ class VRainPerfect:
             
             # 批注处理 - 【】标记，对应Perl的 goto RCHARS 逻辑
             elif char == '【':  # 批注开始
+                self.report.count('comment_blocks')
                 # 提取批注内容
                 rdat = ''
                 while chars:
@@ -1096,10 +1343,14 @@ class VRainPerfect:
                         if try_char:
                             char = try_char
                             fn = self.tfns[0] if self.tfns else None
+                            self.report.count('st_conversions')
                     
                     if not fn:
                         char = '□'
                         fn = self.get_font(char, self.tfns)
+                        self.report.count('missing_glyphs')
+                    elif fn != self.tfns[0]:
+                        self.report.count('fallback_fonts')
                     
                     if fn and fn in self.vfonts:
                         font_name = self.vfonts[fn]
@@ -1109,8 +1360,8 @@ class VRainPerfect:
                         
                         fx, fy = self.pos_l[int(pcnt)]  # 确保索引是整数
                         
-                        if self.opts.get('v'):
-                            print(f"[{pid}/{pcnt}] {char} -> {fn}")
+                        if self.log.debug_enabled:
+                            self.log.debug("[%d/%s] %s -> %s", pid, pcnt, char, fn)
                         
                         # 不占字符位的标点
                         if char in text_comma_nop:
@@ -1180,37 +1431,191 @@ class VRainPerfect:
         
         return pid, pcnt
     
-    def compress_pdf(self, pdf_file):
-        """压缩PDF - 对应Perl版本"""
-        import platform
+    def render_raster(self, c, pdf_file, raster_format, progress=None):
+        """将记录的页面渲染为图片 - 多进程并行，不经过PDF，每渲染完一页调用progress(已完成页数)"""
+        from vrainRaster import render_pages
+        
+        out_dir = pdf_file[:-len('.pdf')] + f"_{raster_format}"
+        font_paths = {self.vfonts[fn]: f"fonts/{fn}" for fn in self.fns if fn in self.vfonts}
+        
+        print(f"渲染{len(c.pages)}页图片到'{out_dir}'...", end='')
+        render_pages(c.pages, font_paths, c._pagesize, out_dir,
+                     fmt=raster_format, quality=self.opts.get('q') or 90,
+                     workers=self.opts.get('j'), progress=progress)
+        print("完成！")
+        return out_dir
+    
+    def prepare_book(self, book_id):
+        """重新读取书籍与背景图配置、字体、文字坐标 - 预览前调用，使修改后的排版参数即时生效"""
+        self.book = {}
+        self.canvas_config = {}
+        self.fonts = {}
+        self.fns = []
+        self.tfns = []
+        self.cfns = []
+        self._font_coverage = {}
+        
+        self.load_book_config(book_id)
+        self.validate_config()
+        self.setup_fonts()
+        self.load_canvas_config()
+        self.calculate_positions()
+        
+        # 预览只需字体名与字体文件的对应关系，无需向reportlab注册字体
+        self.vfonts = {fn: self.get_font_name(fn) for fn in self.fns}
+    
+    def get_texts_key(self, book_id):
+        """预处理文本的缓存键：文本文件（文件名、修改时间、大小）及相关配置项"""
+        text_dir = Path(f"books/{book_id}/text")
+        files = []
+        for tfn in sorted(text_dir.glob("*.txt"), key=lambda x: x.name):
+            st = tfn.stat()
+            files.append((tfn.name, st.st_mtime_ns, st.st_size))
+        return (book_id, tuple(files), tuple(self.book.get(k) for k in TEXT_CONFIG_KEYS))
+    
+    def load_texts_cached(self, book_id, from_page, to_page):
+        """加载文本 - 文本文件和预处理配置未变化时复用会话中上次的结果"""
+        return self.session.cached('texts', book_id, self.get_texts_key(book_id),
+                                   lambda: self.load_texts(book_id, from_page, to_page))
+    
+    def build_page_index(self, book_id, from_page, to_page, dats, if_text000, if_text999):
+        """分页索引 - 预排版一遍（不记录绘制操作），得到每页页首的排版状态，结果缓存"""
+        from vrainRaster import RecordingCanvas
         
-        if platform.system() == 'Darwin':  # macOS
-            input_file = pdf_file
-            output_file = pdf_file.replace('.pdf', '_已压缩.pdf')
+        key = (self.get_texts_key(book_id), from_page, to_page, self.page_chars_num, self.row_num,
+               tuple(self.book.get(k) for k in LAYOUT_CONFIG_KEYS), self.opts.get('z'))
+        
+        def build():
+            c = RecordingCanvas(pagesize=(self.canvas_width, self.canvas_height), keep_ops=False)
+            self._page_index = {}
+            try:
+                with contextlib.redirect_stdout(io.StringIO()), self.log.quiet():
+                    self.layout_texts(c, book_id, from_page, to_page, dats, if_text000, if_text999)
+                return self._page_index
+            finally:
+                self._page_index = None
+        
+        return self.session.cached('page_index', book_id, key, build)
+    
+    def preview_page(self, book_id, page, from_page=1, to_page=1, scale=1.0):
+        """预览单页 - 只排版并渲染第page页（0为封面），返回PNG图片数据
+        
+        每次调用都重新读取配置；字体字符支持情况、预处理文本、分页索引和渲染器均缓存复用，
+        调整标点偏移、字号、颜色等参数后重复预览只需排版和渲染这一页。
+        页码超出范围时抛出ValueError，不退出进程，供嵌入的调用方处理。
+        """
+        from vrainRaster import RecordingCanvas, RasterRenderer, encode_image
+        
+        self.prepare_book(book_id)
+        canvas_width = self.canvas_width
+        canvas_height = self.canvas_height
+        canvas_id = self.book.get('canvas_id')
+        bg_image = self.get_background_image(canvas_id)
+        
+        c = RecordingCanvas(pagesize=(canvas_width, canvas_height))
+        if page == 0:
+            self.add_cover(c, book_id, canvas_id, canvas_width, canvas_height)
+        else:
+            dats, if_text000, if_text999 = self.load_texts_cached(book_id, from_page, to_page)
+            index = self.build_page_index(book_id, from_page, to_page, dats, if_text000, if_text999)
+            if page not in index:
+                raise ValueError(f"页码{page}超出范围，文本{from_page}至{to_page}共{len(index)}页！")
             
-            print(f"压缩PDF文件'{output_file}'...")
-            import subprocess
+            # 从页首状态恢复排版，排满该页即停止
+            tid, remain, rchars, flag_tbook, flag_rbook, last = index[page]
+            chars = list(dats[tid])
+            chars = chars[len(chars) - remain:]
+            tpchars = self.get_title_chars(tid, dats, if_text000, if_text999)
             
-            cmd = [
-                'gs', '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.4',
-                '-dPDFSETTINGS=/screen', '-dNOPAUSE', '-dQUIET', '-dBATCH',
-                f'-sOutputFile={output_file}', input_file
-            ]
+            if Path(bg_image).exists():
+                c.drawImage(bg_image, 0, 0, width=canvas_width, height=canvas_height)
+            self.add_page_title(c, tpchars)
             
-            try:
-                subprocess.run(cmd, check=True)
-                os.remove(input_file)
-                print("完成！")
-            except subprocess.CalledProcessError:
-                print("PDF压缩失败，请确保已安装Ghostscript")
-        else:
-            print("建议：使用'-c'参数对PDF文件进行压缩！")
+            with contextlib.redirect_stdout(io.StringIO()), self.log.quiet():
+                self.process_text_layout_complete(c, chars, list(rchars), 0, page - 1,
+                                                  canvas_width, canvas_height,
+                                                  tpchars, bg_image, canvas_id,
+                                                  tid=tid, state=(flag_tbook, flag_rbook, last),
+                                                  stop_pid=page)
+        
+        # 印章和插图，第page页对应PDF第page+1页
+        overlays = self.load_overlays(book_id, f"《{self.book.get('title', '')}》文本{from_page}至{to_page}")
+        overlays.draw(c, page + 1)
+        c.showPage()
+        
+        # 渲染器缓存了字体和缩放后的背景图，存在会话中，背景图更新时重建
+        font_paths = {self.vfonts[fn]: f"fonts/{fn}" for fn in self.fns}
+        renderer_key = (tuple(sorted(font_paths.items())), (canvas_width, canvas_height), scale,
+                        file_stamp(bg_image))
+        renderer = self.session.cached('preview_renderer', 'renderer', renderer_key,
+                                       lambda: RasterRenderer(font_paths, (canvas_width, canvas_height), scale))
+        
+        img = renderer.render_page(c.pages[-1])
+        return encode_image(img, 'png')
+    
+    def run_preview(self, book_id, from_page, to_page, page):
+        """预览模式 - 将单页渲染结果保存为PNG图片"""
+        start = time.time()
+        try:
+            data = self.preview_page(book_id, page, from_page, to_page)
+        except ValueError as e:
+            print(f"错误：{e}")
+            sys.exit(1)
+        
+        png_file = f"books/{book_id}/《{self.book.get('title', '')}》预览第{page}页.png"
+        with open(png_file, 'wb') as f:
+            f.write(data)
+        
+        print(f"生成预览图片'{png_file}'...完成！耗时{time.time() - start:.2f}秒")
+        return png_file
+    
+    def compress_pdf(self, pdf_file):
+        """压缩PDF - 对应Perl版本，改为进程内流级压缩，不再调用Ghostscript"""
+        from vrainCompress import compress_pdf
+        
+        input_file = pdf_file
+        output_file = pdf_file.replace('.pdf', '_已压缩.pdf')
+        
+        # 调用方提供了后台压缩队列（多本书、多卷共用）时只提交，不等待；
+        # 压缩尚未完成，返回None，最终路径由调用方从队列drain()的结果中取得
+        if self.compress_queue is not None:
+            print(f"PDF文件'{input_file}'加入后台压缩队列...")
+            self.compress_queue.submit(input_file, output_file)
+            return None
+        
+        result = {'input': input_file, 'output': output_file}
+        try:
+            result['stats'] = compress_pdf(input_file, output_file)
+            os.remove(input_file)
+        except Exception as e:
+            result['error'] = str(e)
+        self.print_compress_result(result)
+        return output_file if 'stats' in result else None
+    
+    def print_compress_result(self, result):
+        """打印压缩结果"""
+        from vrainCompress import format_stats
+        
+        if 'error' in result:
+            print(f"压缩PDF文件'{result['output']}'...失败！{result['error']}")
+            return
+        
+        stats = result['stats']
+        self.report.add_time('compress', stats['elapsed'])
+        print(f"压缩PDF文件'{result['output']}'...完成！")
+        print(f"\t{format_stats(stats)}")
+        for warning in stats['warnings']:
+            print(f"\t警告：{warning}")
     
     def run(self):
         """主运行方法 - 完全对应Perl版本的主流程"""
         # 解析参数
         self.parse_args()
         
+        # 批量模式：多本书分配给工作进程生成
+        if self.opts.get('batch'):
+            return self.run_batch()
+        
         # 加载配置
         self.load_zh_numbers()
         
@@ -1227,20 +1632,462 @@ class VRainPerfect:
         if self.opts.get('z'):
             print(f"注意：-z 测试模式，仅输出{self.opts['z']}页用于调试排版参数！")
         
+        # 监视模式：修改后自动重新生成
+        if self.opts.get('watch'):
+            if self.opts.get('profile'):
+                print("错误：--watch 不支持 --profile")
+                sys.exit(1)
+            return self.run_watch(book_id, from_page, to_page)
+        
+        # 性能分析：记录本次生成，结果写在输出旁
+        if self.opts.get('profile'):
+            from vrainProfile import profile_call
+            return profile_call(lambda: self.run_once(book_id, from_page, to_page),
+                                self.opts['profile'], f"books/{book_id}/profile")
+        
+        return self.run_once(book_id, from_page, to_page)
+    
+    def run_once(self, book_id, from_page, to_page):
+        """预览、分片或完整生成一次"""
+        # 预览模式：只渲染单页图片
+        if self.opts.get('p') is not None:
+            return self.run_preview(book_id, from_page, to_page, self.opts['p'])
+        
+        # 分片模式：只生成一段页，或合并各分片
+        if self.opts.get('shard') or self.opts.get('merge'):
+            return self.run_shard(book_id, from_page, to_page)
+        
+        return self.build(book_id, from_page, to_page)
+    
+    def build(self, book_id, from_page, to_page):
+        """加载配置和文本并生成PDF，结束后写入构建报告"""
+        self.report = BuildReport('perfect')
+        
         # 加载配置
+        with self.report.stage('config'):
+            self.load_book_config(book_id)
+            self.validate_config()
+            self.setup_fonts()
+            self.load_canvas_config()
+            self.calculate_positions()
+        
+        # 加载文本
+        with self.report.stage('texts'):
+            dats, if_text000, if_text999 = self.load_texts_cached(book_id, from_page, to_page)
+        
+        # 生成PDF
+        pdf_file = self.create_pdf(book_id, from_page, to_page, dats, if_text000, if_text999)
+        
+        self.report.info.update({
+            'book_id': book_id,
+            'from_page': from_page,
+            'to_page': to_page,
+            'test_pages': self.opts.get('z'),
+            'canvas_id': self.book.get('canvas_id'),
+            'raster': self.opts.get('r'),
+            'compress': bool(self.opts.get('c')),
+            'texts': sum(1 for dat in dats[from_page:to_page + 1] if dat),
+            'chars': sum(len(dat) for dat in dats[from_page:to_page + 1]),
+            'output': str(pdf_file) if self.output is None else None,
+        })
+        self.write_report(pdf_file)
+        return pdf_file
+    
+    def write_report(self, output):
+        """构建报告 - Perl版本无此功能，写入输出旁的.report.json，--report时打印汇总表"""
+        if self.opts.get('report'):
+            print(self.report.format_table())
+        if self.output is not None:
+            return None
+        
+        path = self.report.write(report_path(output))
+        if self.opts.get('v'):
+            print(f"写入构建报告'{path}'...完成！")
+        return path
+    
+    def run_watch(self, book_id, from_page, to_page):
+        """监视模式 - Perl版本无此功能，文本、配置、背景或字体修改后在同一会话中只重新生成受影响的部分
+        
+        PDF输出分层保存（vrainWatch.LayeredPdf），按影响范围只重画封面、背景、修改的文本及之后的页，
+        或只重新叠加印章插图；图片输出（-r）每次完整生成，预览（-p）每次重新排版该页。
+        """
+        from vrainWatch import watch, LayeredPdf
+        
+        layers = LayeredPdf()
+        
+        def rebuild(scopes, texts):
+            if self.opts.get('p') is not None:
+                # 预览沿用本实例，复用分页索引和渲染器
+                self.run_preview(book_id, from_page, to_page, self.opts['p'])
+            else:
+                # 加载配置会在实例上累积字体列表等状态，每次使用新实例，会话中的缓存照常复用
+                vrain = VRainPerfect(session=self.session)
+                vrain.opts = self.opts
+                vrain.zhnums = self.zhnums
+                if self.opts.get('r'):
+                    vrain.build(book_id, from_page, to_page)
+                else:
+                    vrain.build_layers(book_id, from_page, to_page, layers, scopes, texts)
+            if self.opts.get('v'):
+                print(f"\t会话缓存：{self.session.summary()}")
+        
+        try:
+            watch(book_id, from_page, to_page, rebuild)
+        except KeyboardInterrupt:
+            print("\n结束监视")
+    
+    def build_layers(self, book_id, from_page, to_page, layers, scopes, texts):
+        """监视模式的分层生成 - 只重新生成受影响的层，再合成输出PDF
+        
+        排版范围全部重新排版并重画封面和背景；封面、背景范围只重画该层；文本范围从修改的第一个文本的
+        第一页起重新排版，之前的页沿用上次的结果。印章插图每次合成时重新叠加。
+        """
+        from vrainWatch import SCOPE_LAYOUT, SCOPE_COVER, SCOPE_TEXT, SCOPE_CANVAS
+        from vrainOverlay import OVERLAY_KEYWORD
+        
+        self.report = BuildReport('perfect')
+        
+        with self.report.stage('config'):
+            self.load_book_config(book_id)
+            self.validate_config()
+            self.setup_fonts()
+            self.load_canvas_config()
+            self.calculate_positions()
+        
+        with self.report.stage('texts'):
+            dats, if_text000, if_text999 = self.load_texts_cached(book_id, from_page, to_page)
+        
+        with self.report.stage('fonts'):
+            self.register_fonts()
+        
+        canvas_id = self.book.get('canvas_id')
+        pdf_name, pdf_file = self.pdf_path(book_id, from_page, to_page)
+        
+        full = SCOPE_LAYOUT in scopes or not layers
+        if full or SCOPE_CANVAS in scopes:
+            layers.set_background(self.render_background_layer(canvas_id))
+        
+        if full:
+            data, index = self.render_text_layer(book_id, from_page, to_page, dats, if_text000, if_text999,
+                                                 1, {}, cover=True)
+            layers.set_pages(data, 1, index, cover=True)
+        else:
+            if SCOPE_COVER in scopes:
+                with self.report.stage('cover'):
+                    layers.set_cover(self.render_cover_layer(book_id, canvas_id))
+            if SCOPE_TEXT in scopes:
+                tid = min(texts)
+                first_page = layers.first_page_of(tid)
+                if first_page is None:
+                    print(f"第{tid}个文本不在已生成的页中，无需重新排版")
+                else:
+                    print(f"从第{tid}个文本（第{first_page}页）起重新排版，之前的{first_page - 1}页沿用上次的结果...")
+                    index = {pid: entry for pid, entry in layers.index.items() if pid < first_page}
+                    data, index = self.render_text_layer(book_id, tid, to_page, dats, if_text000, if_text999,
+                                                         first_page, index)
+                    layers.set_pages(data, first_page, index)
+        
+        # 印章和插图 - 合成时逐页合并
+        metadata = self.pdf_metadata()
+        overlays = self.load_overlays(book_id, pdf_name)
+        overlay = overlays.render(layers.page_count, (self.canvas_width, self.canvas_height)) if overlays else None
+        if overlay:
+            metadata['Keywords'] = OVERLAY_KEYWORD
+        
+        with self.report.stage('save'):
+            page_count = layers.compose(pdf_file, metadata, overlay)
+        
+        if overlays:
+            page_warning = overlays.check_pages(page_count)
+            for warning in overlays.warnings + ([page_warning] if page_warning else []):
+                print(f"警告：{warning}")
+        print(f"生成PDF文件'{pdf_file}'...完成！")
+        
+        if self.opts.get('c'):
+            pdf_file = self.compress_pdf(pdf_file) or pdf_file
+        
+        self.report.info.update({
+            'book_id': book_id,
+            'from_page': from_page,
+            'to_page': to_page,
+            'test_pages': self.opts.get('z'),
+            'canvas_id': canvas_id,
+            'watch_scopes': sorted(scopes),
+            'pdf_pages': page_count,
+            'output': pdf_file,
+        })
+        self.write_report(pdf_file)
+        return pdf_file
+    
+    def render_text_layer(self, book_id, from_tid, to_page, dats, if_text000, if_text999, first_page, index,
+                          cover=False):
+        """正文层 - 从第from_tid个文本（第first_page页）排版到结束，返回PDF数据和分页索引
+        
+        背景由背景层提供，这里只定义同名的空表单占位；cover为真时第1页画封面，否则第1页为空白占位页。
+        index为first_page之前的分页索引，排版时接着记录。
+        """
+        from reportlab.pdfgen import canvas as reportlab_canvas
+        from vrainWatch import BACKGROUND_FORM
+        
+        canvas_id = self.book.get('canvas_id')
+        packet = io.BytesIO()
+        c = reportlab_canvas.Canvas(packet, pagesize=(self.canvas_width, self.canvas_height))
+        c.beginForm(BACKGROUND_FORM)
+        c.endForm()
+        self.bg_form = BACKGROUND_FORM
+        
+        self.log.set_level(DEBUG if self.opts.get('v') else INFO)
+        self.log.attach(c)
+        self.report.attach(c)
+        
+        if cover:
+            with self.report.stage('cover'):
+                self.add_cover(c, book_id, canvas_id, self.canvas_width, self.canvas_height)
+        else:
+            self.report.count('pages', -1)
+        
+        self._page_index = index
+        try:
+            with self.report.stage('layout'):
+                self.layout_texts(c, book_id, from_tid, to_page, dats, if_text000, if_text999,
+                                  start_pid=first_page - 1)
+            index = self._page_index
+        finally:
+            self._page_index = None
+            self.log.flush()
+        
+        c.save()
+        return packet.getvalue(), index
+    
+    def render_cover_layer(self, book_id, canvas_id):
+        """封面层 - 只有封面一页的PDF数据"""
+        from reportlab.pdfgen import canvas as reportlab_canvas
+        
+        packet = io.BytesIO()
+        c = reportlab_canvas.Canvas(packet, pagesize=(self.canvas_width, self.canvas_height))
+        self.add_cover(c, book_id, canvas_id, self.canvas_width, self.canvas_height)
+        c.showPage()
+        c.save()
+        return packet.getvalue()
+    
+    def render_background_layer(self, canvas_id):
+        """背景层 - 把矢量背景或背景图定义为正文层引用的表单，返回PDF数据"""
+        from reportlab.pdfgen import canvas as reportlab_canvas
+        from vrainWatch import BACKGROUND_FORM
+        
+        canvas_width = self.canvas_width
+        canvas_height = self.canvas_height
+        packet = io.BytesIO()
+        c = reportlab_canvas.Canvas(packet, pagesize=(canvas_width, canvas_height))
+        if int(self.book.get('canvas_vector', 0)):
+            print(f"使用矢量背景'canvas/{canvas_id}.cfg'...")
+            self.session.canvas_generator(canvas_id, 'canvas').create_form(c, BACKGROUND_FORM)
+        else:
+            bg_image = self.get_background_image(canvas_id)
+            c.beginForm(BACKGROUND_FORM, lowerx=0, lowery=0, upperx=canvas_width, uppery=canvas_height)
+            if Path(bg_image).exists():
+                c.drawImage(bg_image, 0, 0, width=canvas_width, height=canvas_height)
+            c.endForm()
+        c.doForm(BACKGROUND_FORM)
+        c.showPage()
+        c.save()
+        return packet.getvalue()
+    
+    def run_shard(self, book_id, from_page, to_page):
+        """分片生成 - Perl版本无此功能，--shard i/N生成第i段页的PDF片段，--merge合并全部分片"""
+        from vrainShard import parse_shard
+        
+        if self.opts.get('r') or self.opts.get('shard') and self.opts.get('merge'):
+            print("错误：--shard 和 --merge 不能同时使用，也不支持 -r")
+            sys.exit(1)
+        
         self.load_book_config(book_id)
         self.validate_config()
         self.setup_fonts()
         self.load_canvas_config()
         self.calculate_positions()
         
-        # 加载文本
-        dats, if_text000, if_text999 = self.load_texts(book_id, from_page, to_page)
+        if self.opts.get('merge'):
+            return self.merge_shards(book_id, from_page, to_page)
         
-        # 生成PDF
-        pdf_file = self.create_pdf(book_id, from_page, to_page, dats, if_text000, if_text999)
+        try:
+            shard, shards = parse_shard(self.opts['shard'])
+        except ValueError as e:
+            print(f"错误：{e}")
+            sys.exit(1)
+        
+        dats, if_text000, if_text999 = self.load_texts_cached(book_id, from_page, to_page)
+        return self.create_shard(book_id, from_page, to_page, dats, if_text000, if_text999, shard, shards)
+    
+    def create_shard(self, book_id, from_page, to_page, dats, if_text000, if_text999, shard, shards):
+        """生成分片 - 预排版得到分页索引，按总页数均分后只排版本段的页，第1个分片包含封面
+        
+        各页从分页索引中的页首状态恢复排版，页码、版心标题与完整生成时一致。
+        输出PDF片段和说明文件（页码范围、目录、元数据、排版指纹），由merge_shards合并。
+        """
+        from reportlab.pdfgen import canvas as reportlab_canvas
+        from vrainShard import shard_range, shard_paths, layout_fingerprint, write_manifest
+        from vrainOverlay import OVERLAY_KEYWORD
+        
+        canvas_width = self.canvas_width
+        canvas_height = self.canvas_height
+        canvas_id = self.book.get('canvas_id')
+        pdf_name, pdf_file = self.pdf_path(book_id, from_page, to_page)
+        fragment, manifest = shard_paths(pdf_file, shard, shards)
+        
+        # 预排版 - 与预览共用分页索引，取字体需先注册字体
+        self.register_fonts()
+        print("预排版，计算分页...")
+        index = self.build_page_index(book_id, from_page, to_page, dats, if_text000, if_text999)
+        total = len(index)
+        start, end = shard_range(total, shard, shards)
+        pages = max(0, end - start + 1)
+        if pages:
+            print(f"分片{shard}/{shards}：共{total}页，生成第{start}至{end}页...")
+        else:
+            print(f"分片{shard}/{shards}：共{total}页，本分片没有正文页")
         
+        # 目录 - 每个标题第一次出现的页，PDF页码含封面
+        outlines = []
+        title_directory = self.book.get('title_directory')
+        if title_directory and int(title_directory) == 1:
+            seen = set()
+            for page in sorted(index):
+                tptitle = ''.join(self.get_title_chars(index[page][0], dats, if_text000, if_text999))
+                if tptitle not in seen:
+                    seen.add(tptitle)
+                    outlines.append((tptitle, page + 1))
+        
+        has_fragment = shard == 1 or pages > 0
+        overlays = None
+        if has_fragment:
+            c = reportlab_canvas.Canvas(str(fragment), pagesize=(canvas_width, canvas_height))
+            self.bg_form = self.load_vector_canvas(c, canvas_id)
+            
+            # 印章和插图按PDF页码叠加，片段第1页是PDF第start+1页（第1个分片从封面开始）
+            overlays = self.load_overlays(book_id, pdf_name)
+            if overlays:
+                overlays.attach(c, page_offset=0 if shard == 1 else start)
+            
+            from vrainProgress import ProgressReporter
+            reporter = ProgressReporter(self.progress_callback, self.cancel_token)
+            reporter.set_total(pages + (1 if shard == 1 else 0))
+            reporter.attach(c)
+            
+            self.log.set_level(DEBUG if self.opts.get('v') else INFO)
+            self.log.attach(c)
+            
+            self.set_metadata(c)
+            
+            if shard == 1:
+                self.add_cover(c, book_id, canvas_id, canvas_width, canvas_height)
+                if pages:
+                    c.showPage()
+            
+            try:
+                if pages:
+                    self.layout_page_range(c, dats, if_text000, if_text999, to_page, index, start, end)
+            finally:
+                self.log.flush()
+            
+            reporter.set_stage('save')
+            c.save()
+            reporter.finish()
+            print(f"生成PDF片段'{fragment}'...完成！")
+        
+        write_manifest(manifest, {
+            'book_id': book_id,
+            'from_page': from_page,
+            'to_page': to_page,
+            'shard': shard,
+            'shards': shards,
+            'total_pages': total,
+            'start': start,
+            'end': end,
+            'cover': shard == 1,
+            'fragment': fragment.name if has_fragment else None,
+            'fingerprint': layout_fingerprint(dats, self.book, total),
+            'outlines': outlines,
+            'metadata': dict(self.pdf_metadata(), **({'Keywords': OVERLAY_KEYWORD} if overlays else {})),
+        })
+        print(f"生成分片说明'{manifest}'...完成！")
+        return str(fragment) if has_fragment else str(manifest)
+    
+    def layout_page_range(self, c, dats, if_text000, if_text999, to_page, index, start, end):
+        """排版第start至end页 - 从分页索引中第start页的页首状态开始，文本排完后接着排下一个文本"""
+        canvas_width = self.canvas_width
+        canvas_height = self.canvas_height
+        canvas_id = self.book.get('canvas_id')
+        bg_image = self.get_background_image(canvas_id)
+        
+        tid, remain, rchars, flag_tbook, flag_rbook, last = index[start]
+        chars = list(dats[tid])
+        chars = chars[len(chars) - remain:]
+        rchars = list(rchars)
+        state = (flag_tbook, flag_rbook, last)
+        pid = start - 1
+        
+        while True:
+            tpchars = self.get_title_chars(tid, dats, if_text000, if_text999)
+            self.draw_background(c, bg_image, canvas_width, canvas_height)
+            self.add_page_title(c, tpchars)
+            
+            pid, _ = self.process_text_layout_complete(c, chars, rchars, 0, pid,
+                                                       canvas_width, canvas_height,
+                                                       tpchars, bg_image, canvas_id,
+                                                       tid=tid, state=state, stop_pid=end)
+            
+            # 与layout_texts相同，下一个文本从新页开始
+            tid += 1
+            if pid >= end or tid > to_page or tid >= len(dats):
+                break
+            chars = list(dats[tid])
+            rchars = []
+            state = None
+            c.showPage()
+    
+    def merge_shards(self, book_id, from_page, to_page):
+        """合并分片 - 按页码顺序拼接books目录下的PDF片段，写入目录和元数据"""
+        from vrainShard import merge_shards
+        
+        pdf_name, pdf_file = self.pdf_path(book_id, from_page, to_page)
+        print(f"合并'{pdf_name}'的分片...")
+        try:
+            result = merge_shards(pdf_file)
+        except ValueError as e:
+            print(f"错误：{e}")
+            sys.exit(1)
+        
+        print(f"合并{result['shards']}个分片，共{result['pages']}页，目录{result['outlines']}条，"
+              f"合并重复对象{result['duplicates_removed']}个")
+        print(f"生成PDF文件'{pdf_file}'...完成！")
+        
+        if self.opts.get('c'):
+            self.compress_pdf(pdf_file)
         return pdf_file
+    
+    def run_batch(self):
+        """批量生成 - Perl版本无此功能，多本书在工作进程池中生成，每个进程只加载一次字体"""
+        from vrainBatch import collect_entries, run_batch
+        
+        self.print_welcome()
+        if self.opts.get('r') or self.opts.get('p') is not None:
+            print("错误：--batch 不支持 -r 和 -p")
+            sys.exit(1)
+        
+        entries = collect_entries(self.opts['batch'], self.opts['f'], self.opts['t'])
+        if not entries:
+            print("错误：--batch 没有需要生成的书籍")
+            sys.exit(1)
+        if self.opts.get('z'):
+            print(f"注意：-z 测试模式，每本书仅输出{self.opts['z']}页用于调试排版参数！")
+        
+        results = run_batch(entries, workers=self.opts.get('j'), test_pages=self.opts.get('z'),
+                            compress=self.opts.get('c'), verbose=self.opts.get('v'),
+                            profile=self.opts.get('profile'))
+        if not all(result['ok'] for result in results):
+            sys.exit(1)
+        return results
 
 
 def main():
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+程序接口
+
+在其它程序中直接调用排版引擎，不经过命令行参数，不写固定路径：
+
+    from vrainAPI import render_book, render_novel
+
+    # 传统古籍模式：书籍01的文本1至3，结果为PDF数据
+    pdf = render_book('01', from_page=1, to_page=3)
+
+    # 使用书籍01的配置，覆盖每列字数，排版传入的文本，写入文件对象
+    with open('out.pdf', 'wb') as f:
+        render_book('01', texts=['天地玄黄，宇宙洪荒。'], overrides={'row_num': 20}, output=f)
+
+    # 小说章节模式：配置可以是book.cfg路径或配置字典
+    pdf = render_novel('第一章 开端\n正文……', 'books/04/book.cfg')
+
+文本可以是字符串（文本内容）或Path（文本文件）；输出目标可以是路径、文件对象或BytesIO，
+未给出时返回PDF数据。出错时抛出VRainError，不调用sys.exit；取消时抛出BuildCancelled。
+排版日志通过log回调逐行传出，未给出时丢弃。books、fonts、canvas、db等目录与命令行一样相对于当前目录。
+接口调用期间会重定向本线程的标准输出，多个生成任务应在不同进程中并行（参见vrainServer）。
+"""
+
+import io
+import os
+import hashlib
+import contextlib
+from collections import deque
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Union
+
+from vrainProgress import BuildCancelled
+
+TextSource = Union[str, Path]
+Output = Union[None, str, Path, BinaryIO]
+
+# 错误日志保留的末尾行数
+ERROR_LOG_LINES = 20
+
+
+class VRainError(Exception):
+    """排版失败，log为排版日志的末尾"""
+
+    def __init__(self, message: str, log: str = ''):
+        super().__init__(message)
+        self.log = log
+
+    def __reduce__(self):
+        # 从工作进程传回时保留日志
+        return (VRainError, (str(self), self.log))
+
+
+class _LogWriter(io.TextIOBase):
+    """接收排版引擎打印的内容，按行交给log回调，并保留末尾若干行用于错误信息"""
+
+    def __init__(self, log: Optional[Callable[[str], None]] = None):
+        self.log = log
+        self.tail = deque(maxlen=ERROR_LOG_LINES)
+        self._buffer = ''
+
+    def write(self, text: str) -> int:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            self._emit(line)
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            self._emit(self._buffer)
+        self._buffer = ''
+
+    def _emit(self, line: str):
+        if not line.strip():
+            return
+        self.tail.append(line)
+        if self.log:
+            self.log(line)
+
+
+@contextlib.contextmanager
+def _engine_errors(log: Optional[Callable[[str], None]]):
+    """捕获排版引擎的输出，把sys.exit和异常转为VRainError"""
+    writer = _LogWriter(log)
+    try:
+        with contextlib.redirect_stdout(writer):
+            yield writer
+    except (BuildCancelled, VRainError):
+        raise
+    except SystemExit:
+        # vrain.py遇到配置错误时打印原因后sys.exit，原因是最后一行输出
+        writer.flush()
+        message = writer.tail[-1] if writer.tail else '排版引擎退出'
+        raise VRainError(message, '\n'.join(writer.tail)) from None
+    except Exception as e:
+        writer.flush()
+        raise VRainError(str(e), '\n'.join(writer.tail)) from e
+    finally:
+        writer.flush()
+
+
+def read_text_source(source: TextSource) -> str:
+    """文本来源转为文本内容：Path读取文件，字符串即为内容"""
+    if isinstance(source, Path):
+        return source.read_text(encoding='utf-8')
+    return source
+
+
+def _open_output(output: Output):
+    """PDF输出目标：None时为新的BytesIO，路径转为字符串，文件对象原样使用"""
+    if output is None:
+        return io.BytesIO()
+    if isinstance(output, (str, os.PathLike)):
+        return os.fspath(output)
+    return output
+
+
+def _result(output: Output, target):
+    """返回值：未给出输出目标时为PDF数据，路径时为Path，文件对象原样返回"""
+    if output is None:
+        return target.getvalue()
+    if isinstance(output, (str, os.PathLike)):
+        return Path(output)
+    return output
+
+
+# 程序接口用的排版引擎类，首次使用时创建（避免导入本模块时就导入vrain）
+_engine = None
+
+
+def engine_class():
+    """程序接口用的排版引擎：在VRainPerfect的基础上支持配置字典、配置覆盖和传入的文本"""
+    global _engine
+    if _engine is not None:
+        return _engine
+    from vrain import VRainPerfect, TEXT_CONFIG_KEYS
+
+    class LibraryEngine(VRainPerfect):
+
+        def __init__(self, session=None):
+            super().__init__(session=session)
+            # 代替book.cfg的配置项，None时读取books/<id>/book.cfg
+            self.config: Optional[Dict[str, str]] = None
+            # 覆盖book.cfg的配置项
+            self.overrides: Dict[str, str] = {}
+            # 传入的文本内容，None时读取books/<id>/text/下的文本文件
+            self.texts: Optional[List[str]] = None
+
+        def check_directories(self, book_id):
+            if self.config is None:
+                super().check_directories(book_id)
+
+        def load_book_config(self, book_id):
+            if self.config is None:
+                super().load_book_config(book_id)
+            else:
+                self.book.update(self.config)
+            self.book.update(self.overrides)
+
+        def get_texts_key(self, book_id):
+            if self.texts is None:
+                return super().get_texts_key(book_id)
+            digest = hashlib.sha1('\0'.join(self.texts).encode('utf-8')).hexdigest()
+            return (book_id, 'texts', digest, tuple(self.book.get(k) for k in TEXT_CONFIG_KEYS))
+
+        def load_texts(self, book_id, from_page, to_page):
+            if self.texts is None:
+                return super().load_texts(book_id, from_page, to_page)
+            dats = [''] + [self.preprocess_lines(io.StringIO(text)) for text in self.texts]
+            return dats, False, False
+
+    _engine = LibraryEngine
+    return _engine
+
+
+def _stringify(config: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """配置值转为字符串，与从book.cfg读取的一致"""
+    return {str(k): str(v) for k, v in (config or {}).items()}
+
+
+def make_engine(book_id: Optional[str] = None, config: Optional[Dict[str, Any]] = None,
+                overrides: Optional[Dict[str, Any]] = None, texts: Optional[Iterable[TextSource]] = None,
+                from_page: int = 1, to_page: Optional[int] = None, test_pages: Optional[int] = None,
+                session=None):
+    """
+    创建并设置传统古籍模式的排版引擎（不加载配置）
+
+    Args:
+        book_id: 书籍ID，读取books/<id>/下的book.cfg、文本、封面和印章插图
+        config: 书籍配置字典，给出时代替book.cfg
+        overrides: 覆盖book.cfg或config中的配置项
+        texts: 文本内容或文本文件，给出时代替书籍的文本文件
+        from_page: 起始文本序号
+        to_page: 结束文本序号，默认为最后一个文本
+        test_pages: 仅输出指定页数
+        session: 引擎会话
+
+    Returns:
+        排版引擎（VRainPerfect的子类实例）
+    """
+    if book_id is None and config is None:
+        raise VRainError('未给出书籍ID或书籍配置')
+    engine = engine_class()(session=session)
+    engine.config = _stringify(config) if config is not None else None
+    engine.overrides = _stringify(overrides)
+    if texts is not None:
+        engine.texts = [read_text_source(source) for source in texts]
+        if not engine.texts:
+            raise VRainError('没有需要排版的文本')
+    if to_page is None:
+        if engine.texts is not None:
+            to_page = len(engine.texts)
+        else:
+            text_dir = Path(f"books/{book_id}/text")
+            to_page = max(1, len([f for f in text_dir.glob('*.txt') if not f.name.startswith('.')]))
+    if from_page < 1 or to_page < from_page:
+        raise VRainError(f"文本序号范围无效：{from_page}至{to_page}")
+    engine.opts = {'b': book_id or '', 'f': from_page, 't': to_page, 'z': test_pages,
+                   'c': False, 'v': False, 'r': None}
+    return engine
+
+
+def render_book(book_id: Optional[str] = None, config: Optional[Dict[str, Any]] = None,
+                overrides: Optional[Dict[str, Any]] = None, texts: Optional[Iterable[TextSource]] = None,
+                output: Output = None, from_page: int = 1, to_page: Optional[int] = None,
+                test_pages: Optional[int] = None, session=None,
+                log: Optional[Callable[[str], None]] = None, progress_callback=None, cancel_token=None,
+                report_callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """
+    传统古籍模式生成PDF
+
+    Args:
+        book_id: 书籍ID，见make_engine
+        config: 书籍配置字典，给出时代替book.cfg
+        overrides: 覆盖的配置项
+        texts: 文本内容或文本文件，给出时代替书籍的文本文件
+        output: 输出目标，路径、文件对象或BytesIO；None时返回PDF数据
+        from_page: 起始文本序号
+        to_page: 结束文本序号，默认为最后一个文本
+        test_pages: 仅输出指定页数
+        session: 引擎会话（vrainSession.EngineSession），多次调用之间复用字体等资源
+        log: 日志回调，参数为一行日志
+        progress_callback: 进度回调（vrainProgress）
+        cancel_token: 取消令牌（vrainProgress.CancelToken）
+        report_callback: 生成完成后以构建报告（vrainReport.BuildReport.to_dict）调用
+
+    Returns:
+        output为None时为PDF数据（bytes），路径时为Path，文件对象时为该对象
+
+    Raises:
+        VRainError: 配置错误或排版失败
+        BuildCancelled: 已取消
+    """
+    engine = make_engine(book_id, config, overrides, texts, from_page, to_page, test_pages, session)
+    engine.progress_callback = progress_callback
+    engine.cancel_token = cancel_token
+    target = _open_output(output)
+    engine.output = target
+    with _engine_errors(log):
+        engine.load_zh_numbers()
+        engine.check_directories(engine.opts['b'])
+        engine.build(engine.opts['b'], engine.opts['f'], engine.opts['t'])
+    if report_callback:
+        report_callback(engine.report.to_dict())
+    return _result(output, target)
+
+
+def render_page(book_id: Optional[str] = None, page: int = 1, config: Optional[Dict[str, Any]] = None,
+                overrides: Optional[Dict[str, Any]] = None, texts: Optional[Iterable[TextSource]] = None,
+                from_page: int = 1, to_page: Optional[int] = None, scale: float = 1.0, session=None,
+                log: Optional[Callable[[str], None]] = None) -> bytes:
+    """
+    传统古籍模式预览单页，返回PNG数据
+
+    Args:
+        book_id: 书籍ID，见make_engine
+        page: 页码，0为封面
+        config: 书籍配置字典，给出时代替book.cfg
+        overrides: 覆盖的配置项
+        texts: 文本内容或文本文件，给出时代替书籍的文本文件
+        from_page: 起始文本序号
+        to_page: 结束文本序号，默认为最后一个文本
+        scale: 缩放比例
+        session: 引擎会话，分页索引和渲染器缓存在会话中
+        log: 日志回调
+
+    Returns:
+        bytes: PNG数据
+
+    Raises:
+        VRainError: 配置错误、页码超出范围或排版失败
+    """
+    engine = make_engine(book_id, config, overrides, texts, from_page, to_page, None, session)
+    with _engine_errors(log):
+        engine.load_zh_numbers()
+        engine.check_directories(engine.opts['b'])
+        return engine.preview_page(engine.opts['b'], page, engine.opts['f'], engine.opts['t'], scale)
+
+
+def render_novel(text: TextSource, config: Union[str, Path, Dict[str, Any]],
+                 overrides: Optional[Dict[str, Any]] = None, output: Output = None,
+                 cover: Optional[Union[str, Path]] = None, from_page: int = 1, to_page: Optional[int] = None,
+                 test_pages: Optional[int] = None, session=None, log: Optional[Callable[[str], None]] = None,
+                 progress_callback=None, cancel_token=None,
+                 report_callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """
+    小说章节模式生成PDF
+
+    Args:
+        text: 文本内容（字符串）或文本文件（Path）
+        config: book.cfg路径或书籍配置字典
+        overrides: 覆盖的配置项
+        output: 输出目标，路径、文件对象或BytesIO；None时返回PDF数据
+        cover: 封面图片路径
+        from_page: 起始页
+        to_page: 结束页，None为全部
+        test_pages: 仅输出指定页数
+        session: 引擎会话
+        log: 日志回调
+        progress_callback: 进度回调
+        cancel_token: 取消令牌
+        report_callback: 生成完成后以构建报告调用
+
+    Returns:
+        output为None时为PDF数据（bytes），路径时为Path，文件对象时为该对象
+
+    Raises:
+        VRainError: 配置错误或排版失败
+        BuildCancelled: 已取消
+    """
+    from vrainNovel import VRainPDFGenerator
+
+    if isinstance(config, dict):
+        book_cfg_path, book_config = None, dict(config, **(overrides or {}))
+    else:
+        book_cfg_path, book_config = config, overrides
+    target = _open_output(output)
+    with _engine_errors(log):
+        generator = VRainPDFGenerator(
+            text_file=text if isinstance(text, Path) else None,
+            book_cfg_path=book_cfg_path,
+            cover_path=cover,
+            from_page=from_page,
+            to_page=to_page,
+            test_pages=test_pages,
+            log_callback=print,
+            progress_callback=progress_callback,
+            cancel_token=cancel_token,
+            session=session,
+            book_config=book_config
+        )
+        generator.generate_pdf(output=target, text=None if isinstance(text, Path) else text)
+    if report_callback:
+        report_callback(generator.report.to_dict())
+    return _result(output, target)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+背景图预处理模块
+
+按输出用途的预设（screen、ebook、print）把canvas/<id>.jpg重采样并重新编码一次，
+结果以源文件哈希、目标尺寸和编码质量命名缓存在canvas/.cache/下，
+两个排版引擎生成PDF时用它代替原背景图，每本书不再嵌入全分辨率的纹理背景。
+"""
+
+from pathlib import Path
+
+from PIL import Image
+
+from vrainSession import save_cached_jpeg, source_hash
+
+# 预设：名称 -> (目标分辨率dpi, JPEG质量)
+BACKGROUND_PRESETS = {
+    'screen': (72, 60),
+    'ebook': (150, 75),
+    'print': (300, 90),
+}
+# 背景图配置未指定canvas_dpi时假定的设计分辨率，2480×1860的背景图按300dpi设计
+DEFAULT_CANVAS_DPI = 300
+# 缓存目录，位于背景图目录下
+CACHE_DIR = '.cache'
+
+def prepare_background(image_path, canvas_width: float, canvas_height: float, preset: str,
+                       canvas_dpi: float = DEFAULT_CANVAS_DPI) -> Path:
+    """
+    按预设重采样并重新编码背景图，返回用于drawImage的图片路径
+
+    目标像素尺寸为画布尺寸乘以预设分辨率与背景图设计分辨率之比（不放大）。
+    结果比原图还大时仍使用原图。
+
+    Args:
+        image_path: 原背景图路径
+        canvas_width: 画布宽度（背景图配置canvas_width）
+        canvas_height: 画布高度（背景图配置canvas_height）
+        preset: 预设名称，空值表示使用原图
+        canvas_dpi: 背景图的设计分辨率
+
+    Returns:
+        Path: 背景图路径
+
+    Raises:
+        ValueError: 预设名称不存在
+    """
+    src = Path(image_path)
+    if not preset or not src.exists():
+        return src
+    if preset not in BACKGROUND_PRESETS:
+        raise ValueError(f"未知的背景图预设'{preset}'，可选：{'、'.join(BACKGROUND_PRESETS)}")
+
+    dpi, quality = BACKGROUND_PRESETS[preset]
+    scale = min(1.0, dpi / canvas_dpi)
+    target = (max(1, round(canvas_width * scale)), max(1, round(canvas_height * scale)))
+
+    cache_dir = src.parent / CACHE_DIR
+    cached = cache_dir / f"{src.stem}_{source_hash(src)[:16]}_{target[0]}x{target[1]}_q{quality}.jpg"
+    if not cached.exists():
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with Image.open(src) as img:
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            if img.size != target:
+                img = img.resize(target, Image.LANCZOS)
+            save_cached_jpeg(img, cached, quality)
+
+    return cached if cached.stat().st_size < src.stat().st_size else src
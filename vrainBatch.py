@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多书批量生成
+
+vrain.py --batch books/01 books/02 ... 在一个命令中生成多本书，也可以传入清单文件，
+每行一本书：
+
+    # 书籍目录或书籍ID  [起始序号  [结束序号]]
+    books/01
+    books/02  1  3
+    03        2  2
+
+未写范围的行使用命令行的-f、-t。书籍按顺序分配给若干工作进程，每个工作进程持有
+一个引擎会话（vrainSession），字体、字符支持检查结果、简繁转换器和矢量背景在进程内
+只加载一次，后续的书直接复用。-c时工作进程只排版，压缩交给主进程的后台压缩队列，
+与其余书的排版重叠进行。全部结束后打印每本书的页数、耗时和输出大小。
+"""
+
+import io
+import os
+import sys
+import time
+import contextlib
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 失败时打印的日志末尾行数
+ERROR_LOG_LINES = 20
+
+
+def parse_book_arg(arg: str) -> str:
+    """书籍参数转为书籍ID：books/01、books/01/和01都对应01"""
+    return Path(arg.rstrip('/\\')).name
+
+
+def parse_manifest(path, from_page: int, to_page: int) -> List[Dict[str, Any]]:
+    """
+    读取清单文件
+
+    Args:
+        path: 清单文件路径
+        from_page: 默认起始序号
+        to_page: 默认结束序号
+
+    Returns:
+        List[Dict[str, Any]]: 每本书的book_id、from_page、to_page
+    """
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = line.split()
+            try:
+                start = int(fields[1]) if len(fields) > 1 else from_page
+                end = int(fields[2]) if len(fields) > 2 else (start if len(fields) > 1 else to_page)
+            except ValueError:
+                raise ValueError(f"清单'{path}'第{lineno}行的文本序号不是数字：{line}")
+            entries.append({'book_id': parse_book_arg(fields[0]), 'from_page': start, 'to_page': end})
+    return entries
+
+
+def collect_entries(args: List[str], from_page: int, to_page: int) -> List[Dict[str, Any]]:
+    """
+    --batch的参数转为书籍列表：书籍目录或书籍ID直接加入，其它已存在的文件按清单读取
+
+    Args:
+        args: --batch后的参数
+        from_page: 默认起始序号（-f）
+        to_page: 默认结束序号（-t）
+
+    Returns:
+        List[Dict[str, Any]]: 每本书的book_id、from_page、to_page
+    """
+    entries = []
+    for arg in args:
+        if os.path.isfile(arg):
+            entries.extend(parse_manifest(arg, from_page, to_page))
+        else:
+            entries.append({'book_id': parse_book_arg(arg), 'from_page': from_page, 'to_page': to_page})
+    return entries
+
+
+# 工作进程内的引擎会话，同一进程先后生成的书共用
+_worker_session = None
+
+
+def _init_worker():
+    global _worker_session
+    from vrainSession import EngineSession
+    _worker_session = EngineSession()
+
+
+def build_book(entry: Dict[str, Any], test_pages: Optional[int], verbose: bool,
+               profile: Optional[str] = None) -> Dict[str, Any]:
+    """
+    生成一本书（在工作进程中调用）
+
+    Args:
+        entry: book_id、from_page、to_page
+        test_pages: 测试模式页数，None为正常模式
+        verbose: 是否输出详细日志
+        profile: 性能分析模式（vrainProfile），None为不分析
+
+    Returns:
+        Dict[str, Any]: entry的各项，加上ok、pages、seconds、output、error和log
+    """
+    from vrainJobs import build_perfect
+
+    if _worker_session is None:
+        _init_worker()
+
+    progress = {}
+    params = dict(entry, test_pages=test_pages, compress=False, verbose=verbose, profile=profile)
+    result = dict(entry, ok=False, pages=0, output=None, error=None)
+    buffer = io.StringIO()
+    start = time.time()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            result['output'] = build_perfect(params, _worker_session, progress_callback=progress.update)
+        result['ok'] = True
+    except SystemExit:
+        # vrain.py遇到配置错误时打印原因后sys.exit，原因已在日志中
+        result['error'] = '排版引擎退出'
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.time() - start
+    result['pages'] = progress.get('pages_laid_out', 0)
+    result['log'] = buffer.getvalue()
+    return result
+
+
+def format_size(size: Optional[int]) -> str:
+    """文件大小，KB或MB"""
+    if size is None:
+        return '-'
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f}MB"
+    return f"{size / 1024:.0f}KB"
+
+
+def display_width(text: str) -> int:
+    """终端显示宽度，中文等全角字符占两格"""
+    return sum(2 if unicodedata.east_asian_width(ch) in 'WF' else 1 for ch in text)
+
+
+def pad(text: str, width: int, right: bool = False) -> str:
+    """按显示宽度补齐空格，right为True时右对齐"""
+    fill = ' ' * max(0, width - display_width(text))
+    return fill + text if right else text + fill
+
+
+def format_summary(results: List[Dict[str, Any]], elapsed: float) -> str:
+    """
+    汇总表：每本书的文本范围、页数、耗时、输出大小和状态
+
+    Args:
+        results: build_book的结果，按书籍列表顺序
+        elapsed: 总耗时（秒）
+
+    Returns:
+        str: 多行表格
+    """
+    header = ('书籍', '文本', '页数', '耗时', '大小', '状态')
+    rows = []
+    for r in results:
+        rows.append((
+            r['book_id'],
+            f"{r['from_page']}-{r['to_page']}",
+            str(r['pages']),
+            f"{r['seconds']:.2f}s",
+            format_size(r.get('size')),
+            '完成' if r['ok'] else f"失败：{r['error']}",
+        ))
+    widths = [max(display_width(row[i]) for row in rows + [header]) for i in range(len(header) - 1)]
+
+    def line(row):
+        cells = [pad(row[i], widths[i], right=i >= 2) for i in range(len(widths))]
+        return '  '.join(cells + [row[-1]])
+
+    ok = [r for r in results if r['ok']]
+    rule = '-' * (sum(widths) + 2 * len(widths) + display_width(header[-1]))
+    lines = [line(header), rule] + [line(row) for row in rows] + [rule]
+    lines.append(f"共{len(results)}本，成功{len(ok)}本，{sum(r['pages'] for r in ok)}页，"
+                 f"{format_size(sum(r.get('size') or 0 for r in ok))}，总耗时{elapsed:.2f}秒")
+    return '\n'.join(lines)
+
+
+def run_batch(entries: List[Dict[str, Any]], workers: Optional[int] = None, test_pages: Optional[int] = None,
+              compress: bool = False, verbose: bool = False, profile: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    用工作进程池批量生成
+
+    Args:
+        entries: 书籍列表，见collect_entries
+        workers: 工作进程数，默认为CPU核数（不超过书籍数）
+        test_pages: 测试模式页数，None为正常模式
+        compress: 是否压缩PDF
+        verbose: 是否输出每本书的详细日志
+        profile: 性能分析模式，每本书的分析结果写在其PDF旁
+
+    Returns:
+        List[Dict[str, Any]]: 按书籍列表顺序排列的结果，成功时含output和size
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(entries)))
+    print(f"批量生成{len(entries)}本书，{workers}个工作进程...")
+
+    compress_queue = None
+    compressed = {}
+    if compress:
+        from vrainCompress import CompressQueue
+        compress_queue = CompressQueue()
+
+    start = time.time()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(build_book, entry, test_pages, verbose, profile): i
+                   for i, entry in enumerate(entries)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # 工作进程异常退出
+                result = dict(entries[index], ok=False, pages=0, seconds=0.0, output=None,
+                              error=str(e), log='')
+            results[index] = result
+            done += 1
+
+            if verbose and result['log']:
+                sys.stdout.write(result['log'])
+            status = '完成' if result['ok'] else f"失败：{result['error']}"
+            print(f"[{done}/{len(entries)}] 书籍{result['book_id']} 文本{result['from_page']}至"
+                  f"{result['to_page']} {result['pages']}页 {result['seconds']:.2f}秒 {status}")
+            if not result['ok'] and not verbose:
+                for log_line in result['log'].rstrip().splitlines()[-ERROR_LOG_LINES:]:
+                    print(f"\t{log_line}")
+
+            if result['ok'] and compress_queue is not None:
+                output = result['output'].replace('.pdf', '_已压缩.pdf')
+                compressed[index] = output
+                compress_queue.submit(result['output'], output)
+
+    if compress_queue is not None:
+        print("等待后台压缩完成...")
+        for index, outcome in zip(list(compressed), compress_queue.drain()):
+            if 'error' in outcome:
+                results[index]['ok'] = False
+                results[index]['error'] = f"压缩失败：{outcome['error']}"
+            else:
+                results[index]['output'] = outcome['output']
+
+    for result in results:
+        if result['ok']:
+            result['size'] = os.path.getsize(result['output'])
+
+    print(format_summary(results, time.time() - start))
+    return results
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+排版与渲染性能基准
+
+生成指定大小的合成文本，分别用传统古籍模式（vrain.py）和小说章节模式（vrainNovel.py）
+在各个背景（canvas/*.cfg）上生成PDF，记录耗时、每秒字数、每秒页数、内存峰值和输出大小，
+结果以JSON输出，便于比较优化前后的差异：
+
+    python vrainBench.py --sizes 256K,1M --canvas 01_Black,28_Black -o before.json
+    python vrainBench.py --sizes 256K,1M --canvas 01_Black,28_Black -o after.json --compare before.json
+
+合成文本可选择是否包含【批注】、《书名》和$%&排版控制符，生僻字比例（CJK扩展A区）可调，
+同一随机种子生成的文本完全相同。每个用例在新的子进程中运行，互不共享缓存，内存峰值按用例统计。
+使用书籍（默认01）的book.cfg和字体，背景用canvas_id覆盖。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from vrainJobs import JOB_PERFECT, JOB_NOVEL
+
+ENGINES = (JOB_PERFECT, JOB_NOVEL)
+
+# 常用字（千字文），合成正文从中取字
+COMMON_CHARS = ''.join(dict.fromkeys(
+    '天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜'
+    '金生丽水玉出昆冈剑号巨阙珠称夜光果珍李柰菜重芥姜海咸河淡鳞潜羽翔龙师火帝鸟官人皇'
+    '始制文字乃服衣裳推位让国有虞陶唐吊民伐罪周发殷汤坐朝问道垂拱平章爱育黎首臣伏戎羌'
+    '遐迩一体率宾归王鸣凤在竹白驹食场化被草木赖及万方盖此身发四大五常恭惟鞠养岂敢毁伤'
+    '女慕贞洁男效才良知过必改得能莫忘罔谈彼短靡恃己长信使可覆器欲难量墨悲丝染诗赞羔羊'
+    '景行维贤克念作圣德建名立形端表正空谷传声虚堂习听祸因恶积福缘善庆尺璧非宝寸阴是竞'
+))
+
+# 生僻字取自CJK扩展A区，主字体通常不支持，会走后备字体和简繁转换
+RARE_RANGE = (0x3400, 0x4DBF)
+
+# 句末标点
+PUNCTUATION = '，，，。。、；：？！'
+
+# 排版控制符：$前进半页或整页，%跳到页尾，&跳到最后一列
+CONTROLS = '$%&'
+
+# 每段字数范围和每章（传统模式的每个文本）大小
+PARAGRAPH_CHARS = (40, 240)
+CHAPTER_BYTES = 256 * 1024
+
+
+def parse_size(text: str) -> int:
+    """解析大小：1048576、512K、1M、100M"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KkMm]?)[Bb]?\s*', text)
+    if not match:
+        raise ValueError(f"无法识别的大小：{text}")
+    scale = {'': 1, 'k': 1024, 'm': 1024 * 1024}[match.group(2).lower()]
+    return int(float(match.group(1)) * scale)
+
+
+def format_size(size: int) -> str:
+    """大小的简短写法，与parse_size对应"""
+    if size % (1024 * 1024) == 0:
+        return f"{size // (1024 * 1024)}M"
+    if size % 1024 == 0:
+        return f"{size // 1024}K"
+    return str(size)
+
+
+def generate_corpus(size: int, annotations: bool = True, book_marks: bool = True, controls: bool = True,
+                    rare_density: float = 0.0, seed: int = 0,
+                    chapter_bytes: int = CHAPTER_BYTES) -> List[str]:
+    """
+    生成合成文本
+
+    Args:
+        size: 目标大小（UTF-8字节数），按整段生成，略有超出
+        annotations: 是否包含【批注】
+        book_marks: 是否包含《书名》
+        controls: 是否包含$%&排版控制符
+        rare_density: 生僻字占正文的比例，0到1
+        seed: 随机种子
+        chapter_bytes: 每章大小
+
+    Returns:
+        List[str]: 各章文本，段落之间换行
+    """
+    rng = random.Random(seed)
+    rare_count = RARE_RANGE[1] - RARE_RANGE[0] + 1
+
+    def words(n):
+        chars = rng.choices(COMMON_CHARS, k=n)
+        if rare_density > 0:
+            for i in range(n):
+                if rng.random() < rare_density:
+                    chars[i] = chr(RARE_RANGE[0] + rng.randrange(rare_count))
+        return ''.join(chars)
+
+    def paragraph():
+        parts = []
+        remain = rng.randint(*PARAGRAPH_CHARS)
+        while remain > 0:
+            n = min(remain, rng.randint(4, 16))
+            sentence = words(n)
+            if book_marks and rng.random() < 0.08:
+                sentence = f"《{words(rng.randint(2, 5))}》{sentence}"
+            if annotations and rng.random() < 0.15:
+                sentence += f"【{words(rng.randint(4, 30))}】"
+            parts.append(sentence + rng.choice(PUNCTUATION))
+            remain -= n
+        if controls and rng.random() < 0.02:
+            parts.append(rng.choice(CONTROLS))
+        return ''.join(parts)
+
+    chapters = []
+    total = 0
+    while total < size:
+        lines = []
+        chapter_size = 0
+        while chapter_size < chapter_bytes and total + chapter_size < size:
+            line = paragraph()
+            lines.append(line)
+            chapter_size += len(line.encode('utf-8')) + 1
+        chapters.append('\n'.join(lines) + '\n')
+        total += chapter_size
+    return chapters
+
+
+def novel_text(chapters: List[str]) -> str:
+    """小说章节模式的文本：每章前加“第N章 标题”"""
+    return ''.join(f"第{i}章 合成文本{i}\n{chapter}" for i, chapter in enumerate(chapters, 1))
+
+
+def list_canvases(canvas_dir='canvas') -> List[str]:
+    """canvas目录下有背景图配置和背景图片的背景ID"""
+    return sorted(path.stem for path in Path(canvas_dir).glob('*.cfg')
+                  if path.with_suffix('.jpg').exists())
+
+
+def peak_rss() -> Optional[int]:
+    """当前进程的内存峰值（字节），无法获取时为None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    运行一个用例（在子进程中调用）：生成文本后计时排版，输出写入临时文件
+
+    Args:
+        case: engine、canvas、book_id、test_pages和corpus（generate_corpus的参数）
+
+    Returns:
+        Dict[str, Any]: case的各项，加上ok、error、corpus_chars、chars、seconds、cpu_seconds、pages、
+            chars_per_sec、pages_per_sec、rss_before、rss_corpus、peak_rss、output_bytes。
+            chars为构建报告中实际绘制的字数（-z只输出部分页时远小于corpus_chars）；
+            rss_before在生成文本之前取得，rss_corpus为生成文本之后的内存峰值
+    """
+    import io
+    import contextlib
+    from vrainAPI import VRainError, render_book, render_novel
+
+    result = dict(case, ok=False, error=None)
+    result['rss_before'] = peak_rss()
+    chapters = generate_corpus(**case['corpus'])
+    result['corpus_chars'] = sum(len(chapter) for chapter in chapters)
+    result['rss_corpus'] = peak_rss()
+    result['chars'] = 0
+
+    overrides = {'canvas_id': case['canvas']}
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / 'bench.pdf'
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                if case['engine'] == JOB_NOVEL:
+                    render_novel(novel_text(chapters), f"books/{case['book_id']}/book.cfg",
+                                 overrides=overrides, output=output, test_pages=case['test_pages'],
+                                 report_callback=reports.append)
+                else:
+                    render_book(case['book_id'], overrides=overrides, texts=chapters, output=output,
+                                test_pages=case['test_pages'], report_callback=reports.append)
+            result['ok'] = True
+        except VRainError as e:
+            result['error'] = str(e)
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+        result['seconds'] = time.perf_counter() - start
+        result['cpu_seconds'] = time.process_time() - cpu_start
+        result['peak_rss'] = peak_rss()
+
+        result['pages'] = 0
+        result['output_bytes'] = 0
+        if result['ok']:
+            from PyPDF2 import PdfReader
+            result['output_bytes'] = output.stat().st_size
+            result['pages'] = len(PdfReader(str(output)).pages)
+            result['chars'] = reports[0]['counters']['glyphs']
+
+    seconds = result['seconds'] or float('nan')
+    result['chars_per_sec'] = result['chars'] / seconds if result['ok'] else 0.0
+    result['pages_per_sec'] = result['pages'] / seconds if result['ok'] else 0.0
+    return result
+
+
+def case_key(result: Dict[str, Any]):
+    """用于与基线比较的用例标识"""
+    corpus = result['corpus']
+    return (result['engine'], result['canvas'], result['test_pages'],
+            tuple(sorted((k, v) for k, v in corpus.items())))
+
+
+def run_benchmark(engines: List[str], canvases: List[str], sizes: List[int], book_id: str = '01',
+                  annotations: bool = True, book_marks: bool = True, controls: bool = True,
+                  rare_density: float = 0.0, seed: int = 0, test_pages: Optional[int] = None,
+                  repeat: int = 1) -> Dict[str, Any]:
+    """
+    运行全部用例：engines × canvases × sizes，每个用例重复repeat次
+
+    Args:
+        engines: 排版模式，perfect或novel
+        canvases: 背景ID
+        sizes: 合成文本大小（字节）
+        book_id: 提供book.cfg和字体的书籍
+        annotations: 是否包含【批注】
+        book_marks: 是否包含《书名》
+        controls: 是否包含$%&排版控制符
+        rare_density: 生僻字比例
+        seed: 随机种子
+        test_pages: 每个用例只输出指定页数，None为全部
+        repeat: 重复次数
+
+    Returns:
+        Dict[str, Any]: meta（运行环境）和results（每次运行的结果）
+    """
+    from vrain import SOFTWARE, VERSION
+
+    cases = []
+    for size in sizes:
+        corpus = {'size': size, 'annotations': annotations, 'book_marks': book_marks,
+                  'controls': controls, 'rare_density': rare_density, 'seed': seed}
+        for engine in engines:
+            for canvas_id in canvases:
+                cases.append({'engine': engine, 'canvas': canvas_id, 'book_id': book_id,
+                              'test_pages': test_pages, 'corpus': corpus})
+
+    results = []
+    total = len(cases) * repeat
+    for i, case in enumerate(case for case in cases for _ in range(repeat)):
+        # 每次运行使用新的子进程，缓存和内存峰值互不影响
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            result = executor.submit(run_case, case).result()
+        results.append(result)
+        status = (f"{result['seconds']:.2f}秒 {result['chars_per_sec']:.0f}字/秒 "
+                  f"{result['pages_per_sec']:.2f}页/秒" if result['ok'] else f"失败：{result['error']}")
+        print(f"[{i + 1}/{total}] {case['engine']} {case['canvas']} {format_size(case['corpus']['size'])} "
+              f"{status}", file=sys.stderr)
+
+    return {
+        'meta': {
+            'software': f"{SOFTWARE}{VERSION}",
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'book_id': book_id,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """
+    与基线比较每秒字数和内存峰值，同一用例多次运行取最好的一次
+
+    Args:
+        report: 本次结果
+        baseline: 基线结果（之前保存的JSON）
+
+    Returns:
+        List[str]: 每个用例一行
+    """
+    def best(results):
+        table = {}
+        for r in results:
+            if r['ok']:
+                key = case_key(r)
+                if key not in table or r['chars_per_sec'] > table[key]['chars_per_sec']:
+                    table[key] = r
+        return table
+
+    old, new = best(baseline['results']), best(report['results'])
+    lines = []
+    for key, r in new.items():
+        name = f"{r['engine']} {r['canvas']} {format_size(r['corpus']['size'])}"
+        if key not in old:
+            lines.append(f"{name}：基线中无此用例")
+            continue
+        b = old[key]
+        line = f"{name}：{b['chars_per_sec']:.0f} -> {r['chars_per_sec']:.0f}字/秒（{r['chars_per_sec'] / b['chars_per_sec']:.2f}倍）"
+        if b.get('peak_rss') and r.get('peak_rss'):
+            line += f"，内存峰值{b['peak_rss'] / 1024 / 1024:.0f}MB -> {r['peak_rss'] / 1024 / 1024:.0f}MB"
+        lines.append(line)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='vRain排版与渲染性能基准')
+    parser.add_argument('--engines', default=','.join(ENGINES), help=f"排版模式，默认{','.join(ENGINES)}")
+    parser.add_argument('--canvas', help='背景ID，逗号分隔，默认为canvas目录下全部背景')
+    parser.add_argument('--sizes', default='1M', help='合成文本大小，逗号分隔，例如256K,1M,100M，默认1M')
+    parser.add_argument('-b', '--book', default='01', help='提供book.cfg和字体的书籍ID，默认01')
+    parser.add_argument('--no-annotations', action='store_true', help='不含【批注】')
+    parser.add_argument('--no-book-marks', action='store_true', help='不含《书名》')
+    parser.add_argument('--no-controls', action='store_true', help='不含$%%&排版控制符')
+    parser.add_argument('--rare', type=float, default=0.0, help='生僻字比例（0到1），默认0')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，默认0')
+    parser.add_argument('-z', type=int, help='每个用例只输出指定页数')
+    parser.add_argument('--repeat', type=int, default=1, help='每个用例重复次数，默认1')
+    parser.add_argument('-o', '--output', help='结果JSON文件，默认输出到标准输出')
+    parser.add_argument('--compare', help='与之前保存的结果JSON比较')
+    args = parser.parse_args()
+
+    try:
+        engines = [e for e in args.engines.split(',') if e]
+        unknown = [e for e in engines if e not in ENGINES]
+        if unknown:
+            raise ValueError(f"未知的排版模式：{','.join(unknown)}")
+        sizes = [parse_size(s) for s in args.sizes.split(',') if s]
+        canvases = args.canvas.split(',') if args.canvas else list_canvases()
+        missing = [c for c in canvases if not Path(f"canvas/{c}.cfg").exists()]
+        if missing:
+            raise ValueError(f"未发现背景图配置：{','.join(missing)}")
+        if not 0 <= args.rare <= 1:
+            raise ValueError('生僻字比例应在0到1之间')
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        sys.exit(1)
+
+    report = run_benchmark(engines, canvases, sizes, book_id=args.book,
+                           annotations=not args.no_annotations, book_marks=not args.no_book_marks,
+                           controls=not args.no_controls, rare_density=args.rare, seed=args.seed,
+                           test_pages=args.z, repeat=max(1, args.repeat))
+
+    data = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(data, encoding='utf-8')
+        print(f"结果已保存到'{args.output}'", file=sys.stderr)
+    else:
+        print(data)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        for line in compare(report, baseline):
+            print(line, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
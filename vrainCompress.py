@@ -0,0 +1,680 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+vRain PDF压缩模块
+Python版本 by msyloveldx, 2025/08
+
+在进程内对生成的PDF文件做流级别的后处理，不依赖Ghostscript，任何平台均可使用。
+主要功能包括：
+- 去掉ASCII85/ASCIIHex编码层，数据流统一以最高压缩级别重新Flate压缩
+- 合并内容完全相同的重复对象，丢弃不再被引用的对象
+- 按页面上的实际显示尺寸将背景等JPEG图片降采样到目标DPI
+- 检查嵌入字体是否为子集、字体数据是否完整
+- 后台压缩队列，压缩与下一本书的排版重叠进行
+"""
+
+import binascii
+import hashlib
+import math
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Any, Union
+
+from PIL import Image
+from PyPDF2 import PdfReader
+from PyPDF2.generic import DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject
+
+# 默认目标分辨率与JPEG质量，对应Ghostscript的/screen预设
+DEFAULT_DPI = 72
+DEFAULT_JPEG_QUALITY = 75
+# 图片分辨率超过目标DPI的倍数达到该阈值时才降采样，与Ghostscript的默认阈值一致
+DOWNSAMPLE_THRESHOLD = 1.5
+
+# 可以去掉的文本编码层
+_ASCII_FILTERS = ('/ASCII85Decode', '/ASCIIHexDecode')
+# 内容流中与图片显示尺寸有关的操作：q、Q、cm、Do，以及内嵌图片BI；字符串整体跳过
+_CONTENT_OPS = re.compile(
+    rb"\((?:\\.|[^\\()])*\)"
+    rb"|(?<![^\s])(q|Q|BI)(?![^\s])"
+    rb"|((?:[-+]?(?:\d+\.?\d*|\.\d+)\s+){6})cm(?![^\s])"
+    rb"|/([^\s/\[\]()<>{}%]+)\s*Do(?![^\s])", re.S)
+# ASCII85解码表：字符值减33
+_A85_TABLE = bytes((i - 33) % 256 for i in range(256))
+# 字体子集名前缀，如 /AAAAAA+PingXianZhenSong
+_SUBSET_TAG = re.compile(r'^/?[A-Z]{6}\+')
+# 合法的字体文件头：TrueType、OpenType(CFF)、Apple TrueType、Type1
+_FONT_MAGICS = (b'\x00\x01\x00\x00', b'OTTO', b'true', b'typ1', b'%!')
+
+ObjKey = Tuple[int, int]
+
+
+def _a85decode(data: bytes) -> bytes:
+    """ASCII85解码，按5字节一组批量计算，比逐字节解码快得多"""
+    data = re.sub(rb'\s', b'', data)
+    if data.startswith(b'<~'):
+        data = data[2:]
+    if data.endswith(b'~>'):
+        data = data[:-2]
+    data = data.replace(b'z', b'!!!!!')
+    pad = -len(data) % 5
+    t = (data + b'u' * pad).translate(_A85_TABLE)
+    values = [(((t[i] * 85 + t[i + 1]) * 85 + t[i + 2]) * 85 + t[i + 3]) * 85 + t[i + 4]
+              for i in range(0, len(t), 5)]
+    out = struct.pack(f'>{len(values)}L', *values)
+    return out[:len(out) - pad] if pad else out
+
+
+def _key(ref: IndirectObject) -> ObjKey:
+    return (ref.idnum, ref.generation)
+
+
+def _filters(obj: DictionaryObject) -> List[str]:
+    """读取数据流的过滤器列表"""
+    f = obj.get('/Filter')
+    if f is None:
+        return []
+    f = f.get_object()
+    if isinstance(f, list):
+        return [str(x.get_object()) for x in f]
+    return [str(f)]
+
+
+def _strip_ascii(data: bytes, filters: List[str]) -> Tuple[Optional[bytes], List[str]]:
+    """
+    解掉数据流最外层的ASCII编码
+
+    Args:
+        data: 原始数据
+        filters: 过滤器列表
+
+    Returns:
+        (解码后的数据, 剩余过滤器)，无法解码时数据为None
+    """
+    while filters and filters[0] in _ASCII_FILTERS:
+        try:
+            if filters[0] == '/ASCII85Decode':
+                data = _a85decode(data)
+            else:
+                data = re.sub(rb'\s', b'', data).rstrip(b'>')
+                if len(data) % 2:
+                    data += b'0'
+                data = binascii.unhexlify(data)
+        except (ValueError, binascii.Error, struct.error):
+            return None, filters
+        filters = filters[1:]
+    return data, filters
+
+
+def _decode(data: bytes, filters: List[str]) -> Optional[bytes]:
+    """解码为原始数据，只处理ASCII编码与不带参数的Flate压缩"""
+    data, filters = _strip_ascii(data, filters)
+    if data is None:
+        return None
+    if filters == ['/FlateDecode']:
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return None
+    return data if not filters else None
+
+
+def _multiply(m: Tuple[float, ...], ctm: Tuple[float, ...]) -> Tuple[float, ...]:
+    """矩阵相乘：m × ctm"""
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = ctm
+    return (a * A + b * C, a * B + b * D,
+            c * A + d * C, c * B + d * D,
+            e * A + f * C + E, e * B + f * D + F)
+
+
+def _scan_image_sizes(content: bytes, xobjects: Dict[str, ObjKey],
+                      sizes: Dict[ObjKey, Tuple[float, float]]) -> bool:
+    """
+    扫描页面内容流，记录每张图片的最大显示尺寸（PDF单位）
+
+    Args:
+        content: 解码后的内容流
+        xobjects: 页面资源中图片名到对象编号的映射
+        sizes: 输出，对象编号到(宽, 高)的映射
+
+    Returns:
+        bool: 内容流能否完整解析（含内嵌图片时返回False）
+    """
+    # 只需扫描到最后一个Do为止，背景图通常在页首绘制，正文文字部分可整体跳过
+    end = content.rfind(b'Do')
+    if end < 0:
+        return b'BI' not in content
+    ctm = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    stack = []
+    for m in _CONTENT_OPS.finditer(content, 0, end + 2):
+        op, matrix, name = m.groups()
+        if op == b'q':
+            stack.append(ctm)
+        elif op == b'Q':
+            if stack:
+                ctm = stack.pop()
+        elif op == b'BI':
+            return False
+        elif matrix:
+            ctm = _multiply(tuple(float(v) for v in matrix.split()), ctm)
+        elif name:
+            key = xobjects.get(name.decode('latin-1'))
+            if key:
+                w = math.hypot(ctm[0], ctm[1])
+                h = math.hypot(ctm[2], ctm[3])
+                ow, oh = sizes.get(key, (0.0, 0.0))
+                sizes[key] = (max(ow, w), max(oh, h))
+    return True
+
+
+def _downsample_jpeg(data: bytes, target_width: int, quality: int) -> Optional[Tuple[bytes, int, int]]:
+    """
+    将JPEG图片缩小到目标宽度
+
+    Returns:
+        (新数据, 宽, 高)，不适合处理或结果没有变小时返回None
+    """
+    with Image.open(BytesIO(data)) as img:
+        if img.mode not in ('L', 'RGB'):
+            return None
+        width, height = img.size
+        new_height = max(1, int(round(height * target_width / width)))
+        resized = img.resize((target_width, new_height), Image.LANCZOS)
+    buf = BytesIO()
+    resized.save(buf, format='JPEG', quality=quality, optimize=True)
+    new_data = buf.getvalue()
+    if len(new_data) >= len(data):
+        return None
+    return new_data, target_width, new_height
+
+
+class PDFCompressor:
+    """
+    PDF流级压缩器
+
+    读取PDF的全部对象，就地改写数据流后按新编号重新写出文件。
+    """
+
+    def __init__(self, dpi: int = DEFAULT_DPI, jpeg_quality: int = DEFAULT_JPEG_QUALITY):
+        """
+        初始化压缩器
+
+        Args:
+            dpi: 图片降采样的目标分辨率，0表示不降采样
+            jpeg_quality: 降采样后JPEG的编码质量
+        """
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+
+    def compress(self, input_path: Union[str, Path], output_path: Union[str, Path]) -> Dict[str, Any]:
+        """
+        压缩PDF文件
+
+        Args:
+            input_path: 输入PDF路径
+            output_path: 输出PDF路径
+
+        Returns:
+            Dict[str, Any]: 压缩统计，包括前后大小、重压缩数据流数、降采样图片数、
+            合并重复对象数、字体检查结果和警告信息
+        """
+        start = time.time()
+        input_path = Path(input_path)
+        output_path = Path(output_path)
+
+        reader = PdfReader(str(input_path))
+        if reader.is_encrypted:
+            raise ValueError(f"不支持加密的PDF文件：{input_path}")
+
+        self.stats = {
+            'input_size': input_path.stat().st_size,
+            'streams_recompressed': 0,
+            'images_downsampled': 0,
+            'duplicates_removed': 0,
+            'fonts_subset': [],
+            'fonts_full': [],
+            'fonts_not_embedded': [],
+            'warnings': [],
+        }
+
+        root = reader.trailer.get('/Root')
+        info = reader.trailer.get('/Info')
+        objects = self._collect(reader, [r for r in (root, info) if isinstance(r, IndirectObject)])
+        self.stats['objects_in'] = len(objects)
+
+        decoded = self._decode_streams(objects)
+        if self.dpi:
+            self._downsample_images(reader, objects, decoded)
+        self._check_fonts(objects, decoded)
+        self._recompress_streams(objects, decoded)
+        canon = self._deduplicate(objects)
+
+        data = self._write(reader, objects, canon, root, info)
+        if len(data) < self.stats['input_size']:
+            output_path.write_bytes(data)
+            self.stats['output_size'] = len(data)
+        else:
+            # 已无压缩余地时保留原文件内容
+            if input_path.resolve() != output_path.resolve():
+                shutil.copyfile(input_path, output_path)
+            self.stats['output_size'] = self.stats['input_size']
+
+        self.stats['elapsed'] = time.time() - start
+        return self.stats
+
+    def _collect(self, reader: PdfReader, refs: List[IndirectObject]) -> Dict[ObjKey, Any]:
+        """从文档根出发收集全部可达的间接对象"""
+        objects: Dict[ObjKey, Any] = {}
+        todo = list(refs)
+        while todo:
+            ref = todo.pop()
+            key = _key(ref)
+            if key in objects:
+                continue
+            obj = reader.get_object(ref)
+            if obj is None:
+                continue
+            objects[key] = obj
+            stack = [obj]
+            while stack:
+                cur = stack.pop()
+                if isinstance(cur, IndirectObject):
+                    if _key(cur) not in objects:
+                        todo.append(cur)
+                elif isinstance(cur, dict):
+                    stack.extend(dict.values(cur))
+                elif isinstance(cur, list):
+                    stack.extend(cur)
+        return objects
+
+    def _decode_streams(self, objects: Dict[ObjKey, Any]) -> Dict[ObjKey, bytes]:
+        """解码全部可处理的数据流（JPEG图片只去掉ASCII编码层）"""
+        decoded = {}
+        for key, obj in objects.items():
+            if not isinstance(obj, StreamObject) or '/DecodeParms' in obj:
+                continue
+            filters = _filters(obj)
+            if filters and filters[-1] == '/DCTDecode':
+                data, rest = _strip_ascii(obj._data, filters)
+                if data is not None and rest != filters:
+                    obj._data = data
+                    obj[NameObject('/Filter')] = NameObject('/DCTDecode')
+                continue
+            data = _decode(obj._data, filters)
+            if data is not None:
+                decoded[key] = data
+        return decoded
+
+    def _downsample_images(self, reader: PdfReader, objects: Dict[ObjKey, Any],
+                           decoded: Dict[ObjKey, bytes]):
+        """按页面上的显示尺寸将JPEG图片降采样到目标DPI"""
+        sizes: Dict[ObjKey, Tuple[float, float]] = {}
+        unknown = set()
+
+        for page in reader.pages:
+            resources = page.get('/Resources')
+            resources = resources.get_object() if resources is not None else {}
+            xobject_dict = resources.get('/XObject')
+            if xobject_dict is None:
+                continue
+            xobjects = {}
+            for name, ref in dict.items(xobject_dict.get_object()):
+                if isinstance(ref, IndirectObject):
+                    xobjects[str(name)[1:]] = _key(ref)
+            if not xobjects:
+                continue
+
+            # 内容流可能是单个引用，也可能是引用数组
+            contents = page.get('/Contents')
+            if contents is None:
+                continue
+            parts = contents.get_object()
+            if not isinstance(parts, list):
+                parts = [contents]
+            content = b''
+            for part in parts:
+                data = decoded.get(_key(part)) if isinstance(part, IndirectObject) else None
+                if data is None:
+                    content = None
+                    break
+                content += data + b'\n'
+
+            if content is None or not _scan_image_sizes(content, xobjects, sizes):
+                unknown.update(xobjects.values())
+
+        for key, (w_pt, h_pt) in sizes.items():
+            obj = objects.get(key)
+            if key in unknown or not isinstance(obj, StreamObject) or obj.get('/Subtype') != '/Image':
+                continue
+            if _filters(obj) != ['/DCTDecode'] or '/SMask' in obj or '/Mask' in obj or w_pt <= 0:
+                continue
+
+            width = int(obj.get('/Width', 0))
+            target_width = int(math.ceil(w_pt / 72 * self.dpi))
+            if target_width <= 0 or width < target_width * DOWNSAMPLE_THRESHOLD:
+                continue
+
+            try:
+                result = _downsample_jpeg(obj._data, target_width, self.jpeg_quality)
+            except Exception as e:
+                self.stats['warnings'].append(f"图片{key[0]}降采样失败：{e}")
+                continue
+            if result:
+                obj._data, new_width, new_height = result
+                obj[NameObject('/Width')] = NumberObject(new_width)
+                obj[NameObject('/Height')] = NumberObject(new_height)
+                self.stats['images_downsampled'] += 1
+
+    def _check_fonts(self, objects: Dict[ObjKey, Any], decoded: Dict[ObjKey, bytes]):
+        """检查字体：嵌入的是否为子集，字体数据是否完整"""
+        for obj in objects.values():
+            if not isinstance(obj, dict) or obj.get('/Type') != '/Font':
+                continue
+            if obj.get('/Subtype') == '/Type0':
+                continue  # 由其后代CIDFont检查
+            base_font = str(obj.get('/BaseFont', ''))
+            descriptor = obj.get('/FontDescriptor')
+            if descriptor is None:
+                if obj.get('/Subtype') not in ('/Type1', '/Type3'):
+                    self.stats['fonts_not_embedded'].append(base_font)
+                    self.stats['warnings'].append(f"字体{base_font}未嵌入，其他设备上可能无法正常显示")
+                continue  # 标准14字体无需嵌入
+
+            descriptor = descriptor.get_object()
+            font_file = None
+            for k in ('/FontFile2', '/FontFile3', '/FontFile'):
+                if isinstance(descriptor.get(k), IndirectObject):
+                    font_file = _key(descriptor.get(k))
+                    break
+            if font_file is None:
+                self.stats['fonts_not_embedded'].append(base_font)
+                self.stats['warnings'].append(f"字体{base_font}未嵌入，其他设备上可能无法正常显示")
+                continue
+
+            if _SUBSET_TAG.match(base_font):
+                self.stats['fonts_subset'].append(base_font)
+            else:
+                self.stats['fonts_full'].append(base_font)
+                self.stats['warnings'].append(f"字体{base_font}为完整嵌入而非子集，文件体积会明显增大")
+
+            data = decoded.get(font_file)
+            if data is not None and k != '/FontFile3' and not data.startswith(_FONT_MAGICS):
+                self.stats['warnings'].append(f"字体{base_font}的嵌入数据无法识别，可能已损坏")
+
+    def _recompress_streams(self, objects: Dict[ObjKey, Any], decoded: Dict[ObjKey, bytes]):
+        """以最高压缩级别重新Flate压缩，比原数据小时才替换"""
+        for key, data in decoded.items():
+            obj = objects[key]
+            new_data = zlib.compress(data, 9)
+            if len(new_data) < len(obj._data):
+                obj._data = new_data
+                obj[NameObject('/Filter')] = NameObject('/FlateDecode')
+                self.stats['streams_recompressed'] += 1
+
+    def _fingerprint(self, obj: Any, canon: Dict[ObjKey, ObjKey]) -> Any:
+        """对象内容指纹，引用按当前的合并结果归一"""
+        if isinstance(obj, IndirectObject):
+            return ('R', self._find(_key(obj), canon))
+        if isinstance(obj, StreamObject):
+            items = tuple(sorted((k, self._fingerprint(v, canon))
+                                 for k, v in dict.items(obj) if k != '/Length'))
+            return ('S', items, hashlib.sha1(obj._data).digest())
+        if isinstance(obj, dict):
+            return ('D', tuple(sorted((k, self._fingerprint(v, canon)) for k, v in dict.items(obj))))
+        if isinstance(obj, list):
+            return ('A', tuple(self._fingerprint(v, canon) for v in obj))
+        return (type(obj).__name__, repr(obj))
+
+    @staticmethod
+    def _find(key: ObjKey, canon: Dict[ObjKey, ObjKey]) -> ObjKey:
+        while key in canon:
+            key = canon[key]
+        return key
+
+    def _deduplicate(self, objects: Dict[ObjKey, Any]) -> Dict[ObjKey, ObjKey]:
+        """合并内容相同的对象，反复进行直到没有新的重复（子对象合并后父对象可能变得相同）"""
+        canon: Dict[ObjKey, ObjKey] = {}
+        while True:
+            seen = {}
+            merged = 0
+            for key, obj in objects.items():
+                if key in canon:
+                    continue
+                if isinstance(obj, dict) and obj.get('/Type') in ('/Page', '/Pages', '/Catalog'):
+                    continue
+                fp = self._fingerprint(obj, canon)
+                if fp in seen:
+                    canon[key] = seen[fp]
+                    merged += 1
+                else:
+                    seen[fp] = key
+            self.stats['duplicates_removed'] += merged
+            if not merged:
+                return canon
+
+    def _rewrite(self, obj: Any, numbers: Dict[ObjKey, int]) -> Any:
+        """将对象中的引用替换为新编号"""
+        if isinstance(obj, IndirectObject):
+            return IndirectObject(numbers[_key(obj)], 0, None)
+        if isinstance(obj, dict):
+            for k, v in list(dict.items(obj)):
+                dict.__setitem__(obj, k, self._rewrite(v, numbers))
+        elif isinstance(obj, list):
+            for i, v in enumerate(obj):
+                obj[i] = self._rewrite(v, numbers)
+        return obj
+
+    def _write(self, reader: PdfReader, objects: Dict[ObjKey, Any], canon: Dict[ObjKey, ObjKey],
+               root: IndirectObject, info: Optional[IndirectObject]) -> bytes:
+        """按合并结果重新编号，只写出可达的对象"""
+        # 先归一全部引用，再从根出发按引用顺序编号
+        def resolve(obj):
+            if isinstance(obj, IndirectObject):
+                k = self._find(_key(obj), canon)
+                return IndirectObject(k[0], k[1], None)
+            if isinstance(obj, dict):
+                for k, v in list(dict.items(obj)):
+                    dict.__setitem__(obj, k, resolve(v))
+            elif isinstance(obj, list):
+                for i, v in enumerate(obj):
+                    obj[i] = resolve(v)
+            return obj
+
+        for key, obj in objects.items():
+            if key not in canon:
+                resolve(obj)
+
+        order: List[ObjKey] = []
+        numbers: Dict[ObjKey, int] = {}
+        todo = [self._find(_key(r), canon) for r in (info, root) if isinstance(r, IndirectObject)]
+        while todo:
+            key = todo.pop()
+            if key in numbers:
+                continue
+            numbers[key] = len(order) + 1
+            order.append(key)
+            stack = [objects[key]]
+            refs = []
+            while stack:
+                cur = stack.pop()
+                if isinstance(cur, IndirectObject):
+                    refs.append(_key(cur))
+                elif isinstance(cur, dict):
+                    stack.extend(dict.values(cur))
+                elif isinstance(cur, list):
+                    stack.extend(cur)
+            todo.extend(k for k in reversed(refs) if k not in numbers)
+
+        for key in order:
+            self._rewrite(objects[key], numbers)
+        self.stats['objects_out'] = len(order)
+
+        out = BytesIO()
+        header = reader.pdf_header or '%PDF-1.4'
+        out.write(header.encode('latin-1') + b'\n%\xe2\xe3\xcf\xd3\n')
+        positions = []
+        for i, key in enumerate(order, 1):
+            positions.append(out.tell())
+            out.write(f"{i} 0 obj\n".encode('ascii'))
+            objects[key].write_to_stream(out, None)
+            out.write(b"\nendobj\n")
+
+        xref = out.tell()
+        out.write(f"xref\n0 {len(order) + 1}\n".encode('ascii'))
+        out.write(b"0000000000 65535 f \n")
+        for pos in positions:
+            out.write(f"{pos:010d} 00000 n \n".encode('ascii'))
+
+        trailer = DictionaryObject()
+        trailer[NameObject('/Size')] = NumberObject(len(order) + 1)
+        trailer[NameObject('/Root')] = IndirectObject(numbers[self._find(_key(root), canon)], 0, None)
+        if isinstance(info, IndirectObject):
+            trailer[NameObject('/Info')] = IndirectObject(numbers[self._find(_key(info), canon)], 0, None)
+        if '/ID' in reader.trailer:
+            trailer[NameObject('/ID')] = reader.trailer['/ID']
+        out.write(b"trailer\n")
+        trailer.write_to_stream(out, None)
+        out.write(f"\nstartxref\n{xref}\n%%EOF\n".encode('ascii'))
+        return out.getvalue()
+
+
+def compress_pdf(input_path: Union[str, Path], output_path: Union[str, Path],
+                 dpi: int = DEFAULT_DPI, jpeg_quality: int = DEFAULT_JPEG_QUALITY) -> Dict[str, Any]:
+    """
+    压缩PDF文件
+
+    Args:
+        input_path: 输入PDF路径
+        output_path: 输出PDF路径
+        dpi: 图片降采样的目标分辨率，0表示不降采样
+        jpeg_quality: 降采样后JPEG的编码质量
+
+    Returns:
+        Dict[str, Any]: 压缩统计
+    """
+    return PDFCompressor(dpi, jpeg_quality).compress(input_path, output_path)
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """
+    格式化压缩统计，用于打印
+
+    Args:
+        stats: compress_pdf返回的统计
+
+    Returns:
+        str: 一行摘要
+    """
+    before = stats['input_size']
+    after = stats['output_size']
+    ratio = after / before * 100 if before else 100
+    return (f"{before / 1024:.0f}KB -> {after / 1024:.0f}KB（{ratio:.0f}%），"
+            f"重压缩{stats['streams_recompressed']}个数据流，"
+            f"降采样{stats['images_downsampled']}张图片，"
+            f"合并{stats['duplicates_removed']}个重复对象，"
+            f"耗时{stats['elapsed']:.2f}秒")
+
+
+def _compress_job(input_path: str, output_path: str, dpi: int, jpeg_quality: int,
+                  remove_input: bool) -> Dict[str, Any]:
+    """后台压缩任务（在工作进程中执行）"""
+    stats = compress_pdf(input_path, output_path, dpi, jpeg_quality)
+    if remove_input:
+        Path(input_path).unlink()
+    return stats
+
+
+class CompressQueue:
+    """
+    后台压缩队列
+
+    PDF保存后交给后台进程压缩，主进程继续排版下一本书或下一卷，渲染与压缩重叠进行。
+    排队中和压缩中的文件数有上限，达到上限时submit阻塞，避免排版远快于压缩时积压过多文件；
+    drain等待全部压缩完成并按提交顺序返回结果。
+    """
+
+    def __init__(self, workers: int = 1, max_pending: int = 2, dpi: int = DEFAULT_DPI,
+                 jpeg_quality: int = DEFAULT_JPEG_QUALITY, remove_input: bool = True,
+                 on_done=None):
+        """
+        初始化压缩队列
+
+        Args:
+            workers: 后台压缩进程数
+            max_pending: 排队中和压缩中的文件数上限
+            dpi: 图片降采样的目标分辨率
+            jpeg_quality: 降采样后JPEG的编码质量
+            remove_input: 压缩成功后是否删除原文件
+            on_done: 单个文件压缩结束时的回调，参数为该文件的结果字典（在后台线程中调用）
+        """
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+        self.remove_input = remove_input
+        self.on_done = on_done
+        self._executor = ProcessPoolExecutor(max_workers=max(1, workers))
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._jobs: List[Tuple[str, str, Future]] = []
+
+    def submit(self, input_path: Union[str, Path], output_path: Union[str, Path]) -> Future:
+        """
+        提交一个待压缩文件，队列已满时等待空位
+
+        Args:
+            input_path: 输入PDF路径
+            output_path: 输出PDF路径
+
+        Returns:
+            Future: 压缩任务，结果为压缩统计
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(_compress_job, str(input_path), str(output_path),
+                                           self.dpi, self.jpeg_quality, self.remove_input)
+        except Exception:
+            self._slots.release()
+            raise
+        job = (str(input_path), str(output_path), future)
+        self._jobs.append(job)
+        future.add_done_callback(lambda f, job=job: self._finish(job))
+        return future
+
+    def _finish(self, job: Tuple[str, str, Future]):
+        """单个任务结束：释放队列空位并回调"""
+        self._slots.release()
+        if self.on_done:
+            self.on_done(self._result(job))
+
+    @staticmethod
+    def _result(job: Tuple[str, str, Future]) -> Dict[str, Any]:
+        input_path, output_path, future = job
+        result = {'input': input_path, 'output': output_path}
+        error = future.exception()
+        if error is not None:
+            result['error'] = str(error)
+        else:
+            result['stats'] = future.result()
+        return result
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """
+        等待全部压缩完成并关闭后台进程
+
+        Returns:
+            List[Dict[str, Any]]: 按提交顺序排列的结果，成功时含stats，失败时含error
+        """
+        self._executor.shutdown(wait=True)
+        return [self._result(job) for job in self._jobs]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.drain()
+        return False
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+构建任务队列
+
+GUI把多本书或多个文本范围的生成任务排入队列，由若干工作进程并行执行，
+排版不再与Tk的事件循环争用GIL。每个工作进程持有一个引擎会话（vrainSession），
+同一进程中先后执行的任务复用已注册的字体和预处理文本。
+各任务的进度和日志经Manager队列回到主进程，再转发到GUI的消息队列：
+    ('job_progress', (任务编号, 进度字典))
+    ('job_log', (任务编号, 一批日志行，以换行分隔))
+    ('job_state', 任务编号)
+排队中的任务可以调整顺序或取消；运行中的任务取消后在下一个页边界停止。
+"""
+
+import io
+import contextlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from vrainLog import RingSink
+from vrainProgress import BuildCancelled, CancelToken
+
+# 任务类型
+JOB_PERFECT = 'perfect'
+JOB_NOVEL = 'novel'
+
+# 任务状态
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+# 任务日志批量发送的间隔（秒）
+JOB_LOG_INTERVAL = 0.2
+
+STATUS_NAMES = {
+    STATUS_QUEUED: '排队中',
+    STATUS_RUNNING: '运行中',
+    STATUS_DONE: '完成',
+    STATUS_FAILED: '失败',
+    STATUS_CANCELLED: '已取消',
+}
+
+
+def build_perfect(params: Dict[str, Any], session=None, progress_callback=None, cancel_token=None,
+                  profile_log=None) -> str:
+    """
+    传统古籍模式生成，流程与vrain.py命令行一致
+
+    Args:
+        params: book_id、from_page、to_page、test_pages（0或None为正常模式）、compress、verbose、
+            profile（性能分析模式，见vrainProfile，None为不分析）
+        session: 引擎会话
+        progress_callback: 进度回调
+        cancel_token: 取消令牌
+        profile_log: 性能分析结果的输出函数，默认打印
+
+    Returns:
+        str: 输出PDF路径
+    """
+    from vrain import VRainPerfect
+
+    book_id = params['book_id']
+    vrain = VRainPerfect(session=session)
+    vrain.progress_callback = progress_callback
+    vrain.cancel_token = cancel_token
+    vrain.opts = {
+        'b': book_id,
+        'f': params['from_page'],
+        't': params['to_page'],
+        'z': params.get('test_pages') or None,
+        'c': params.get('compress', False),
+        'v': params.get('verbose', False),
+    }
+
+    vrain.load_zh_numbers()
+    vrain.check_directories(book_id)
+    return _profiled(lambda: vrain.build(book_id, vrain.opts['f'], vrain.opts['t']),
+                     params.get('profile'), f"books/{book_id}/profile", profile_log)
+
+
+def build_novel(params: Dict[str, Any], session=None, progress_callback=None, cancel_token=None,
+                log_callback=None, profile_log=None) -> str:
+    """
+    小说章节模式生成
+
+    Args:
+        params: text_file、book_cfg、cover_file、from_page、to_page（0或None为全部）、
+            test_pages、compress、verbose、profile（性能分析模式，None为不分析）
+        session: 引擎会话
+        progress_callback: 进度回调
+        cancel_token: 取消令牌
+        log_callback: 日志回调
+        profile_log: 性能分析结果的输出函数，默认为log_callback或打印
+
+    Returns:
+        str: 输出PDF路径
+    """
+    from vrainNovel import VRainPDFGenerator
+
+    generator = VRainPDFGenerator(
+        text_file=params['text_file'],
+        book_cfg_path=params['book_cfg'],
+        cover_path=params.get('cover_file') or None,
+        from_page=params.get('from_page', 1),
+        to_page=params.get('to_page') or None,
+        test_pages=params.get('test_pages') or None,
+        compress=params.get('compress', False),
+        verbose=params.get('verbose', False),
+        progress_callback=progress_callback,
+        log_callback=log_callback,
+        cancel_token=cancel_token,
+        session=session
+    )
+    output = _profiled(lambda: generator.generate_pdf(Path(params['text_file'])),
+                       params.get('profile'), 'results/profile', profile_log or log_callback)
+    return str(output)
+
+
+def _profiled(build, profile: Optional[str], fallback_base: str, log=None):
+    """profile为None时直接生成，否则在性能分析器中生成"""
+    if not profile:
+        return build()
+    from vrainProfile import profile_call
+    return profile_call(build, profile, fallback_base, log or print)
+
+
+class _LineWriter(io.TextIOBase):
+    """把vrain.py打印到标准输出的内容按行交给日志输出"""
+
+    def __init__(self, emit: Callable[[str], None]):
+        self.emit = emit
+        self._buffer = ''
+
+    def write(self, text: str) -> int:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            if line.strip():
+                self.emit(line)
+        return len(text)
+
+    def flush(self):
+        if self._buffer.strip():
+            self.emit(self._buffer)
+        self._buffer = ''
+
+
+# 工作进程内的引擎会话，同一进程先后执行的任务共用
+_worker_session = None
+
+
+def run_job(job_id: int, kind: str, params: Dict[str, Any], events, cancel_event) -> Dict[str, Any]:
+    """
+    执行一个任务（在工作进程中调用）
+
+    Args:
+        job_id: 任务编号
+        kind: 任务类型，JOB_PERFECT或JOB_NOVEL
+        params: 任务参数，见build_perfect和build_novel
+        events: 事件队列（Manager队列）
+        cancel_event: 取消事件（Manager事件）
+
+    Returns:
+        Dict[str, Any]: status为完成、失败或已取消，完成时含output，失败时含error
+    """
+    global _worker_session
+    from vrainSession import EngineSession
+
+    if _worker_session is None:
+        _worker_session = EngineSession()
+
+    def progress(info):
+        events.put(('job_progress', (job_id, info)))
+
+    # 日志按间隔批量发送，-v时每个字一行的日志不会逐行经过进程间队列
+    sink = RingSink(lambda lines: events.put(('job_log', (job_id, '\n'.join(lines)))),
+                    interval=JOB_LOG_INTERVAL)
+    token = CancelToken(cancel_event)
+    writer = _LineWriter(sink.emit)
+    try:
+        with contextlib.redirect_stdout(writer):
+            if kind == JOB_PERFECT:
+                output = build_perfect(params, _worker_session, progress, token)
+            else:
+                output = build_novel(params, _worker_session, progress, token, sink.emit)
+        return {'status': STATUS_DONE, 'output': str(output)}
+    except BuildCancelled:
+        return {'status': STATUS_CANCELLED}
+    except SystemExit:
+        # vrain.py遇到配置错误时打印原因后sys.exit，原因已在日志中
+        return {'status': STATUS_FAILED, 'error': '排版引擎退出，详见日志'}
+    except Exception as e:
+        return {'status': STATUS_FAILED, 'error': str(e)}
+    finally:
+        writer.flush()
+        sink.close()
+
+
+class BuildJob:
+    """队列中的一个生成任务"""
+
+    def __init__(self, job_id: int, kind: str, params: Dict[str, Any], title: str):
+        self.job_id = job_id
+        self.kind = kind
+        self.params = params
+        self.title = title
+        self.status = STATUS_QUEUED
+        self.progress: Optional[Dict[str, Any]] = None
+        self.logs: List[str] = []
+        self.output: Optional[str] = None
+        self.error: Optional[str] = None
+        self.cancel_event = None
+
+
+class JobQueue:
+    """
+    生成任务队列
+
+    任务按列表顺序调度，同时运行的任务数不超过workers；只有开始运行的任务才提交给进程池，
+    排队中的任务留在列表中，可以调整顺序或取消。事件转发线程把工作进程的事件放入post队列
+    （GUI的message_queue），任务状态变化时发送('job_state', 任务编号)。
+    """
+
+    def __init__(self, post: Callable[[Any], None], workers: int = 1):
+        """
+        初始化任务队列
+
+        Args:
+            post: 事件投递函数，例如GUI消息队列的put
+            workers: 并行工作进程数
+        """
+        self.post = post
+        self.workers = max(1, workers)
+        self.jobs: List[BuildJob] = []
+        self._next_id = 1
+        self._lock = threading.RLock()
+        self._manager = None
+        self._events = None
+        self._executor = None
+        self._executor_workers = 0
+
+    def _start(self):
+        """首次运行任务时启动Manager、事件转发线程和进程池"""
+        if self._manager is None:
+            import multiprocessing
+            self._manager = multiprocessing.Manager()
+            self._events = self._manager.Queue()
+            threading.Thread(target=self._pump, daemon=True).start()
+        if self._executor is None or self._executor_workers < self.workers:
+            if self._executor is not None:
+                # 运行中的任务在旧进程池中继续执行
+                self._executor.shutdown(wait=False)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._executor_workers = self.workers
+
+    def _pump(self):
+        """把工作进程的事件转发到GUI"""
+        while True:
+            try:
+                event = self._events.get()
+            except (EOFError, OSError):
+                return
+            if event is None:
+                return
+            kind, (job_id, data) = event
+            job = self.get(job_id)
+            if job is None:
+                continue
+            if kind == 'job_progress':
+                job.progress = data
+            elif kind == 'job_log':
+                job.logs.append(data)
+            self.post(event)
+
+    def get(self, job_id: int) -> Optional[BuildJob]:
+        with self._lock:
+            for job in self.jobs:
+                if job.job_id == job_id:
+                    return job
+        return None
+
+    def add(self, kind: str, params: Dict[str, Any], title: str) -> BuildJob:
+        """加入一个任务，有空闲的工作进程时立即开始"""
+        with self._lock:
+            job = BuildJob(self._next_id, kind, dict(params), title)
+            self._next_id += 1
+            self.jobs.append(job)
+        self.post(('job_state', job.job_id))
+        self._dispatch()
+        return job
+
+    def move(self, job_id: int, delta: int) -> bool:
+        """把排队中的任务在排队任务之间前移（delta<0）或后移，返回是否移动"""
+        with self._lock:
+            queued = [job for job in self.jobs if job.status == STATUS_QUEUED]
+            job = self.get(job_id)
+            if job not in queued:
+                return False
+            index = queued.index(job)
+            target = index + delta
+            if not 0 <= target < len(queued):
+                return False
+            a, b = self.jobs.index(job), self.jobs.index(queued[target])
+            self.jobs[a], self.jobs[b] = self.jobs[b], self.jobs[a]
+        return True
+
+    def cancel(self, job_id: int) -> bool:
+        """取消任务：排队中的直接取消，运行中的在下一个页边界停止"""
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                return False
+            if job.status == STATUS_QUEUED:
+                job.status = STATUS_CANCELLED
+            elif job.status == STATUS_RUNNING and job.cancel_event is not None:
+                job.cancel_event.set()
+                return True
+            else:
+                return False
+        self.post(('job_state', job_id))
+        return True
+
+    def clear_finished(self):
+        """移除已结束的任务"""
+        with self._lock:
+            self.jobs = [job for job in self.jobs if job.status in (STATUS_QUEUED, STATUS_RUNNING)]
+
+    def set_workers(self, workers: int):
+        """调整并行工作进程数，增加时立即调度更多排队任务"""
+        with self._lock:
+            self.workers = max(1, int(workers))
+        self._dispatch()
+
+    def running(self) -> int:
+        with self._lock:
+            return sum(1 for job in self.jobs if job.status == STATUS_RUNNING)
+
+    def _dispatch(self):
+        """按顺序启动排队中的任务，直到同时运行的任务数达到workers"""
+        started = []
+        with self._lock:
+            for job in self.jobs:
+                if self.running() >= self.workers:
+                    break
+                if job.status != STATUS_QUEUED:
+                    continue
+                self._start()
+                job.status = STATUS_RUNNING
+                job.cancel_event = self._manager.Event()
+                future = self._executor.submit(run_job, job.job_id, job.kind, job.params,
+                                               self._events, job.cancel_event)
+                future.add_done_callback(lambda f, job=job: self._finish(job, f))
+                started.append(job.job_id)
+        for job_id in started:
+            self.post(('job_state', job_id))
+
+    def _finish(self, job: BuildJob, future):
+        """任务结束：记录结果并调度下一个任务（在进程池的线程中调用）"""
+        error = future.exception()
+        result = future.result() if error is None else {'status': STATUS_FAILED, 'error': str(error)}
+        with self._lock:
+            job.status = result['status']
+            job.output = result.get('output')
+            job.error = result.get('error')
+        self.post(('job_state', job.job_id))
+        self._dispatch()
+
+    def shutdown(self):
+        """取消全部任务并关闭进程池和Manager"""
+        with self._lock:
+            for job in self.jobs:
+                if job.status == STATUS_QUEUED:
+                    job.status = STATUS_CANCELLED
+                elif job.status == STATUS_RUNNING and job.cancel_event is not None:
+                    job.cancel_event.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._manager is not None:
+            self._events.put(None)
+            self._manager.shutdown()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+排版日志
+
+-v详细输出时排版引擎每个字都要输出一行日志。逐行print或逐行插入GUI日志框都很慢，
+这里的日志先写入缓冲区（RingSink），在页边界或按定时器批量输出。
+命令行直接写标准输出，缓冲区不限容量、不合并，每行日志照常输出；
+GUI和任务队列的缓冲区有容量上限，连续重复的行合并为一行，写满时丢弃最早的行并注明省略条数。
+Logger的debug_enabled等属性在设置级别时算好，热路径上先判断属性再调用，
+级别关闭时既不格式化字符串也不调用函数：
+
+    if log.debug_enabled:
+        log.debug("[%d/%d] %s -> %s", pid, pcnt, char, fn)
+"""
+
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+# 日志级别，与logging模块一致
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+# 高于全部级别，用于静默
+QUIET = 100
+
+
+def write_stdout(lines: List[str]):
+    """把一批日志写到当前的标准输出（随redirect_stdout变化）"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+    sys.stdout.flush()
+
+
+class RingSink:
+    """
+    环形缓冲日志输出
+
+    emit只把行追加到缓冲区；flush把缓冲区中的行（可选合并连续重复的行）一次交给write。
+    interval大于0时启动后台线程按间隔flush，供GUI等需要及时看到日志的场合使用。
+    """
+
+    def __init__(self, write: Callable[[List[str]], None] = write_stdout, capacity: Optional[int] = 2000,
+                 interval: Optional[float] = None, merge_repeats: bool = True):
+        """
+        初始化日志输出
+
+        Args:
+            write: 输出函数，参数为一批日志行
+            capacity: 缓冲区容量（行数），写满后丢弃最早的行；None为不限容量
+            interval: 定时flush的间隔（秒），None表示只在显式调用flush时输出
+            merge_repeats: 是否把连续重复的行合并为一行
+        """
+        self.write = write
+        self.merge_repeats = merge_repeats
+        self._lines = deque(maxlen=None if capacity is None else max(1, capacity))
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._stop = None
+        if interval:
+            self._stop = threading.Event()
+            threading.Thread(target=self._run, args=(interval,), daemon=True).start()
+
+    def emit(self, line: str):
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self._dropped += 1
+            self._lines.append(line)
+
+    def flush(self):
+        """一次输出缓冲区中的全部行"""
+        with self._lock:
+            if not self._lines and not self._dropped:
+                return
+            lines = list(self._lines)
+            self._lines.clear()
+            dropped, self._dropped = self._dropped, 0
+
+        out = [f"……省略{dropped}条日志……"] if dropped else []
+        if not self.merge_repeats:
+            self.write(out + lines)
+            return
+        prev, count = None, 0
+        for line in lines + [None]:
+            if line == prev:
+                count += 1
+                continue
+            if prev is not None:
+                out.append(prev if count == 1 else f"{prev}（重复{count}次）")
+            prev, count = line, 1
+        self.write(out)
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def close(self):
+        """停止定时线程并输出剩余日志"""
+        if self._stop is not None:
+            self._stop.set()
+        self.flush()
+
+
+class Logger:
+    """
+    分级日志
+
+    debug_enabled、info_enabled在set_level时更新，热路径直接读取属性判断级别。
+    消息参数按%格式化，只在级别开启时才格式化。
+    """
+
+    def __init__(self, sink: Optional[RingSink] = None, level: int = INFO):
+        # 默认写标准输出：不限容量、不合并，与逐行print的输出相同
+        self.sink = sink if sink is not None else RingSink(capacity=None, merge_repeats=False)
+        self.set_level(level)
+
+    def set_level(self, level: int):
+        self.level = level
+        self.debug_enabled = level <= DEBUG
+        self.info_enabled = level <= INFO
+
+    def log(self, level: int, message: str, *args):
+        if level < self.level:
+            return
+        if args:
+            message = message % args
+        self.sink.emit(message)
+
+    def debug(self, message: str, *args):
+        if self.debug_enabled:
+            self.log(DEBUG, message, *args)
+
+    def info(self, message: str, *args):
+        if self.info_enabled:
+            self.log(INFO, message, *args)
+
+    def warning(self, message: str, *args):
+        self.log(WARNING, message, *args)
+
+    def error(self, message: str, *args):
+        self.log(ERROR, message, *args)
+
+    def flush(self):
+        self.sink.flush()
+
+    @contextmanager
+    def quiet(self):
+        """暂时关闭全部日志，用于预览时的预排版"""
+        level = self.level
+        self.set_level(QUIET)
+        try:
+            yield self
+        finally:
+            self.set_level(level)
+
+    def attach(self, c):
+        """挂接到画布：每页结束（showPage）后输出该页积累的日志"""
+        show_page = c.showPage
+
+        def showPage():
+            show_page()
+            self.flush()
+
+        c.showPage = showPage
+        return c
@@ -13,9 +13,10 @@ Python版本 by msyloveldx, 2025/08
 - 批注处理和特殊标点符号处理
 """
 
+import hashlib
 import logging
+import math
 import re
-import subprocess
 import sys
 from datetime import datetime
 from pathlib import Path
@@ -29,6 +30,9 @@ from reportlab.pdfbase.ttfonts import TTFont
 from PIL import Image, ImageFont, ImageDraw
 import opencc
 
+from vrainSession import EngineSession, file_stamp
+from vrainReport import BuildReport, report_path
+
 # 应用常量
 SOFTWARE = 'vRain'
 VERSION = 'v1.4.1'
@@ -48,23 +52,23 @@ class FontChecker:
     """
     字体检查工具类
     
-    提供字体支持检查功能，并使用缓存提高性能。
+    提供字体支持检查功能，字体对象和检查结果缓存在引擎会话中，多次生成之间复用。
     """
     
-    def __init__(self):
-        self._font_cache: Dict[Tuple[str, str], bool] = {}
-        self._font_objects: Dict[str, ImageFont.FreeTypeFont] = {}
+    def __init__(self, session: Optional[EngineSession] = None):
+        self.session = session if session is not None else EngineSession()
+        # 各字体的字符支持情况，首次使用时从会话取出
+        self._font_cache: Dict[str, Dict[str, bool]] = {}
+        # 未命中缓存、实际探测字体的次数，计入构建报告
+        self.probes = 0
     
     def _get_font_object(self, font_path: str) -> Optional[ImageFont.FreeTypeFont]:
-        """获取字体对象，使用缓存优化性能"""
-        if font_path not in self._font_objects:
-            try:
-                self._font_objects[font_path] = ImageFont.truetype(font_path, 40)
-            except Exception as e:
-                logger.warning(f"无法加载字体 {font_path}: {e}")
-                return None
-        
-        return self._font_objects[font_path]
+        """获取字体对象，使用会话缓存优化性能"""
+        try:
+            return self.session.font_object(font_path, 40)
+        except Exception as e:
+            logger.warning(f"无法加载字体 {font_path}: {e}")
+            return None
     
     def check_font_support(self, font_path: str, char: str) -> bool:
         """
@@ -82,15 +86,18 @@ class FontChecker:
             return True
         
         # 检查缓存
-        cache_key = (font_path, char)
-        if cache_key in self._font_cache:
-            return self._font_cache[cache_key]
+        coverage = self._font_cache.get(font_path)
+        if coverage is None:
+            coverage = self._font_cache[font_path] = self.session.font_coverage(font_path)
+        if char in coverage:
+            return coverage[char]
         
         # 检查字体支持
+        self.probes += 1
         try:
             font = self._get_font_object(font_path)
             if font is None:
-                self._font_cache[cache_key] = False
+                coverage[char] = False
                 return False
             
             # 使用PIL检查字符是否被支持
@@ -98,34 +105,32 @@ class FontChecker:
             is_supported = bbox[2] > bbox[0] and bbox[3] > bbox[1]
             
             # 缓存结果
-            self._font_cache[cache_key] = is_supported
+            coverage[char] = is_supported
             return is_supported
             
         except Exception as e:
-            logger.debug(f"字体支持检查失败 {font_path} - {char}: {e}")
-            self._font_cache[cache_key] = False
+            logger.debug("字体支持检查失败 %s - %s: %s", font_path, char, e)
+            coverage[char] = False
             return False
     
     def clear_cache(self):
         """清空缓存"""
         self._font_cache.clear()
-        self._font_objects.clear()
+        self.session.clear()
 
 class ChineseConverter:
     """
     中文简繁转换工具
     
-    提供简体中文和繁体中文之间的转换功能。
+    提供简体中文和繁体中文之间的转换功能，转换器由引擎会话创建一次后复用。
     """
     
-    def __init__(self):
-        try:
-            self.s2t = opencc.OpenCC('s2t')  # 简转繁
-            self.t2s = opencc.OpenCC('t2s')  # 繁转简
-            self._available = True
-        except Exception as e:
-            logger.warning(f"简繁转换初始化失败: {e}")
-            self._available = False
+    def __init__(self, session: Optional[EngineSession] = None):
+        session = session if session is not None else EngineSession()
+        self.s2t, self.t2s = session.converters()  # 简转繁、繁转简
+        self._available = self.s2t is not None and self.t2s is not None
+        if not self._available:
+            logger.warning("简繁转换初始化失败")
     
     def simp_to_trad(self, text: str) -> str:
         """
@@ -143,7 +148,7 @@ class ChineseConverter:
         try:
             return self.s2t.convert(text)
         except Exception as e:
-            logger.debug(f"简转繁失败: {e}")
+            logger.debug("简转繁失败: %s", e)
             return text
     
     def trad_to_simp(self, text: str) -> str:
@@ -162,7 +167,7 @@ class ChineseConverter:
         try:
             return self.t2s.convert(text)
         except Exception as e:
-            logger.debug(f"繁转简失败: {e}")
+            logger.debug("繁转简失败: %s", e)
             return text
     
     @property
@@ -179,8 +184,8 @@ class VRainPDFGenerator:
     """
     
     def __init__(self, 
-                 text_file: Union[str, Path], 
-                 book_cfg_path: Union[str, Path], 
+                 text_file: Optional[Union[str, Path]], 
+                 book_cfg_path: Optional[Union[str, Path]], 
                  cover_path: Optional[Union[str, Path]] = None,
                  from_page: int = 1, 
                  to_page: Optional[int] = None,
@@ -188,31 +193,48 @@ class VRainPDFGenerator:
                  compress: bool = False, 
                  verbose: bool = False, 
                  progress_callback=None, 
-                 log_callback=None):
+                 log_callback=None,
+                 raster_format: Optional[str] = None,
+                 raster_quality: int = 90,
+                 workers: Optional[int] = None,
+                 compress_queue=None,
+                 cancel_token=None,
+                 session: Optional[EngineSession] = None,
+                 book_config: Optional[Dict[str, Any]] = None):
         """
         初始化PDF生成器
         
         Args:
-            text_file: 文本文件路径
-            book_cfg_path: 书籍配置文件路径
+            text_file: 文本文件路径，为None时须在generate_pdf中传入文本内容
+            book_cfg_path: 书籍配置文件路径，为None时须给出book_config
             cover_path: 封面图片路径
             from_page: 起始页数
             to_page: 结束页数
             test_pages: 测试模式页数
             compress: 是否压缩PDF
             verbose: 是否输出详细信息
-            progress_callback: 进度回调函数
+            progress_callback: 进度回调函数，参数为vrainProgress.ProgressReporter报告的进度字典
             log_callback: 日志回调函数
+            raster_format: 图片输出格式（png或webp），设置后直接输出图片而不生成PDF
+            raster_quality: 图片质量（仅webp有效）
+            workers: 渲染图片的并行进程数，默认为CPU核数
+            compress_queue: 后台压缩队列（vrainCompress.CompressQueue），设置后压缩在后台进行，不阻塞生成
+            cancel_token: 取消令牌（vrainProgress.CancelToken），每页结束时检查，取消后抛出BuildCancelled
+            session: 引擎会话（vrainSession.EngineSession），多次生成之间复用字体、简繁转换器和预处理文本
+            book_config: 书籍配置项，与book_cfg_path同时给出时覆盖配置文件中的同名项，单独给出时代替配置文件
         """
         # 路径参数转换
-        self.text_file = Path(text_file)
-        self.book_cfg_path = Path(book_cfg_path)
+        self.text_file = Path(text_file) if text_file else None
+        self.book_cfg_path = Path(book_cfg_path) if book_cfg_path else None
         self.cover_path = Path(cover_path) if cover_path else None
+        self.book_config_items = dict(book_config or {})
         
         # 参数验证
-        if not self.text_file.exists():
+        if self.text_file is not None and not self.text_file.exists():
             raise FileNotFoundError(f"错误: 未发现该书籍文本{self.text_file}！")
-        if not self.book_cfg_path.exists():
+        if self.book_cfg_path is None and not self.book_config_items:
+            raise ValueError("错误：未给出书籍排版配置文件或配置项！")
+        if self.book_cfg_path is not None and not self.book_cfg_path.exists():
             raise FileNotFoundError(f"错误：未发现该书籍排版配置文件{self.book_cfg_path}！")
         
         # 页面参数验证
@@ -228,10 +250,19 @@ class VRainPDFGenerator:
         # 其他参数
         self.compress = compress
         self.verbose = verbose
+        # 调试日志开关，逐字处理的热路径上先判断它再调用_log_debug，关闭时不构造日志字符串
+        self.debug_enabled = verbose
+        self.raster_format = raster_format
+        self.raster_quality = raster_quality
+        self.workers = workers
+        self.compress_queue = compress_queue
+        # 矢量背景表单名，book.cfg中canvas_vector=1时使用
+        self._bg_form = None
         
         # 回调函数
         self.progress_callback = progress_callback
         self.log_callback = log_callback
+        self.cancel_token = cancel_token
         
         # 配置数据初始化
         self.book_config: Dict[str, Any] = {}
@@ -249,44 +280,57 @@ class VRainPDFGenerator:
         self.positions_left: List[Tuple[float, float]] = []
         self.positions_right: List[Tuple[float, float]] = []
         
-        # 工具类实例
-        self.font_checker = FontChecker()
-        self.converter = ChineseConverter()
+        # 工具类实例，共用同一会话
+        self.session = session if session is not None else EngineSession()
+        self.font_checker = FontChecker(self.session)
+        self.converter = ChineseConverter(self.session)
+        
+        # 构建报告：各阶段耗时和计数，生成后写入PDF旁的.report.json
+        self.report = BuildReport('novel')
         
         # 初始化配置和计算
         try:
-            self._load_configurations()
-            self._setup_fonts()
-            self._calculate_positions()
+            with self.report.stage('config'):
+                self._load_configurations()
+            with self.report.stage('fonts'):
+                self._setup_fonts()
+            with self.report.stage('config'):
+                self._calculate_positions()
         except Exception as e:
             logger.error(f"初始化失败: {e}")
             raise
     
-    def _log_info(self, message: str):
+    def _log_info(self, message: str, *args):
         """
         输出信息日志
         
         Args:
-            message: 日志信息
+            message: 日志信息，有args时按%格式化
+            args: 格式化参数，只在确实输出时才格式化
         """
         if self.log_callback:
-            self.log_callback(message)
+            self.log_callback(message % args if args else message)
         elif self.verbose:
-            logger.info(message)
+            logger.info(message, *args)
         # 当verbose=False且没有log_callback时，不输出任何信息
     
-    def _log_debug(self, message: str):
+    def _log_debug(self, message: str, *args):
         """
         输出调试日志
         
+        逐字处理的路径上应先判断self.debug_enabled再调用，连参数元组也不必构造：
+            if self.debug_enabled:
+                self._log_debug("绘制字符 '%s' 在位置 %d", char, page_char_count)
+        
         Args:
-            message: 调试信息
+            message: 调试信息，有args时按%格式化
+            args: 格式化参数，只在调试日志开启时才格式化
         """
-        if self.verbose:
+        if self.debug_enabled:
             if self.log_callback:
-                self.log_callback(f"DEBUG: {message}")
+                self.log_callback("DEBUG: " + (message % args if args else message))
             else:
-                logger.debug(message)
+                logger.debug(message, *args)
     
     def _log_warning(self, message: str):
         """
@@ -322,7 +366,7 @@ class VRainPDFGenerator:
         # 加载中文数字映射
         zh_num_path = Path("db/num2zh_jid.txt")
         if zh_num_path.exists():
-            self._log_debug(f"加载中文数字映射: {zh_num_path}")
+            self._log_debug("加载中文数字映射: %s", zh_num_path)
             try:
                 with open(zh_num_path, 'r', encoding=DEFAULT_ENCODING) as f:
                     for line_num, line in enumerate(f, 1):
@@ -338,9 +382,11 @@ class VRainPDFGenerator:
         else:
             self._log_warning(f"未找到中文数字映射文件: {zh_num_path}")
 
-        # 加载书籍配置
-        self._log_debug(f"加载书籍配置: {self.book_cfg_path}")
-        self._load_config_file(self.book_cfg_path, self.book_config)
+        # 加载书籍配置，再用传入的配置项覆盖
+        if self.book_cfg_path is not None:
+            self._log_debug("加载书籍配置: %s", self.book_cfg_path)
+            self._load_config_file(self.book_cfg_path, self.book_config)
+        self.book_config.update({k: self._convert_value(v) for k, v in self.book_config_items.items()})
         
         # 输出书籍信息
         self._log_info(f"\t标题：{self.book_config.get('title', '')}")
@@ -363,7 +409,7 @@ class VRainPDFGenerator:
         if not canvas_jpg_path.exists():
             raise FileNotFoundError(f"错误：未发现背景图jpg图片文件: {canvas_jpg_path}")
 
-        self._log_debug(f"加载背景图配置: {canvas_cfg_path}")
+        self._log_debug("加载背景图配置: %s", canvas_cfg_path)
         self._load_config_file(canvas_cfg_path, self.canvas_config)
         self._log_info(f"\t尺寸：{self.canvas_config.get('canvas_width', '')} x {self.canvas_config.get('canvas_height', '')}")
         self._log_info(f"\t列数：{self.canvas_config.get('leaf_col', '')}")
@@ -399,16 +445,9 @@ class VRainPDFGenerator:
                         value = value.strip()
                         
                         # 类型转换
-                        if value.isdigit():
-                            config_dict[key] = int(value)
-                        elif value.replace('.', '').replace('-', '').isdigit():
-                            config_dict[key] = float(value)
-                        elif value.lower() in ['true', 'false']:
-                            config_dict[key] = value.lower() == 'true'
-                        else:
-                            config_dict[key] = value
+                        config_dict[key] = self._convert_value(value)
                         
-                        self._log_debug(f"加载配置: {key} = {config_dict[key]}")
+                        self._log_debug("加载配置: %s = %s", key, config_dict[key])
                         
                     except ValueError as e:
                         self._log_warning(f"配置文件{file_path}第{line_num}行解析失败: {line} - {e}")
@@ -417,6 +456,27 @@ class VRainPDFGenerator:
             self._log_error(f"加载配置文件{file_path}失败: {e}")
             raise
     
+    @staticmethod
+    def _convert_value(value: Any) -> Any:
+        """
+        配置值类型转换：整数、小数、布尔值，其余保持字符串
+        
+        Args:
+            value: 配置文件中的值，或传入的配置项（非字符串时原样返回）
+            
+        Returns:
+            Any: 转换后的值
+        """
+        if not isinstance(value, str):
+            return value
+        if value.isdigit():
+            return int(value)
+        elif value.replace('.', '').replace('-', '').isdigit():
+            return float(value)
+        elif value.lower() in ['true', 'false']:
+            return value.lower() == 'true'
+        return value
+    
     def _setup_fonts(self):
         """
         设置字体
@@ -429,7 +489,7 @@ class VRainPDFGenerator:
         for font_name in font_names:
             font_file = self.book_config.get(font_name)
             if not font_file:
-                self._log_debug(f"跳过未配置的字体: {font_name}")
+                self._log_debug("跳过未配置的字体: %s", font_name)
                 continue
                 
             font_path = Path(f"fonts/{font_file}")
@@ -437,9 +497,9 @@ class VRainPDFGenerator:
                 self._log_warning(f"未发现字体'{font_path}'，跳过该字体")
                 continue
             
-            # 注册字体到reportlab
+            # 注册字体到reportlab，字体文件未变化时复用会话中已注册的字体
             try:
-                pdfmetrics.registerFont(TTFont(font_name, str(font_path)))
+                self.session.register_font(font_name, font_path)
                 
                 # 存储字体信息
                 self.fonts[font_name] = {
@@ -473,7 +533,7 @@ class VRainPDFGenerator:
             if font_path.exists():
                 try:
                     font_name = f'default_font_{i+1}'
-                    pdfmetrics.registerFont(TTFont(font_name, str(font_path)))
+                    self.session.register_font(font_name, font_path)
                     
                     self.fonts[font_name] = {
                         'path': str(font_path),
@@ -487,7 +547,7 @@ class VRainPDFGenerator:
                     return  # 成功加载一个就足够
                     
                 except Exception as e:
-                    self._log_debug(f"加载默认字体{default_font}失败: {e}")
+                    self._log_debug("加载默认字体%s失败: %s", default_font, e)
         
         raise RuntimeError("错误：没有可用的字体文件！请检查fonts目录")
     
@@ -560,7 +620,7 @@ class VRainPDFGenerator:
             if canvas_height <= margins_top + margins_bottom:
                 raise ValueError(f"画布高度({canvas_height})太小，无法容纳所有边距")
             
-            self._log_debug(f"计算位置: 画布{canvas_width}x{canvas_height}, 列数{col_num}, 行数{row_num}")
+            self._log_debug("计算位置: 画布%sx%s, 列数%s, 行数%s", canvas_width, canvas_height, col_num, row_num)
             
             # 计算列宽、行高
             effective_width = canvas_width - margins_left - margins_right - lc_width
@@ -569,7 +629,7 @@ class VRainPDFGenerator:
             cw = effective_width / col_num  # 列宽
             rh = effective_height / row_num  # 行高
             
-            self._log_debug(f"列宽: {cw:.2f}, 行高: {rh:.2f}")
+            self._log_debug("列宽: %.2f, 行高: %.2f", cw, rh)
             
             # 生成文字坐标（优化版本）
             self.positions_left = []
@@ -625,7 +685,9 @@ class VRainPDFGenerator:
         
         # 如果没有找到支持的字体，返回第一个字体作为退路
         if font_list:
-            self._log_debug(f"字符 '{char}' 在所有字体中都不受支持，使用默认字体")
+            self.report.count('missing_glyphs')
+            if self.debug_enabled:
+                self._log_debug("字符 '%s' 在所有字体中都不受支持，使用默认字体", char)
             return font_list[0]
         
         return None
@@ -657,14 +719,16 @@ class VRainPDFGenerator:
         if char_s2t != char:
             font_s2t = self.get_font_for_char(char_s2t, self.text_fonts)
             if font_s2t == main_font:
-                self._log_debug(f"字符转换: '{char}' -> '{char_s2t}' (简转繁)")
+                if self.debug_enabled:
+                    self._log_debug("字符转换: '%s' -> '%s' (简转繁)", char, char_s2t)
                 return char_s2t, font_s2t
         
         # 检查繁转简的结果
         if char_t2s != char:
             font_t2s = self.get_font_for_char(char_t2s, self.text_fonts)
             if font_t2s == main_font:
-                self._log_debug(f"字符转换: '{char}' -> '{char_t2s}' (繁转简)")
+                if self.debug_enabled:
+                    self._log_debug("字符转换: '%s' -> '%s' (繁转简)", char, char_t2s)
                 return char_t2s, font_t2s
         
         return char, None
@@ -689,36 +753,9 @@ class VRainPDFGenerator:
             with open(text_file, 'r', encoding=DEFAULT_ENCODING) as f:
                 raw_content = f.read()
             
-            self._log_debug(f"文件 {text_file.name} 原始内容长度: {len(raw_content)}")
-            
-            processed_content = ""
-            line_count = 0
-            
-            # 逐行处理
-            for line in raw_content.split('\n'):
-                line_count += 1
-                
-                if line.strip():  # 非空行
-                    try:
-                        # 标点符号处理
-                        processed_line = self._process_punctuation(line.strip())
-                        
-                        # 处理特殊字符
-                        processed_line = processed_line.replace('@', ' ')  # @代表空格
-                        
-                        processed_content += processed_line
-                        
-                    except Exception as e:
-                        self._log_warning(f"处理第{line_count}行时出错: {e}")
-                        # 继续处理下一行
-                        continue
-                else:
-                    # 保留换行符作为分隔
-                    processed_content += '\n'
-            
+            self._log_debug("文件 %s 原始内容长度: %d", text_file.name, len(raw_content))
+            processed_content = self.process_text(raw_content)
             self._log_info(f"文件 {text_file.name} 处理后内容长度: {len(processed_content)}")
-            self._log_debug(f"处理了 {line_count} 行文本")
-            
             return processed_content
             
         except UnicodeDecodeError as e:
@@ -733,25 +770,7 @@ class VRainPDFGenerator:
                     self._log_info(f"使用 {encoding} 编码成功读取文件")
                     
                     # 重新处理内容
-                    processed_content = ""
-                    line_count = 0
-                    
-                    for line in raw_content.split('\n'):
-                        line_count += 1
-                        
-                        if line.strip():  # 非空行
-                            try:
-                                processed_line = self._process_punctuation(line.strip())
-                                processed_line = processed_line.replace('@', ' ')
-                                processed_content += processed_line
-                                
-                            except Exception as e:
-                                self._log_warning(f"处理第{line_count}行时出错: {e}")
-                                continue
-                        else:
-                            processed_content += '\n'
-                    
-                    return processed_content
+                    return self.process_text(raw_content)
                     
                 except UnicodeDecodeError:
                     continue
@@ -761,6 +780,76 @@ class VRainPDFGenerator:
         except Exception as e:
             self._log_error(f"加载文本文件失败: {e}")
             raise
+    
+    def process_text(self, raw_content: str) -> str:
+        """
+        逐行处理文本内容：标点替换、删除，@代表空格，空行保留为换行符
+        
+        Args:
+            raw_content: 原始文本内容
+            
+        Returns:
+            str: 处理后的文本内容
+        """
+        processed_content = ""
+        line_count = 0
+        
+        for line in raw_content.split('\n'):
+            line_count += 1
+            
+            if line.strip():  # 非空行
+                try:
+                    # 标点符号处理
+                    processed_line = self._process_punctuation(line.strip())
+                    
+                    # 处理特殊字符
+                    processed_line = processed_line.replace('@', ' ')  # @代表空格
+                    
+                    processed_content += processed_line
+                    
+                except Exception as e:
+                    self._log_warning(f"处理第{line_count}行时出错: {e}")
+                    # 继续处理下一行
+                    continue
+            else:
+                # 保留换行符作为分隔
+                processed_content += '\n'
+        
+        self._log_debug("处理了 %d 行文本", line_count)
+        return processed_content
+    
+    def _config_key(self) -> Tuple:
+        """书籍配置的缓存键：配置文件的路径和状态，以及传入的配置项"""
+        cfg_key = (str(self.book_cfg_path), file_stamp(self.book_cfg_path)) if self.book_cfg_path else None
+        return (cfg_key, tuple(sorted((k, str(v)) for k, v in self.book_config_items.items())))
+
+    def _load_texts_cached(self, text_file: Path) -> str:
+        """
+        加载文本文件，文本文件和书籍配置均未修改时复用会话中上次的处理结果
+        
+        Args:
+            text_file: 文本文件路径
+            
+        Returns:
+            str: 处理后的文本内容
+        """
+        key = (file_stamp(text_file), self._config_key())
+        return self.session.cached('novel_texts', str(text_file.resolve()), key,
+                                   lambda: self.load_texts(text_file))
+    
+    def _process_text_cached(self, raw_content: str) -> str:
+        """
+        处理传入的文本内容，内容和书籍配置均未变化时复用会话中上次的处理结果
+        
+        Args:
+            raw_content: 原始文本内容
+            
+        Returns:
+            str: 处理后的文本内容
+        """
+        digest = hashlib.sha1(raw_content.encode('utf-8')).hexdigest()
+        return self.session.cached('novel_texts', digest, self._config_key(),
+                                   lambda: self.process_text(raw_content))
 
     def _process_punctuation(self, text: str) -> str:
         """
@@ -786,8 +875,8 @@ class VRainPDFGenerator:
                     if len(replacement) >= 2:
                         old_char, new_char = replacement[0], replacement[1]
                         text = text.replace(old_char, new_char)
-                        if old_char in original_text:
-                            self._log_debug(f"标点替换: '{old_char}' -> '{new_char}'")
+                        if self.debug_enabled and old_char in original_text:
+                            self._log_debug("标点替换: '%s' -> '%s'", old_char, new_char)
             
             # 数字替换
             exp_replace_number = self.book_config.get('exp_replace_number', '')
@@ -797,8 +886,8 @@ class VRainPDFGenerator:
                     if len(replacement) >= 2:
                         old_char, new_char = replacement[0], replacement[1]
                         text = text.replace(old_char, new_char)
-                        if old_char in original_text:
-                            self._log_debug(f"数字替换: '{old_char}' -> '{new_char}'")
+                        if self.debug_enabled and old_char in original_text:
+                            self._log_debug("数字替换: '%s' -> '%s'", old_char, new_char)
             
             # 标点符号删除
             exp_delete_comma = self.book_config.get('exp_delete_comma', '')
@@ -807,7 +896,8 @@ class VRainPDFGenerator:
                 for char in chars_to_delete:
                     if char and char in text:
                         text = text.replace(char, '')
-                        self._log_debug(f"删除标点: '{char}'")
+                        if self.debug_enabled:
+                            self._log_debug("删除标点: '%s'", char)
             
             # 无标点模式
             if self.book_config.get('if_nocomma') == 1:
@@ -817,7 +907,8 @@ class VRainPDFGenerator:
                     for char in chars_to_remove:
                         if char and char in text:
                             text = text.replace(char, '')
-                            self._log_debug(f"无标点模式删除: '{char}'")
+                            if self.debug_enabled:
+                                self._log_debug("无标点模式删除: '%s'", char)
             
             # 标点符号归一化
             if self.book_config.get('if_onlyperiod') == 1:
@@ -827,7 +918,8 @@ class VRainPDFGenerator:
                     for char in chars_to_replace:
                         if char and char in text:
                             text = text.replace(char, '。')
-                            self._log_debug(f"标点归一化: '{char}' -> '。'")
+                            if self.debug_enabled:
+                                self._log_debug("标点归一化: '%s' -> '。'", char)
                 
                 # 去除重复句号
                 while '。。' in text:
@@ -949,10 +1041,12 @@ class VRainPDFGenerator:
     
     def _start_new_page(self, c, page_num: int, canvas_width: float, canvas_height: float, background_path: Path):
         """开始新页面"""
-        self._log_info(f"创建新PDF页[{page_num}]...")
+        self._log_info("创建新PDF页[%d]...", page_num)
         
         # 添加背景图
-        if background_path.exists():
+        if self._bg_form:
+            c.doForm(self._bg_form)
+        elif background_path.exists():
             c.drawImage(str(background_path), 0, 0, canvas_width, canvas_height)
         else:
             self._log_warning(f"警告：背景图 {background_path} 不存在")
@@ -982,6 +1076,9 @@ class VRainPDFGenerator:
         if converted_font:
             font_name = converted_font
             char = display_char
+            self.report.count('st_conversions')
+        elif font_name != self.text_fonts[0]:
+            self.report.count('fallback_fonts')
         
         # 设置字体和大小
         if is_chapter_title:
@@ -1045,15 +1142,33 @@ class VRainPDFGenerator:
 {'-' * 60}"""
         self._log_info(welcome_msg)
     
-    def generate_pdf(self, text_file):
-        """生成PDF文件"""
+    def generate_pdf(self, text_file=None, output=None, text: Optional[str] = None):
+        """
+        生成PDF文件
+        
+        Args:
+            text_file: 文本文件路径，默认为初始化时的text_file
+            output: PDF输出目标，路径或BytesIO等文件对象；默认写入results目录。
+                给出时不压缩、不输出图片
+            text: 文本内容，给出时代替文本文件
+            
+        Returns:
+            PDF路径、图片目录或传入的output
+        """
         self.print_welcome()
         
         if self.test_pages:
             self._log_info(f"注意：-z 测试模式，仅输出{self.test_pages}页用于调试排版参数！")
         
         # 加载文本
-        text_content = self.load_texts(text_file)
+        with self.report.stage('texts'):
+            if text is not None:
+                text_content = self._process_text_cached(text)
+            else:
+                text_file = text_file or self.text_file
+                if text_file is None:
+                    raise ValueError("错误：未给出文本文件或文本内容！")
+                text_content = self._load_texts_cached(Path(text_file))
         
         # 创建PDF文件名
         title = self.book_config.get('title', '')
@@ -1066,6 +1181,7 @@ class VRainPDFGenerator:
         else:
             # 指定页数范围
             pdf_filename = f"《{title}》文本{self.from_page}至{self.to_page}"
+        pdf_name = pdf_filename
         
         if self.test_pages:
             pdf_filename += '_test'
@@ -1073,14 +1189,42 @@ class VRainPDFGenerator:
         pdf_path = Path(f"results/{pdf_filename}.pdf")
         
         # 确保results目录存在
-        pdf_path.parent.mkdir(exist_ok=True)
+        if output is None:
+            pdf_path.parent.mkdir(exist_ok=True)
         
         # 使用reportlab创建PDF
         canvas_width = float(self.canvas_config.get('canvas_width', 2480))
         canvas_height = float(self.canvas_config.get('canvas_height', 1860))
         
-        from reportlab.pdfgen import canvas as pdf_canvas
-        c = pdf_canvas.Canvas(str(pdf_path), pagesize=(canvas_width, canvas_height))
+        # 给出输出目标时总是生成PDF
+        raster_format = self.raster_format if output is None else None
+        if raster_format:
+            from vrainRaster import RecordingCanvas
+            c = RecordingCanvas(str(pdf_path), pagesize=(canvas_width, canvas_height))
+        else:
+            from reportlab.pdfgen import canvas as pdf_canvas
+            target = str(pdf_path) if output is None else output
+            if isinstance(target, Path):
+                target = str(target)
+            c = pdf_canvas.Canvas(target, pagesize=(canvas_width, canvas_height))
+        
+        # 矢量背景：图片输出模式下仍使用背景图
+        self._bg_form = None if raster_format else self._load_vector_canvas(c)
+        
+        # 印章和插图：每页结束前叠加到该页
+        overlays = self._load_overlays(pdf_name)
+        if overlays:
+            overlays.attach(c)
+        
+        # 进度报告：每排完一页报告一次，并检查是否已取消
+        from vrainProgress import ProgressReporter
+        reporter = ProgressReporter(self.progress_callback, self.cancel_token,
+                                    raster=bool(raster_format))
+        reporter.set_total(self._estimate_pages(text_content))
+        reporter.attach(c)
+        
+        # 构建报告统计绘制字数、页数和reportlab绘制耗时
+        self.report.attach(c)
         
         # 设置PDF元数据
         c.setTitle(self.book_config.get('title', ''))
@@ -1088,21 +1232,94 @@ class VRainPDFGenerator:
         c.setCreator(f"{SOFTWARE} {VERSION}，古籍刻本直排电子书制作工具")
         
         # 添加封面
-        self._add_cover(c, canvas_width, canvas_height)
+        with self.report.stage('cover'):
+            self._add_cover(c, canvas_width, canvas_height)
         
         # 处理文本并生成页面
-        self._process_texts_and_generate_pages(c, text_content, canvas_width, canvas_height)
+        with self.report.stage('layout'):
+            self._process_texts_and_generate_pages(c, text_content, canvas_width, canvas_height)
         
         # 保存PDF
-        c.save()
+        reporter.set_stage('save')
+        with self.report.stage('save'):
+            c.save()
+        
+        self.report.count('font_probes', self.font_checker.probes)
+        self.report.info.update({
+            'text_file': str(text_file) if text is None else None,
+            'from_page': self.from_page,
+            'to_page': self.to_page,
+            'test_pages': self.test_pages,
+            'canvas_id': self.book_config.get('canvas_id'),
+            'raster': raster_format,
+            'compress': bool(self.compress) and output is None,
+            'chars': len(text_content),
+            'output': None,
+        })
+        
+        if overlays:
+            page_warning = overlays.check_pages(c.getPageNumber() - 1)
+            for warning in overlays.warnings + ([page_warning] if page_warning else []):
+                self._log_warning(warning)
+        
+        if raster_format:
+            reporter.set_stage('render')
+            with self.report.stage('render'):
+                out_dir = self._render_raster(c, pdf_path, progress=reporter.page_rendered)
+            self._write_report(out_dir)
+            reporter.finish()
+            return out_dir
+        
+        if output is not None:
+            self._log_info(f"生成PDF'{pdf_name}'...完成！")
+            if self.verbose:
+                self._log_info(self.report.format_table())
+            reporter.finish()
+            return output
         
         self._log_info(f"生成PDF文件'results/{pdf_filename}.pdf'...完成！")
         
         # 压缩处理
         if self.compress:
-            self._compress_pdf(pdf_path)
+            reporter.set_stage('compress')
+            pdf_path = self._compress_pdf(pdf_path)
         else:
             self._log_info("建议：使用'-c'参数对PDF文件进行压缩！")
+        self._write_report(pdf_path)
+        reporter.finish()
+        return pdf_path
+    
+    def _write_report(self, output: Path):
+        """
+        写入构建报告，verbose时输出汇总表
+        
+        Args:
+            output: PDF路径或图片目录，报告写在其旁边
+        """
+        self.report.info['output'] = str(output)
+        path = self.report.write(report_path(output))
+        if self.verbose:
+            self._log_info(self.report.format_table())
+            self._log_info(f"写入构建报告'{path}'...完成！")
+    
+    def _estimate_pages(self, text_content: str) -> int:
+        """
+        按每页字数估算总页数（含封面），用于显示进度
+        
+        Args:
+            text_content: 全部文本
+            
+        Returns:
+            int: 预计页数
+        """
+        pages = math.ceil(len(text_content) / max(1, self.page_chars_num))
+        if self.to_page is not None:
+            pages = min(pages, self.to_page - self.from_page + 1)
+        else:
+            pages = max(1, pages - self.from_page + 1)
+        if self.test_pages:
+            pages = min(pages, self.test_pages)
+        return pages + 1
     
 
     def _add_cover(self, c, canvas_width: float, canvas_height: float):
@@ -1176,8 +1393,7 @@ class VRainPDFGenerator:
     def _process_texts_and_generate_pages(self, c, text_content: str, 
                                         canvas_width: float, canvas_height: float):
         """处理文本并生成页面（支持章节处理）"""
-        canvas_id = self.book_config.get('canvas_id')
-        background_path = Path(f"canvas/{canvas_id}.jpg")
+        background_path = self._get_background_path()
         
         if not text_content or not text_content.strip():
             self._log_warning("警告：文本内容为空")
@@ -1222,7 +1438,8 @@ class VRainPDFGenerator:
             content_start_pos = row_num  # 从第二列开始
             page_char_count = content_start_pos
             
-            self._log_debug(f"章节内容长度: {len(chapter_content)}, 内容开始位置: {content_start_pos}, 页面总字符数: {self.page_chars_num}")
+            self._log_debug("章节内容长度: %d, 内容开始位置: %s, 页面总字符数: %d",
+                            len(chapter_content), content_start_pos, self.page_chars_num)
             
             # 处理章节内容
             chars = list(chapter_content)
@@ -1231,7 +1448,8 @@ class VRainPDFGenerator:
             while char_index < len(chars):
                 # 检查是否需要换页
                 if page_char_count >= self.page_chars_num:
-                    self._log_debug(f"换页：当前字符位置 {page_char_count} >= 页面字符数 {self.page_chars_num}")
+                    if self.debug_enabled:
+                        self._log_debug("换页：当前字符位置 %d >= 页面字符数 %d", page_char_count, self.page_chars_num)
                     c.showPage()
                     page_num += 1
                     current_page = self.from_page + page_num
@@ -1247,6 +1465,7 @@ class VRainPDFGenerator:
                 
                 # 处理批注
                 if char == '【':
+                    self.report.count('comment_blocks')
                     comment_end = self._find_comment_end(chars, char_index - 1)
                     if comment_end != -1:
                         char_index = comment_end + 1
@@ -1256,7 +1475,8 @@ class VRainPDFGenerator:
                 
                 # 绘制字符
                 if page_char_count < len(self.positions_left):
-                    self._log_debug(f"绘制字符 '{char}' 在位置 {page_char_count}")
+                    if self.debug_enabled:
+                        self._log_debug("绘制字符 '%s' 在位置 %d", char, page_char_count)
                     self._draw_char_at_position(c, char, page_char_count)
                     page_char_count += 1
                     total_processed_chars += 1
@@ -1324,7 +1544,7 @@ class VRainPDFGenerator:
             
             processed_chars += 1
         
-        self._log_debug(f"跳过了 {processed_chars} 个有效字符，从字符索引 {char_index} 开始处理")
+        self._log_debug("跳过了 %d 个有效字符，从字符索引 %d 开始处理", processed_chars, char_index)
         
         # 重置计数器，开始实际页面生成
         processed_chars = 0
@@ -1361,6 +1581,7 @@ class VRainPDFGenerator:
             
             # 处理批注
             if char == '【':
+                self.report.count('comment_blocks')
                 comment_end = self._find_comment_end(chars, char_index - 1)
                 if comment_end != -1:
                     comment_text = ''.join(chars[char_index:comment_end])
@@ -1399,7 +1620,7 @@ class VRainPDFGenerator:
         chapter_pattern = r'第(\d+)章\s+([^\n\r]+)'
         matches = list(re.finditer(chapter_pattern, text_content))
         
-        self._log_debug(f"章节解析：找到 {len(matches)} 个章节")
+        self._log_debug("章节解析：找到 %d 个章节", len(matches))
         
         if not matches:
             # 如果没有找到章节，将整个文本作为一个章节
@@ -1417,7 +1638,7 @@ class VRainPDFGenerator:
                 content_end = len(text_content)
             
             chapter_content = text_content[content_start:content_end].strip()
-            self._log_debug(f"章节 {i+1}: '{chapter_title}', 内容长度: {len(chapter_content)}")
+            self._log_debug("章节 %d: '%s', 内容长度: %d", i + 1, chapter_title, len(chapter_content))
             chapters.append((chapter_title, chapter_content))
         
         return chapters
@@ -1478,28 +1699,123 @@ class VRainPDFGenerator:
                 y = pager_y - pager_font_size * i * title_ydis
                 c.drawString(x, y, char)
     
-    def _compress_pdf(self, pdf_path: Path):
-        """压缩PDF文件"""
-        import subprocess
+    def _load_vector_canvas(self, c) -> Optional[str]:
+        """
+        按背景图配置把版框、界行、鱼尾定义为矢量PDF表单，代替canvas/<id>.jpg
+        
+        Args:
+            c: reportlab画布
+            
+        Returns:
+            Optional[str]: 表单名称，book.cfg未设置canvas_vector=1时为None
+        """
+        if not int(self.book_config.get('canvas_vector', 0)):
+            return None
+        
+        canvas_id = self.book_config.get('canvas_id')
+        self._log_info(f"使用矢量背景'canvas/{canvas_id}.cfg'...")
+        return self.session.canvas_generator(canvas_id, 'canvas').create_form(c)
+    
+    def _get_background_path(self) -> Path:
+        """
+        背景图路径，book.cfg中设置canvas_preset（screen、ebook、print）时使用按预设重采样的缓存背景图
+        
+        Returns:
+            Path: 背景图路径
+        """
+        canvas_id = self.book_config.get('canvas_id')
+        background_path = Path(f"canvas/{canvas_id}.jpg")
+        preset = self.book_config.get('canvas_preset')
+        if not preset:
+            return background_path
+        
+        from vrainBackground import DEFAULT_CANVAS_DPI
+        
+        canvas_width = float(self.canvas_config.get('canvas_width', 2480))
+        canvas_height = float(self.canvas_config.get('canvas_height', 1860))
+        canvas_dpi = float(self.canvas_config.get('canvas_dpi', DEFAULT_CANVAS_DPI))
+        prepared = self.session.background(background_path, canvas_width, canvas_height, preset, canvas_dpi)
+        self._log_info(f"背景图预设{preset}: '{prepared}'")
+        return prepared
+    
+    def _load_overlays(self, pdf_name: str):
+        """
+        读取书籍目录下的印章（yins.cfg）和插图（images.cfg）配置
+        
+        Args:
+            pdf_name: 输出PDF文件名（不含.pdf和_test），用于匹配yins.cfg中的条目
+            
+        Returns:
+            PageOverlays: 叠加层，无任何配置时为假值
+        """
+        from vrainOverlay import PageOverlays
+        
+        dims = PageOverlays.calculate_dimensions(self.canvas_config, self.book_config.get('row_num', 30))
+        if self.book_cfg_path is None:
+            # 没有书籍目录，也就没有印章和插图配置
+            return None
+        overlays = PageOverlays(self.book_cfg_path.parent, dims, (pdf_name, f"{pdf_name}_已压缩"))
+        if overlays:
+            self._log_info(f"读取印章和插图配置...{overlays.summary()}")
+        return overlays
+    
+    def _render_raster(self, c, pdf_path: Path, progress=None) -> Path:
+        """
+        将记录的页面并行渲染为图片
+        
+        Args:
+            c: 记录了全部页面的RecordingCanvas
+            pdf_path: 原PDF输出路径，图片目录与其同名
+            progress: 每渲染完一页调用progress(已完成页数)
+            
+        Returns:
+            Path: 图片输出目录
+        """
+        from vrainRaster import render_pages
+        
+        out_dir = pdf_path.parent / f"{pdf_path.stem}_{self.raster_format}"
+        font_paths = {name: info['path'] for name, info in self.fonts.items()}
+        
+        self._log_info(f"渲染{len(c.pages)}页图片到'{out_dir}'...")
+        render_pages(c.pages, font_paths, c._pagesize, out_dir,
+                     fmt=self.raster_format, quality=self.raster_quality,
+                     workers=self.workers, progress=progress)
+        self._log_info(f"生成图片目录'{out_dir}'...完成！")
+        return out_dir
+    
+    def _compress_pdf(self, pdf_path: Path) -> Path:
+        """
+        压缩PDF文件（进程内流级压缩，不依赖Ghostscript）
+        
+        Args:
+            pdf_path: 待压缩的PDF路径，压缩成功后删除
+        
+        Returns:
+            Path: 压缩成功时为_已压缩.pdf，失败或加入后台队列时为原文件
+                （队列中的最终路径由队列的所有者从drain()的结果中取得）
+        """
+        from vrainCompress import compress_pdf, format_stats
         
         output_path = pdf_path.parent / f"{pdf_path.stem}_已压缩.pdf"
         
+        # 有后台压缩队列时只提交，由队列的回调汇报结果
+        if self.compress_queue is not None:
+            self._log_info(f"PDF文件'{pdf_path}'加入后台压缩队列...")
+            self.compress_queue.submit(pdf_path, output_path)
+            return pdf_path
+        
         try:
-            # 使用Ghostscript压缩PDF
-            cmd = [
-                'gs', '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.4',
-                '-dPDFSETTINGS=/screen', '-dNOPAUSE', '-dQUIET', '-dBATCH',
-                f'-sOutputFile={output_path}', str(pdf_path)
-            ]
-            
-            subprocess.run(cmd, check=True)
-            pdf_path.unlink()  # 删除原文件
-            self._log_info(f"压缩PDF文件'{output_path}'...完成！")
-            
-        except subprocess.CalledProcessError:
-            self._log_warning("PDF压缩失败，请检查是否安装了Ghostscript")
-        except FileNotFoundError:
-            self._log_warning("未找到Ghostscript，无法压缩PDF")
+            stats = compress_pdf(pdf_path, output_path)
+        except Exception as e:
+            self._log_warning(f"PDF压缩失败: {e}")
+            return pdf_path
+        self.report.add_time('compress', stats['elapsed'])
+        
+        pdf_path.unlink()  # 删除原文件
+        self._log_info(f"压缩PDF文件'{output_path}'...完成！{format_stats(stats)}")
+        for warning in stats['warnings']:
+            self._log_warning(warning)
+        return output_path
 
 def create_custom_generator(text_file_path: str, book_config_path: str, 
                           cover_path: Optional[str] = None, from_page: int = 1, 
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+印章与插图叠加模块
+
+在生成PDF时直接读取书籍目录下的yins.cfg（印章）和images.cfg（整列插图），
+在每页结束前把对应的印章和插图绘制到当前页，不再需要生成PDF后再用
+books/<id>/addyins.py和tools/insertimg.py逐页合并。叠加了印章或插图的PDF在关键词中带有
+OVERLAY_KEYWORD标记，这两个工具遇到带标记的PDF时跳过，避免同一印章、插图叠加两次。
+位置计算与两个工具完全一致，使用同一套列宽cw、行高rh和版心宽度lc_width。
+
+插图按输出分辨率预先缩放到所在列的图框大小，缩放结果按源文件哈希和目标尺寸
+缓存在images/.cache/下，重复生成时直接复用；内容相同的图片在文档中只嵌入一次。
+"""
+
+from pathlib import Path
+from typing import Dict, List, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from vrainSession import save_cached_jpeg, source_hash
+
+# 插图预缩放的默认分辨率（每72个PDF单位对应1英寸），0表示不缩放
+DEFAULT_IMAGE_DPI = 72
+# 预缩放后JPEG的编码质量
+IMAGE_CACHE_QUALITY = 90
+# 缓存目录，位于插图目录下
+IMAGE_CACHE_DIR = '.cache'
+
+# 生成时已叠加印章和插图的PDF，关键词（/Keywords）中带有此标记
+OVERLAY_KEYWORD = 'vRain:overlays'
+
+def prepare_image(src, box_width: float, box_height: float, dpi: int = DEFAULT_IMAGE_DPI,
+                  cache_dir=None) -> Path:
+    """
+    按输出分辨率把插图缩放到图框大小，返回缩放后的图片路径
+
+    缩放结果以源文件哈希和目标像素尺寸命名，同一图片在同一图框下只缩放一次，
+    内容相同但文件名不同的图片共用同一个缓存文件。源图片不大于目标尺寸时不放大，直接返回原路径。
+
+    Args:
+        src: 源图片路径
+        box_width: 图框宽度（PDF单位）
+        box_height: 图框高度（PDF单位）
+        dpi: 输出分辨率，0表示不缩放
+        cache_dir: 缓存目录，默认为源图片目录下的.cache
+
+    Returns:
+        Path: 用于drawImage的图片路径
+    """
+    src = Path(src)
+    if dpi <= 0:
+        return src
+
+    target = (max(1, round(box_width * dpi / 72)), max(1, round(box_height * dpi / 72)))
+    with Image.open(src) as img:
+        if img.width <= target[0] and img.height <= target[1]:
+            return src
+
+        cache_dir = Path(cache_dir) if cache_dir else src.parent / IMAGE_CACHE_DIR
+        cached = cache_dir / f"{source_hash(src)[:20]}_{target[0]}x{target[1]}.jpg"
+        if cached.exists():
+            return cached
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        scaled = img.convert('RGB').resize(target, Image.LANCZOS)
+
+    save_cached_jpeg(scaled, cached, IMAGE_CACHE_QUALITY)
+    return cached
+
+
+def has_overlays(reader) -> bool:
+    """PDF是否在生成时已叠加印章和插图（reader为PyPDF2的PdfReader）"""
+    info = reader.metadata or {}
+    return OVERLAY_KEYWORD in str(info.get('/Keywords', ''))
+
+
+class PageOverlays:
+    """
+    页面叠加层
+
+    页码为PDF页码（从1开始，包括封面），与yins.cfg和images.cfg中的页码一致。
+    同一图片文件由reportlab在文档中只嵌入一次，多页引用同一对象。
+    """
+
+    def __init__(self, book_dir, dims: Dict, pdf_names: Iterable[str] = (),
+                 image_dpi: int = DEFAULT_IMAGE_DPI):
+        """
+        初始化叠加层
+
+        Args:
+            book_dir: 书籍目录，印章图片在yins/下，插图在images/下
+            dims: 尺寸参数，包括bg_width、bg_height、bg_top、bg_bottom、bg_right、
+                col_num、lc_width、cw、rh，与addyins.py和insertimg.py的calculate_dimensions一致
+            pdf_names: yins.cfg中与本次输出对应的PDF文件名（不含.pdf）
+            image_dpi: 插图预缩放的输出分辨率，0表示使用原图
+        """
+        self.book_dir = Path(book_dir)
+        self.dims = dims
+        self.image_dpi = image_dpi
+        self.yins: Dict[int, List[Dict]] = {}
+        self.images: Dict[int, List[Dict]] = {}
+        self.warnings: List[str] = []
+
+        yins_cfg = self.book_dir / 'yins.cfg'
+        if yins_cfg.exists():
+            self._load_yins_config(yins_cfg, set(pdf_names))
+        images_cfg = self.book_dir / 'images.cfg'
+        if images_cfg.exists():
+            self._load_images_config(images_cfg)
+
+    @staticmethod
+    def calculate_dimensions(canvas_config: Dict, row_num) -> Dict:
+        """按背景图配置和每列行数计算尺寸参数"""
+        bg_width = int(canvas_config.get('canvas_width', 2480))
+        bg_height = int(canvas_config.get('canvas_height', 1860))
+        bg_top = int(canvas_config.get('margins_top', 200))
+        bg_bottom = int(canvas_config.get('margins_bottom', 50))
+        bg_left = int(canvas_config.get('margins_left', 50))
+        bg_right = int(canvas_config.get('margins_right', 50))
+        col_num = int(canvas_config.get('leaf_col', 24))
+        lc_width = int(canvas_config.get('leaf_center_width', 120))
+        row_num = int(row_num)
+
+        return {
+            'bg_width': bg_width,
+            'bg_height': bg_height,
+            'bg_top': bg_top,
+            'bg_bottom': bg_bottom,
+            'bg_left': bg_left,
+            'bg_right': bg_right,
+            'col_num': col_num,
+            'lc_width': lc_width,
+            'cw': (bg_width - bg_left - bg_right - lc_width) / col_num,
+            'rh': (bg_height - bg_top - bg_bottom) / row_num,
+        }
+
+    def _load_yins_config(self, file_path: Path, pdf_names: set):
+        """加载印章配置，格式：PDF文件名|页码,起始列,起始行,宽度列数|印章文件"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+
+                parts = line.split('|')
+                if len(parts) < 3 or parts[0] not in pdf_names:
+                    continue
+
+                pos_parts = parts[1].split(',')
+                if len(pos_parts) < 4:
+                    continue
+                try:
+                    yin_info = {
+                        'pid': int(pos_parts[0]),
+                        'col_begin': float(pos_parts[1]),
+                        'row_begin': float(pos_parts[2]),
+                        'cols': float(pos_parts[3]),
+                        'filename': parts[2],
+                    }
+                except ValueError as e:
+                    self.warnings.append(f"无法解析印章配置行: {line} - {e}")
+                    continue
+                self.yins.setdefault(yin_info['pid'], []).append(yin_info)
+
+    def _load_images_config(self, file_path: Path):
+        """加载插图配置，格式：页码|起始列|结束列|图片编号"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+
+                parts = line.split('|')
+                if len(parts) < 4:
+                    continue
+                try:
+                    image_info = {
+                        'pid': int(parts[0]),
+                        'col_begin': int(parts[1]),
+                        'col_end': int(parts[2]),
+                        'img_id': parts[3],
+                    }
+                except ValueError as e:
+                    self.warnings.append(f"无法解析图片配置行: {line} - {e}")
+                    continue
+                self.images.setdefault(image_info['pid'], []).append(image_info)
+
+    def __bool__(self) -> bool:
+        return bool(self.yins or self.images)
+
+    def summary(self) -> str:
+        """叠加内容统计"""
+        yins_num = sum(len(v) for v in self.yins.values())
+        images_num = sum(len(v) for v in self.images.values())
+        return f"印章{yins_num}枚，插图{images_num}幅"
+
+    def insert_image(self, image_info: Dict, c):
+        """在指定列插入整列插图 - 对应tools/insertimg.py"""
+        dims = self.dims
+        col_begin = image_info['col_begin']
+        col_end = image_info['col_end']
+
+        iw = (col_end - col_begin + 1) * dims['cw']
+        ix = dims['bg_width'] - dims['bg_right'] - dims['cw'] * col_end
+        if col_begin > dims['col_num'] / 2:
+            ix -= dims['lc_width']
+        iy = dims['bg_bottom']
+        ih = dims['bg_height'] - dims['bg_top'] - dims['bg_bottom']
+
+        img_path = self.book_dir / 'images' / f"{image_info['img_id']}.jpg"
+        if not img_path.exists():
+            self.warnings.append(f"图片文件 {img_path} 不存在")
+            return
+
+        # 白色底框遮住该列的界栏
+        c.saveState()
+        c.setFillColor('white')
+        c.setStrokeColor('white')
+        c.rect(ix + 10, iy + 1, iw - 20, ih - 3, fill=1, stroke=1)
+        c.restoreState()
+        img_path = prepare_image(img_path, iw - 20, ih - 20, self.image_dpi)
+        c.drawImage(str(img_path), ix + 10, iy + 10, iw - 20, ih - 20)
+
+    def insert_yin(self, yin_info: Dict, c):
+        """在指定位置插入印章 - 对应books/<id>/addyins.py"""
+        dims = self.dims
+        col_begin = yin_info['col_begin']
+
+        iw = yin_info['cols'] * dims['cw']
+        ix = dims['bg_width'] - dims['bg_right'] - dims['cw'] * col_begin
+        iy = dims['bg_bottom'] + dims['rh'] * (yin_info['row_begin'] - 1)
+        if col_begin > dims['col_num'] / 2:
+            ix -= dims['lc_width']
+
+        yin_path = self.book_dir / 'yins' / yin_info['filename']
+        if not yin_path.exists():
+            self.warnings.append(f"印章文件 {yin_path} 不存在")
+            return
+        c.drawImage(str(yin_path), ix, iy, width=iw, preserveAspectRatio=True)
+
+    def draw(self, c, pid: int):
+        """绘制第pid页的插图和印章，印章在插图之上"""
+        for image_info in self.images.get(pid, ()):
+            self.insert_image(image_info, c)
+        for yin_info in self.yins.get(pid, ()):
+            self.insert_yin(yin_info, c)
+
+    def attach(self, c, page_offset: int = 0):
+        """挂接到画布：每页结束（showPage，包括save时的最后一页）前绘制该页的叠加内容
+
+        分片生成的PDF片段不从第1页开始，page_offset为片段第1页之前的PDF页数
+        """
+        show_page = c.showPage
+
+        def showPage():
+            self.draw(c, c.getPageNumber() + page_offset)
+            show_page()
+
+        c.showPage = showPage
+        c.setKeywords(OVERLAY_KEYWORD)
+        return c
+
+    def render(self, page_count: int, pagesize: Tuple[float, float]) -> Optional[Tuple[bytes, Dict[int, int]]]:
+        """
+        把叠加内容单独画成PDF，每个有叠加内容的页一页，供监视模式合成时逐页合并
+
+        Args:
+            page_count: 输出的PDF页数，超出的页码不画
+            pagesize: 页面尺寸
+
+        Returns:
+            Optional[Tuple[bytes, Dict[int, int]]]: PDF数据和页码 -> 叠加页序号（从0开始），没有叠加内容时为None
+        """
+        from io import BytesIO
+        from reportlab.pdfgen import canvas
+
+        pids = sorted(pid for pid in set(self.yins) | set(self.images) if 1 <= pid <= page_count)
+        if not pids:
+            return None
+        packet = BytesIO()
+        c = canvas.Canvas(packet, pagesize=pagesize)
+        pages = {}
+        for pid in pids:
+            self.draw(c, pid)
+            c.showPage()
+            pages[pid] = len(pages)
+        c.save()
+        return packet.getvalue(), pages
+
+    def check_pages(self, page_count: int) -> Optional[str]:
+        """检查配置中超出输出页数的页码，返回提示信息"""
+        pids = sorted(pid for pid in set(self.yins) | set(self.images) if not 1 <= pid <= page_count)
+        if pids:
+            return f"页码 {', '.join(map(str, pids))} 超出PDF页数 {page_count}，未叠加"
+        return None
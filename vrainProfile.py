@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能分析
+
+vrain.py --profile 或GUI中勾选“性能分析”时，在生成过程外包一层分析器，结束后在输出旁写入：
+
+    <输出>.pstats          cProfile数据，可用python -m pstats、snakeviz等查看
+    <输出>.collapsed.txt   折叠调用栈（每行“栈帧;栈帧;... 数值”），可直接交给flamegraph.pl、speedscope
+
+并打印最耗时的函数。两种模式：
+    cprofile  确定性分析，记录每次函数调用，开销较大，适合短的构建和-z测试模式
+    sample    采样分析，后台线程每隔几毫秒记录一次构建线程的调用栈，开销很小，适合长的构建；
+              只输出折叠调用栈和热点函数，不生成.pstats
+
+分析器只记录启动它的线程，GUI在后台线程中生成时同样适用。
+cProfile只记录调用关系，折叠调用栈按调用边的累计时间比例展开，数值单位为微秒；采样模式的数值为采样次数。
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+# 打印的热点函数数
+TOP_FUNCTIONS = 20
+
+# cProfile展开折叠调用栈的最大深度，以及忽略的最小时间（微秒）
+MAX_DEPTH = 128
+MIN_MICROSECONDS = 100
+
+# 栈帧：(文件名, 行号, 函数名)，与pstats的函数标识一致
+Frame = Tuple[str, int, str]
+
+
+def frame_label(frame: Frame) -> str:
+    """折叠调用栈中的栈帧名称，不含分号"""
+    filename, lineno, name = frame
+    if filename == '~':
+        # cProfile对内置函数的记法
+        return name.replace(';', ':')
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(';', ':')
+
+
+class Profiler:
+    """
+    分析器
+
+    start/stop之间记录当前线程；save写入分析结果，format_top返回热点函数表。
+    """
+
+    def __init__(self, mode: str = 'cprofile', interval: float = SAMPLE_INTERVAL):
+        """
+        初始化分析器
+
+        Args:
+            mode: cprofile或sample
+            interval: 采样间隔（秒），仅sample模式使用
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"未知的分析模式：{mode}，应为{'或'.join(PROFILE_MODES)}")
+        self.mode = mode
+        self.interval = interval
+        self.elapsed = 0.0
+        self._start = 0.0
+        self._profile = None
+        self._stats = None
+        # 采样模式：调用栈（由外到内） -> 次数
+        self.samples: Counter = Counter()
+        self._thread_id = None
+        self._stop_event = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self):
+        """开始记录当前线程"""
+        self._start = time.perf_counter()
+        if self.mode == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._thread_id = threading.get_ident()
+            self._stop_event.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name='vrain-profiler', daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        """停止记录"""
+        if self.mode == 'cprofile':
+            self._profile.disable()
+            import pstats
+            import io
+            self._stats = pstats.Stats(self._profile, stream=io.StringIO())
+        else:
+            self._stop_event.set()
+            self._sampler.join()
+        self.elapsed = time.perf_counter() - self._start
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _sample_loop(self):
+        """采样线程：按间隔记录被分析线程的调用栈"""
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> Dict[str, int]:
+        """
+        折叠调用栈
+
+        Returns:
+            Dict[str, int]: “栈帧;栈帧;...” -> 微秒（cprofile）或采样次数（sample）
+        """
+        if self.mode == 'sample':
+            result: Counter = Counter()
+            for stack, count in self.samples.items():
+                result[';'.join(frame_label(frame) for frame in stack)] += count
+            return dict(result)
+
+        stats = self._stats.stats
+        callees: Dict[Frame, List[Tuple[Frame, float]]] = {}
+        for func, (_, _, _, _, callers) in stats.items():
+            for caller, edge in callers.items():
+                callees.setdefault(caller, []).append((func, edge[3]))
+        roots = [func for func, value in stats.items() if not value[4]]
+
+        result: Counter = Counter()
+
+        def visit(func: Frame, path: List[str], share: float):
+            label = path + [frame_label(func)]
+            self_time = int(stats[func][2] * share * 1e6)
+            if self_time >= MIN_MICROSECONDS:
+                result[';'.join(label)] += self_time
+            if len(label) >= MAX_DEPTH:
+                return
+            for callee, edge_cumulative in callees.get(func, ()):
+                callee_cumulative = stats[callee][3]
+                if not callee_cumulative or frame_label(callee) in label:
+                    continue
+                child_share = share * edge_cumulative / callee_cumulative
+                if child_share * callee_cumulative * 1e6 >= MIN_MICROSECONDS:
+                    visit(callee, label, child_share)
+
+        for root in roots:
+            visit(root, [], 1.0)
+        return dict(result)
+
+    def top(self, n: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+        """
+        热点函数，按自身耗时（cprofile）或自身采样数（sample）排序
+
+        Returns:
+            List[Dict[str, Any]]: function、calls（仅cprofile）、self、total，
+                cprofile为秒，sample为占采样总数的比例
+        """
+        rows = []
+        if self.mode == 'cprofile':
+            for func, (_, calls, tottime, cumtime, _) in self._stats.stats.items():
+                rows.append({'function': frame_label(func), 'calls': calls, 'self': tottime, 'total': cumtime})
+        else:
+            total_samples = sum(self.samples.values()) or 1
+            own: Counter = Counter()
+            inclusive: Counter = Counter()
+            for stack, count in self.samples.items():
+                own[stack[-1]] += count
+                for frame in set(stack):
+                    inclusive[frame] += count
+            for frame, count in own.items():
+                rows.append({'function': frame_label(frame), 'self': count / total_samples,
+                             'total': inclusive[frame] / total_samples})
+        rows.sort(key=lambda row: row['self'], reverse=True)
+        return rows[:n]
+
+    def format_top(self, n: int = TOP_FUNCTIONS) -> str:
+        """热点函数表"""
+        if self.mode == 'cprofile':
+            lines = [f"性能分析（cProfile）：{self.elapsed:.2f}秒，最耗时的{n}个函数（按自身耗时）：",
+                     f"\t{'调用次数':>10}  {'自身(秒)':>9}  {'累计(秒)':>9}  函数"]
+            for row in self.top(n):
+                lines.append(f"\t{row['calls']:>14}  {row['self']:>10.3f}  {row['total']:>10.3f}  {row['function']}")
+        else:
+            total_samples = sum(self.samples.values())
+            lines = [f"性能分析（采样）：{self.elapsed:.2f}秒，{total_samples}次采样，最耗时的{n}个函数（按自身采样数）：",
+                     f"\t{'自身':>6}  {'累计':>6}  函数"]
+            for row in self.top(n):
+                lines.append(f"\t{row['self'] * 100:7.1f}%  {row['total'] * 100:7.1f}%  {row['function']}")
+        return '\n'.join(lines)
+
+    def save(self, base: Union[str, Path]) -> List[Path]:
+        """
+        写入分析结果
+
+        Args:
+            base: 输出文件名前缀，写入<base>.pstats（仅cprofile）和<base>.collapsed.txt；
+                采样模式不写.pstats，并删除之前cprofile模式留下的<base>.pstats，以免与本次结果混淆
+
+        Returns:
+            List[Path]: 写入的文件
+        """
+        base = str(base)
+        paths = []
+        path = Path(f"{base}.pstats")
+        if self.mode == 'cprofile':
+            self._stats.dump_stats(str(path))
+            paths.append(path)
+        else:
+            path.unlink(missing_ok=True)
+        path = Path(f"{base}.collapsed.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, value in sorted(self.collapsed().items()):
+                f.write(f"{stack} {value}\n")
+        paths.append(path)
+        return paths
+
+
+def output_base(output: Any) -> Optional[str]:
+    """生成结果对应的分析文件前缀：PDF、PNG去掉扩展名，图片目录直接使用"""
+    if output is None or not isinstance(output, (str, Path)):
+        return None
+    output = str(output)
+    for suffix in ('.pdf', '.png', '.json'):
+        if output.lower().endswith(suffix):
+            return output[:-len(suffix)]
+    return output
+
+
+def profile_call(func: Callable[[], Any], mode: str, fallback_base: Union[str, Path],
+                 log: Callable[[str], None] = print, top: int = TOP_FUNCTIONS) -> Any:
+    """
+    在分析器中执行func，结束后（包括失败时）写入分析结果并输出热点函数
+
+    Args:
+        func: 生成函数，返回输出路径
+        mode: cprofile或sample
+        fallback_base: 生成失败或没有输出路径时的文件名前缀
+        log: 输出函数
+        top: 输出的热点函数数
+
+    Returns:
+        func的返回值
+    """
+    profiler = Profiler(mode)
+    output = None
+    profiler.start()
+    try:
+        output = func()
+        return output
+    finally:
+        profiler.stop()
+        base = output_base(output) or str(fallback_base)
+        for path in profiler.save(base):
+            log(f"写入性能分析结果'{path}'...完成！")
+        log(profiler.format_top(top))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+排版进度与取消协议
+
+两个排版引擎共用：ProgressReporter挂接到画布的showPage上，每排完一页报告一次进度
+（已排版页数、已渲染页数、预计总页数、已用时间），并在页边界检查CancelToken，
+取消时抛出BuildCancelled，reportlab只在save时写文件，因此不会留下半个PDF。
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class BuildCancelled(Exception):
+    """构建被用户取消"""
+
+
+class CancelToken:
+    """
+    取消令牌
+
+    GUI线程调用cancel()，排版线程在页边界调用check()。
+    跨进程使用时传入multiprocessing.Manager().Event()等具有set/is_set方法的事件对象。
+    """
+
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        """已取消时抛出BuildCancelled"""
+        if self._event.is_set():
+            raise BuildCancelled("构建已取消")
+
+
+class ProgressReporter:
+    """
+    进度报告器
+
+    回调参数为字典：stage（layout、render、save、compress、done）、pages_laid_out、
+    pages_rendered、total_pages（预计总页数）、raster（是否输出图片）、elapsed（秒）。
+    排版和渲染进度按min_interval节流，阶段变化总是立即报告。
+    """
+
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 cancel_token: Optional[CancelToken] = None, raster: bool = False,
+                 min_interval: float = 0.1):
+        self.callback = callback
+        self.cancel_token = cancel_token
+        self.raster = raster
+        self.min_interval = min_interval
+        self.stage = 'layout'
+        self.pages_laid_out = 0
+        self.pages_rendered = 0
+        self.total_pages = 0
+        self.start = time.time()
+        self._last_emit = 0.0
+
+    def emit(self, force: bool = False):
+        """向回调报告当前进度"""
+        if not self.callback:
+            return
+        now = time.time()
+        if not force and now - self._last_emit < self.min_interval:
+            return
+        self._last_emit = now
+        self.callback({
+            'stage': self.stage,
+            'pages_laid_out': self.pages_laid_out,
+            'pages_rendered': self.pages_rendered,
+            'total_pages': max(self.total_pages, self.pages_laid_out),
+            'raster': self.raster,
+            'elapsed': now - self.start,
+        })
+
+    def check_cancel(self):
+        if self.cancel_token:
+            self.cancel_token.check()
+
+    def set_total(self, total_pages: int):
+        """设置预计总页数"""
+        self.total_pages = max(1, int(total_pages))
+        self.emit(force=True)
+
+    def set_stage(self, stage: str):
+        """进入新阶段，先检查是否已取消"""
+        self.check_cancel()
+        self.stage = stage
+        self.emit(force=True)
+
+    def page_laid_out(self, pages: int):
+        """排完第pages页"""
+        self.pages_laid_out = pages
+        self.emit()
+        self.check_cancel()
+
+    def page_rendered(self, pages: int):
+        """渲染完第pages页图片"""
+        self.pages_rendered = pages
+        self.emit()
+        self.check_cancel()
+
+    def finish(self):
+        self.stage = 'done'
+        self.total_pages = self.pages_laid_out
+        self.emit(force=True)
+
+    def attach(self, c):
+        """挂接到画布：每页结束（showPage）后报告进度并检查取消"""
+        show_page = c.showPage
+
+        def showPage():
+            show_page()
+            self.page_laid_out(c.getPageNumber() - 1)
+
+        c.showPage = showPage
+        return c
+
+
+def format_progress(info: Dict[str, Any]) -> str:
+    """把进度字典格式化为'排版 12/40页 30% 剩余约20秒'"""
+    stage_names = {'layout': '排版', 'render': '渲染', 'save': '保存', 'compress': '压缩', 'done': '完成'}
+    percent = progress_percent(info)
+    text = f"{stage_names.get(info['stage'], info['stage'])} "
+    if info['stage'] == 'render':
+        text += f"{info['pages_rendered']}/{info['total_pages']}页"
+    else:
+        text += f"{info['pages_laid_out']}/{info['total_pages']}页"
+    text += f" {percent:.0f}%"
+    eta = progress_eta(info)
+    if eta is not None:
+        text += f" 剩余约{eta:.0f}秒"
+    return text
+
+
+def progress_percent(info: Dict[str, Any]) -> float:
+    """进度百分比：排版占90%，保存与压缩占其余；图片输出时排版与渲染各占一半"""
+    total = max(1, info['total_pages'])
+    layout_share = 50 if info.get('raster') else 90
+    if info['stage'] == 'done':
+        return 100.0
+    if info['stage'] == 'render':
+        return layout_share + (100 - layout_share) * min(1.0, info['pages_rendered'] / total)
+    if info['stage'] in ('save', 'compress'):
+        return float(layout_share)
+    return layout_share * min(1.0, info['pages_laid_out'] / total)
+
+
+def progress_eta(info: Dict[str, Any]) -> Optional[float]:
+    """按已用时间和当前阶段的完成比例估算剩余秒数"""
+    if info['stage'] not in ('layout', 'render'):
+        return None
+    done = info['pages_rendered'] if info['stage'] == 'render' else info['pages_laid_out']
+    if done <= 0:
+        return None
+    percent = progress_percent(info)
+    if percent <= 0:
+        return None
+    return info['elapsed'] * (100 - percent) / percent
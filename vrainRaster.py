@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+vRain栅格输出后端
+Python版本 by msyloveldx, 2025/08
+
+排版引擎照常向画布发出绘制指令，RecordingCanvas只记录每页的绘制操作，
+再由RasterRenderer用Pillow把操作直接绘制到背景图上，输出PNG/WebP图片。
+主要功能包括：
+- 兼容排版引擎所用的reportlab画布接口子集
+- 记录每页的文字、线条、图片等绘制操作
+- 多进程并行渲染页面，省去先生成PDF再转图片的过程
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Any
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from reportlab.pdfgen.canvas import aspectRatioFix
+
+# 支持的栅格输出格式
+RASTER_FORMATS = ('png', 'webp')
+
+
+def _normalize_color(color) -> Any:
+    """
+    将颜色统一为Pillow可用、可序列化的形式
+
+    Args:
+        color: 颜色名、十六进制字符串或reportlab颜色对象
+
+    Returns:
+        颜色字符串或RGB元组
+    """
+    if isinstance(color, str):
+        return color
+    if hasattr(color, 'rgb'):
+        r, g, b = color.rgb()
+        return (int(round(r * 255)), int(round(g * 255)), int(round(b * 255)))
+    return 'black'
+
+
+class RecordingCanvas:
+    """
+    记录绘制操作的画布
+
+    实现排版引擎用到的reportlab画布接口，记录下来的操作均为绝对坐标
+    （PDF坐标系，原点在左下角），可直接跨进程传递给渲染器。
+    keep_ops为False时只统计页数，翻页即丢弃已记录的操作，用于只需分页信息的预排版。
+    """
+
+    def __init__(self, filename=None, pagesize: Tuple[float, float] = (2480, 1860),
+                 keep_ops: bool = True):
+        self._filename = filename
+        self._pagesize = pagesize
+        self._keep_ops = keep_ops
+        self.pages: List[List[tuple]] = []
+        self.metadata: Dict[str, str] = {}
+        self._ops: List[tuple] = []
+        self._image_sizes: Dict[str, Tuple[int, int]] = {}
+        self._reset_state()
+        self._state_stack = []
+
+    def _reset_state(self):
+        """重置图形状态"""
+        self._matrix = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+        self._font = (None, 12)
+        self._fill = 'black'
+        self._stroke = 'black'
+        self._line_width = 1
+
+    # 元数据
+    def setTitle(self, title):
+        self.metadata['title'] = title
+
+    def setAuthor(self, author):
+        self.metadata['author'] = author
+
+    def setCreator(self, creator):
+        self.metadata['creator'] = creator
+
+    def setProducer(self, producer):
+        self.metadata['producer'] = producer
+
+    def setSubject(self, subject):
+        self.metadata['subject'] = subject
+
+    def setKeywords(self, keywords):
+        self.metadata['keywords'] = keywords
+
+    # 页面
+    def getPageNumber(self) -> int:
+        return len(self.pages) + 1
+
+    def showPage(self):
+        self.pages.append(self._ops if self._keep_ops else [])
+        self._ops = []
+        self._reset_state()
+        self._state_stack = []
+
+    def save(self):
+        if self._ops:
+            self.showPage()
+
+    # 图形状态
+    def saveState(self):
+        self._state_stack.append((self._matrix, self._font, self._fill,
+                                  self._stroke, self._line_width))
+
+    def restoreState(self):
+        (self._matrix, self._font, self._fill,
+         self._stroke, self._line_width) = self._state_stack.pop()
+
+    def translate(self, dx, dy):
+        a, b, c, d, e, f = self._matrix
+        self._matrix = (a, b, c, d, e + a * dx + c * dy, f + b * dx + d * dy)
+
+    def rotate(self, theta):
+        t = math.radians(theta)
+        cos_t, sin_t = math.cos(t), math.sin(t)
+        a, b, c, d, e, f = self._matrix
+        self._matrix = (a * cos_t + c * sin_t, b * cos_t + d * sin_t,
+                        c * cos_t - a * sin_t, d * cos_t - b * sin_t, e, f)
+
+    def _transform(self, x, y) -> Tuple[float, float]:
+        a, b, c, d, e, f = self._matrix
+        return a * x + c * y + e, b * x + d * y + f
+
+    def _angle(self) -> float:
+        a, b = self._matrix[0], self._matrix[1]
+        return math.degrees(math.atan2(b, a))
+
+    def setFont(self, name, size, leading=None):
+        self._font = (name, size)
+
+    def setFillColor(self, color, alpha=None):
+        self._fill = _normalize_color(color)
+
+    def setStrokeColor(self, color, alpha=None):
+        self._stroke = _normalize_color(color)
+
+    def setLineWidth(self, width):
+        self._line_width = width
+
+    # 绘制
+    def drawString(self, x, y, text, *args, **kwargs):
+        px, py = self._transform(x, y)
+        name, size = self._font
+        self._ops.append(('text', name, size, self._fill, px, py, self._angle(), text))
+
+    def line(self, x1, y1, x2, y2):
+        px1, py1 = self._transform(x1, y1)
+        px2, py2 = self._transform(x2, y2)
+        self._ops.append(('line', self._stroke, self._line_width, px1, py1, px2, py2))
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        px, py = self._transform(x, y)
+        self._ops.append(('rect', self._fill if fill else None,
+                          self._stroke if stroke else None,
+                          self._line_width, px, py, width, height))
+
+    def drawImage(self, image, x, y, width=None, height=None, mask=None,
+                  preserveAspectRatio=False, anchor='c', **kwargs):
+        path = str(image)
+        if path not in self._image_sizes:
+            with Image.open(path) as img:
+                self._image_sizes[path] = img.size
+        im_width, im_height = self._image_sizes[path]
+        # 与reportlab一致：未指定的宽高取图片本身尺寸
+        if width is None:
+            width = im_width
+        if height is None:
+            height = im_height
+        x, y, width, height, _ = aspectRatioFix(preserveAspectRatio, anchor, x, y,
+                                                width, height, im_width, im_height)
+        px, py = self._transform(x, y)
+        self._ops.append(('image', path, px, py, width, height))
+        return im_width, im_height
+
+
+class RasterRenderer:
+    """
+    栅格页面渲染器
+
+    将RecordingCanvas记录的页面操作绘制为Pillow图像。
+    字体对象和缩放后的图片按需缓存，同一进程内重复使用。
+    """
+
+    def __init__(self, font_paths: Dict[str, str], pagesize: Tuple[float, float],
+                 scale: float = 1.0):
+        """
+        初始化渲染器
+
+        Args:
+            font_paths: 字体注册名到字体文件路径的映射
+            pagesize: 页面尺寸（PDF单位）
+            scale: 输出像素与PDF单位的比例
+        """
+        self.font_paths = font_paths
+        self.pagesize = pagesize
+        self.scale = scale
+        self.width = int(round(pagesize[0] * scale))
+        self.height = int(round(pagesize[1] * scale))
+        self._fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = {}
+        self._images: Dict[Tuple[str, int, int], Image.Image] = {}
+
+    def _get_font(self, name: str, size: float) -> Optional[ImageFont.FreeTypeFont]:
+        """获取缩放后的字体对象"""
+        px = max(1, int(round(size * self.scale)))
+        key = (name, px)
+        if key not in self._fonts:
+            path = self.font_paths.get(name)
+            if not path:
+                return None
+            self._fonts[key] = ImageFont.truetype(path, px)
+        return self._fonts[key]
+
+    def _get_image(self, path: str, width: int, height: int) -> Image.Image:
+        """获取缩放到目标尺寸的图片"""
+        key = (path, width, height)
+        if key not in self._images:
+            with Image.open(path) as img:
+                mode = 'RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB'
+                self._images[key] = img.convert(mode).resize((width, height), Image.LANCZOS)
+        return self._images[key]
+
+    def _y(self, y: float) -> float:
+        """PDF纵坐标转换为图像纵坐标"""
+        return (self.pagesize[1] - y) * self.scale
+
+    def render_page(self, ops: List[tuple]) -> Image.Image:
+        """
+        渲染一页
+
+        Args:
+            ops: 页面绘制操作列表
+
+        Returns:
+            Image.Image: 渲染后的页面图像
+        """
+        page = Image.new('RGB', (self.width, self.height), 'white')
+        draw = ImageDraw.Draw(page)
+        s = self.scale
+
+        for op in ops:
+            kind = op[0]
+            if kind == 'text':
+                _, name, size, color, x, y, angle, text = op
+                font = self._get_font(name, size)
+                if font is None or not text.strip():
+                    continue
+                if abs(angle) < 0.01:
+                    draw.text((x * s, self._y(y)), text, font=font,
+                              fill=color, anchor='ls')
+                else:
+                    self._draw_rotated_text(page, x * s, self._y(y), text, font, color, angle)
+            elif kind == 'line':
+                _, color, width, x1, y1, x2, y2 = op
+                draw.line([(x1 * s, self._y(y1)), (x2 * s, self._y(y2))],
+                          fill=color, width=max(1, int(round(width * s))))
+            elif kind == 'rect':
+                _, fill, stroke, width, x, y, w, h = op
+                draw.rectangle([x * s, self._y(y + h), (x + w) * s, self._y(y)],
+                               fill=fill, outline=stroke,
+                               width=max(1, int(round(width * s))))
+            elif kind == 'image':
+                _, path, x, y, w, h = op
+                iw, ih = max(1, int(round(w * s))), max(1, int(round(h * s)))
+                try:
+                    img = self._get_image(path, iw, ih)
+                except OSError:
+                    continue
+                box = (int(round(x * s)), int(round(self._y(y + h))))
+                if img.mode == 'RGBA':
+                    page.paste(img, box, img)
+                else:
+                    page.paste(img, box)
+
+        return page
+
+    def _draw_rotated_text(self, page: Image.Image, x: float, y: float, text: str,
+                           font: ImageFont.FreeTypeFont, color, angle: float):
+        """绘制旋转文字，(x, y)为图像坐标系中的基线起点"""
+        left, top, right, bottom = font.getbbox(text, anchor='ls')
+        if right <= left or bottom <= top:
+            return
+        mask = Image.new('L', (right - left, bottom - top), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255, anchor='ls')
+
+        # 以遮罩中心旋转，再求基线起点在旋转后图像中的位置
+        cx, cy = mask.width / 2, mask.height / 2
+        dx, dy = -left - cx, -top - cy
+        rotated = mask.rotate(angle, resample=Image.BICUBIC, expand=True)
+        t = math.radians(angle)
+        ox = rotated.width / 2 + dx * math.cos(t) + dy * math.sin(t)
+        oy = rotated.height / 2 - dx * math.sin(t) + dy * math.cos(t)
+
+        px, py = int(round(x - ox)), int(round(y - oy))
+        fill = Image.new('RGB', rotated.size, ImageColor.getrgb(color) if isinstance(color, str) else color)
+        page.paste(fill, (px, py, px + rotated.width, py + rotated.height), rotated)
+
+
+def encode_image(img: Image.Image, fmt: str = 'png', quality: int = 90) -> bytes:
+    """
+    将页面图像编码为PNG/WebP字节
+
+    Args:
+        img: 页面图像
+        fmt: 输出格式，png或webp
+        quality: WebP质量（1-100），PNG为无损格式，忽略该参数
+
+    Returns:
+        bytes: 编码后的图片数据
+    """
+    buf = BytesIO()
+    _save_image(img, buf, fmt, quality)
+    return buf.getvalue()
+
+
+def _save_image(img: Image.Image, target, fmt: str, quality: int):
+    """按格式保存图像"""
+    if fmt == 'webp':
+        img.save(target, 'WEBP', quality=quality, method=4)
+    else:
+        img.save(target, 'PNG', compress_level=6)
+
+
+# 工作进程内的渲染器，由进程池初始化函数创建
+_worker_renderer: Optional[RasterRenderer] = None
+_worker_format = 'png'
+_worker_quality = 90
+
+
+def _init_worker(font_paths, pagesize, scale, fmt, quality):
+    """进程池初始化：每个工作进程创建一个渲染器"""
+    global _worker_renderer, _worker_format, _worker_quality
+    _worker_renderer = RasterRenderer(font_paths, pagesize, scale)
+    _worker_format = fmt
+    _worker_quality = quality
+
+
+def _render_to_file(job) -> str:
+    """工作进程中渲染一页并写入文件"""
+    ops, out_path = job
+    img = _worker_renderer.render_page(ops)
+    _save_image(img, out_path, _worker_format, _worker_quality)
+    return out_path
+
+
+def render_pages(pages: List[List[tuple]], font_paths: Dict[str, str],
+                 pagesize: Tuple[float, float], out_dir, fmt: str = 'png',
+                 quality: int = 90, scale: float = 1.0,
+                 workers: Optional[int] = None, progress=None) -> List[str]:
+    """
+    并行渲染全部页面并写入输出目录
+
+    Args:
+        pages: 每页的绘制操作列表
+        font_paths: 字体注册名到字体文件路径的映射
+        pagesize: 页面尺寸（PDF单位）
+        out_dir: 输出目录
+        fmt: 输出格式，png或webp
+        quality: WebP质量
+        scale: 输出像素与PDF单位的比例
+        workers: 工作进程数，默认为CPU核数
+        progress: 每渲染完一页调用progress(已完成页数)，抛出异常时取消尚未开始的页面
+
+    Returns:
+        List[str]: 按页序排列的图片文件路径
+    """
+    if fmt not in RASTER_FORMATS:
+        raise ValueError(f"不支持的图片格式: {fmt}")
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(ops, str(out_dir / f"{i:04d}.{fmt}")) for i, ops in enumerate(pages, 1)]
+
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(jobs)) if jobs else 1
+
+    paths = []
+    if workers <= 1:
+        _init_worker(font_paths, pagesize, scale, fmt, quality)
+        for job in jobs:
+            paths.append(_render_to_file(job))
+            if progress:
+                progress(len(paths))
+        return paths
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(font_paths, pagesize, scale, fmt, quality))
+    futures = [pool.submit(_render_to_file, job) for job in jobs]
+    try:
+        for future in futures:
+            paths.append(future.result())
+            if progress:
+                progress(len(paths))
+    finally:
+        # shutdown的cancel_futures参数需要Python 3.9，这里逐个取消尚未开始的页面
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=True)
+    return paths
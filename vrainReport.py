@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+构建报告
+
+两个排版引擎共用：按阶段计时（读取配置、读取文本、注册字体、封面、排版、保存、压缩、渲染图片），
+并统计绘制字数、旋转字数、页数、批注段数、后备字体查找、字体探测、简繁转换和缺字替换。
+生成结束后在PDF旁边写入同名的.report.json，--report时另外打印汇总表。
+
+stages中各阶段互不重叠，合计接近总耗时；canvas中的draw（drawString）和showpage（结束一页）
+由挂接到画布上的计时得到，发生在排版等阶段之内，用于区分排版计算与reportlab绘制的耗时。
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Union
+
+# 报告格式版本
+REPORT_VERSION = 1
+
+# 计数器，固定出现在报告中
+COUNTERS = (
+    'pages',            # 页数（含封面）
+    'glyphs',           # 绘制的字数（drawString次数）
+    'rotated_glyphs',   # 旋转绘制的字数
+    'comment_blocks',   # 批注段数
+    'fallback_fonts',   # 使用后备字体的查找次数
+    'font_probes',      # 字符支持情况未缓存、实际探测字体的次数
+    'st_conversions',   # 简繁转换后改用主字体的字数
+    'missing_glyphs',   # 所有字体都不支持、替换为□的字数
+)
+
+STAGE_NAMES = {
+    'config': '读取配置',
+    'texts': '读取文本',
+    'fonts': '注册字体',
+    'cover': '封面',
+    'layout': '排版',
+    'save': '保存PDF',
+    'compress': '压缩',
+    'render': '渲染图片',
+    'draw': '其中绘制文字',
+    'showpage': '其中结束页面',
+}
+
+
+class BuildReport:
+    """
+    构建报告
+
+    stage(name)计时一个阶段，同名阶段的时间累加；count(name)增加计数；
+    attach(c)挂接到画布，统计页数、绘制字数和旋转字数，并计时drawString和showPage。
+    """
+
+    def __init__(self, engine: str):
+        """
+        初始化构建报告
+
+        Args:
+            engine: 排版引擎，perfect或novel
+        """
+        self.engine = engine
+        self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.canvas: Dict[str, float] = {'draw': 0.0, 'showpage': 0.0}
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.info: Dict[str, Any] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """计时一个阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        """累加阶段耗时，例如压缩完成后补记压缩时间"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        """增加计数"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def attach(self, c):
+        """挂接到画布：包装drawString、rotate和showPage，统计字数、页数并计时"""
+        perf_counter = time.perf_counter
+        counters = self.counters
+        canvas_times = self.canvas
+        draw_string = c.drawString
+        rotate = c.rotate
+        show_page = c.showPage
+
+        def drawString(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return draw_string(*args, **kwargs)
+            finally:
+                canvas_times['draw'] += perf_counter() - start
+                counters['glyphs'] += 1
+
+        def rotateGlyph(*args, **kwargs):
+            counters['rotated_glyphs'] += 1
+            return rotate(*args, **kwargs)
+
+        def showPage():
+            start = perf_counter()
+            try:
+                show_page()
+            finally:
+                canvas_times['showpage'] += perf_counter() - start
+                counters['pages'] += 1
+
+        c.drawString = drawString
+        c.rotate = rotateGlyph
+        c.showPage = showPage
+        return c
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """报告内容"""
+        total = self.total_seconds
+        layout = self.stages.get('layout', 0.0)
+        return {
+            'version': REPORT_VERSION,
+            'engine': self.engine,
+            'started_at': self.started_at,
+            'total_seconds': round(total, 4),
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'canvas': {name: round(seconds, 4) for name, seconds in self.canvas.items()},
+            'counters': dict(self.counters),
+            'rates': {
+                'glyphs_per_sec': round(self.counters['glyphs'] / layout, 1) if layout else 0.0,
+                'pages_per_sec': round(self.counters['pages'] / total, 2) if total else 0.0,
+            },
+            **self.info,
+        }
+
+    def write(self, path: Union[str, Path]) -> Path:
+        """写入JSON报告"""
+        path = Path(path)
+        path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding='utf-8')
+        return path
+
+    def format_table(self) -> str:
+        """汇总表：各阶段耗时和占比，以及计数器"""
+        from vrainBatch import display_width, pad
+
+        data = self.to_dict()
+        total = data['total_seconds'] or 1.0
+        lines = [f"构建报告（{self.engine}）：总耗时{data['total_seconds']:.2f}秒"]
+        rows = list(data['stages'].items()) + list(data['canvas'].items())
+        labels = [STAGE_NAMES.get(name, name) for name, _ in rows]
+        width = max(map(display_width, labels), default=0)
+        for label, (name, seconds) in zip(labels, rows):
+            lines.append(f"\t{pad(label, width)}  {seconds:8.3f}秒  {seconds / total * 100:5.1f}%")
+        lines.append('\t' + '，'.join(f"{name}={value}" for name, value in data['counters'].items()))
+        return '\n'.join(lines)
+
+
+def report_path(output: Union[str, Path]) -> Path:
+    """PDF或图片目录对应的报告路径：同目录下同名的.report.json"""
+    output = Path(output)
+    name = output.stem if output.suffix.lower() == '.pdf' else output.name
+    return output.with_name(f"{name}.report.json")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地排版服务
+
+校对工具等程序每次调用vrain.py都要重新导入模块、加载OpenCC词典、注册字体。
+本服务常驻运行，由若干工作进程排版，每个工作进程持有一个引擎会话（vrainSession），
+字体、字符支持检查结果、简繁转换器、背景、预处理文本和分页索引在多次请求之间复用。
+排版通过程序接口（vrainAPI）进行，生成结果在内存中返回，不写入books目录。只使用标准库的http.server，默认只监听本机：
+
+    python vrainServer.py --port 8765 --workers 2
+
+接口：
+    GET  /health  服务状态（JSON）
+    POST /render  排版，请求体为JSON：
+        book_id     书籍ID，使用该书的book.cfg、背景和字体（必需）
+        text        上传的文本，给出时代替书籍的文本文件，作为第1个文本排版
+        config      book.cfg配置项覆盖，例如{"row_num": "24"}
+        from_page   起始文本序号，默认1
+        to_page     结束文本序号，默认等于from_page
+        test_pages  仅输出指定页数（同-z）
+        format      pdf或png，默认pdf
+        page        png时渲染的页码（0为封面），默认1
+        scale       png的缩放比例，默认1.0
+    成功时返回application/pdf或image/png；参数或排版错误返回400，队列已满返回503，
+    错误响应为JSON：{"error": 原因, "log": 排版日志末尾}。
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+# 错误响应附带的日志末尾行数
+ERROR_LOG_LINES = 20
+
+FORMATS = {'pdf': 'application/pdf', 'png': 'image/png'}
+
+
+class RenderError(Exception):
+    """请求参数错误或排版失败"""
+
+    def __init__(self, message: str, log: str = ''):
+        super().__init__(message)
+        self.log = log
+
+    def __reduce__(self):
+        # 从工作进程传回时保留日志
+        return (RenderError, (str(self), self.log))
+
+
+def parse_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    检查并规范化/render的请求参数
+
+    Args:
+        data: 请求体JSON
+
+    Returns:
+        Dict[str, Any]: 规范化后的请求
+
+    Raises:
+        RenderError: 参数不合法
+    """
+    if not isinstance(data, dict):
+        raise RenderError('请求体应为JSON对象')
+    book_id = str(data.get('book_id') or '')
+    if not book_id or '/' in book_id or '\\' in book_id or book_id.startswith('.'):
+        raise RenderError('book_id无效')
+    fmt = data.get('format', 'pdf')
+    if fmt not in FORMATS:
+        raise RenderError(f"format应为{'或'.join(FORMATS)}")
+    text = data.get('text')
+    if text is not None and not isinstance(text, str):
+        raise RenderError('text应为字符串')
+    config = data.get('config') or {}
+    if not isinstance(config, dict):
+        raise RenderError('config应为对象')
+
+    try:
+        from_page = int(data.get('from_page', 1))
+        to_page = int(data.get('to_page', from_page))
+        test_pages = int(data['test_pages']) if data.get('test_pages') else None
+        page = int(data.get('page', 1))
+        scale = float(data.get('scale', 1.0))
+    except (TypeError, ValueError):
+        raise RenderError('from_page、to_page、test_pages、page应为整数，scale应为数字')
+    if text is not None:
+        # 上传的文本是唯一的文本
+        from_page = to_page = 1
+    if from_page < 1 or to_page < from_page:
+        raise RenderError('文本序号范围无效')
+    if not 0 < scale <= 4:
+        raise RenderError('scale应在0到4之间')
+
+    return {
+        'book_id': book_id,
+        'text': text,
+        'config': {str(k): str(v) for k, v in config.items()},
+        'from_page': from_page,
+        'to_page': to_page,
+        'test_pages': test_pages,
+        'format': fmt,
+        'page': page,
+        'scale': scale,
+    }
+
+
+# 工作进程内的引擎会话，同一进程先后处理的请求共用
+_worker_session = None
+
+
+def _init_worker():
+    global _worker_session
+    from vrainSession import EngineSession
+    _worker_session = EngineSession()
+
+
+def render(request: Dict[str, Any]) -> bytes:
+    """
+    处理一个排版请求（在工作进程中调用）
+
+    Args:
+        request: parse_request规范化后的请求
+
+    Returns:
+        bytes: PDF或PNG数据
+
+    Raises:
+        RenderError: 排版失败，附带排版日志
+    """
+    from vrainAPI import VRainError, render_book, render_page
+
+    if _worker_session is None:
+        _init_worker()
+    texts = [request['text']] if request['text'] is not None else None
+    try:
+        if request['format'] == 'png':
+            return render_page(request['book_id'], request['page'], overrides=request['config'], texts=texts,
+                               from_page=request['from_page'], to_page=request['to_page'],
+                               scale=request['scale'], session=_worker_session)
+        return render_book(request['book_id'], overrides=request['config'], texts=texts,
+                           from_page=request['from_page'], to_page=request['to_page'],
+                           test_pages=request['test_pages'], session=_worker_session)
+    except VRainError as e:
+        raise RenderError(str(e), e.log)
+
+
+class RenderService:
+    """
+    排版服务
+
+    工作进程池的大小为workers，另有queue_size个请求可以排队等待；
+    全部占满时新的请求立即以503拒绝，不在服务端无限积压。
+    """
+
+    def __init__(self, workers: int = 1, queue_size: int = 8):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.served = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, request: Dict[str, Any]) -> Optional[bytes]:
+        """执行请求，返回结果；队列已满时返回None"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+        with self._lock:
+            self.pending += 1
+        try:
+            data = self._executor.submit(render, request).result()
+            with self._lock:
+                self.served += 1
+            return data
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'workers': self.workers, 'queue_size': self.queue_size, 'pending': self.pending,
+                    'served': self.served, 'failed': self.failed, 'rejected': self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理，服务对象在server.service上"""
+
+    server_version = 'vRainServer'
+
+    def send_json(self, status: int, data: Dict[str, Any]):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'error': '未知路径'})
+            return
+        self.send_json(200, dict(self.server.service.status(), status='ok'))
+
+    def do_POST(self):
+        if self.path != '/render':
+            self.send_json(404, {'error': '未知路径'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = parse_request(json.loads(self.rfile.read(length).decode('utf-8') or 'null'))
+        except (ValueError, UnicodeDecodeError):
+            self.send_json(400, {'error': '请求体不是有效的JSON'})
+            return
+        except RenderError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        try:
+            data = self.server.service.submit(request)
+        except RenderError as e:
+            tail = '\n'.join(e.log.strip().splitlines()[-ERROR_LOG_LINES:])
+            self.send_json(400, {'error': str(e), 'log': tail})
+            return
+        except Exception as e:
+            # 工作进程异常退出等
+            self.send_json(500, {'error': str(e)})
+            return
+        if data is None:
+            self.send_json(503, {'error': '服务繁忙，请稍后重试'})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', FORMATS[request['format']])
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765, workers: int = 1, queue_size: int = 8):
+    """
+    启动排版服务，Ctrl+C结束
+
+    Args:
+        host: 监听地址，默认只监听本机
+        port: 端口
+        workers: 工作进程数
+        queue_size: 排队请求数上限
+    """
+    service = RenderService(workers, queue_size)
+    server = ThreadingHTTPServer((host, port), RenderHandler)
+    server.service = service
+    print(f"vRain排版服务已启动：http://{host}:{server.server_address[1]}/，"
+          f"{service.workers}个工作进程，最多排队{service.queue_size}个请求（Ctrl+C结束）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n排版服务结束")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='vRain本地排版服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='端口，默认8765')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--queue', type=int, default=8, help='排队请求数上限，默认8')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.queue)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引擎会话
+
+GUI等长期运行的调用方在多次生成之间复用的资源：向reportlab注册的字体、
+用于检查字符支持的PIL字体对象与检查结果、简繁转换器、矢量背景生成器、
+按预设处理的背景图和预处理后的文本。
+各项按文件的修改时间和大小失效，字体、配置或文本修改后自动重新加载。
+两个排版引擎都接受session参数，未传入时各自创建一个会话，CLI的行为与原来相同。
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+Stamp = Optional[Tuple[int, int]]
+
+# 源文件哈希缓存：路径 -> ((mtime, 大小), 哈希)
+_source_hashes: Dict[str, Tuple[Stamp, str]] = {}
+
+
+def file_stamp(path) -> Stamp:
+    """文件的(修改时间, 大小)，文件不存在时为None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def file_hash(path) -> str:
+    """文件的SHA-256哈希，未给出路径或文件不存在时为空字符串"""
+    if not path or not os.path.exists(path):
+        return ''
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_hash(path) -> str:
+    """源文件（背景图、插图等）的SHA-256哈希，文件未修改时复用本进程上次的结果"""
+    stamp = file_stamp(path)
+    cached = _source_hashes.get(str(path))
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    if stamp is None:
+        raise FileNotFoundError(f"文件不存在：{path}")
+    digest = file_hash(path)
+    _source_hashes[str(path)] = (stamp, digest)
+    return digest
+
+
+def save_cached_jpeg(img, path, quality: int):
+    """
+    把缩放后的图片保存为缓存JPEG，先写临时文件再替换，多个进程同时生成同一缓存时不会读到半个文件
+
+    Args:
+        img: PIL图片
+        path: 缓存文件路径
+        quality: JPEG编码质量
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    img.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(manifest_path, warning: str) -> Dict[str, Any]:
+    """
+    读取批量处理的清单（JSON），不存在或无法读取时为空
+
+    Args:
+        manifest_path: 清单文件路径
+        warning: 无法读取时的提示，例如“压缩清单无法读取，将全部重新压缩”
+    """
+    manifest_path = Path(manifest_path)
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"警告：{warning}: {e}")
+        return {}
+
+
+def save_manifest(manifest_path, manifest: Dict[str, Any]):
+    """保存批量处理的清单，先写临时文件再替换，避免中断时损坏"""
+    manifest_path = Path(manifest_path)
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+class EngineSession:
+    """
+    引擎会话
+
+    会话只缓存与具体PDF文档无关的资源；reportlab的字体注册是进程级的，
+    同名字体的文件未变化时不再重复解析整个字体文件。
+    """
+
+    def __init__(self):
+        self._registered_fonts: Dict[str, Tuple[str, Stamp]] = {}
+        self._font_objects: Dict[Tuple[str, int], Tuple[Stamp, Any]] = {}
+        self._font_coverage: Dict[str, Tuple[Stamp, Dict[str, bool]]] = {}
+        self._converters = None
+        self._canvas_generators: Dict[Tuple[str, str], Tuple[Stamp, Any]] = {}
+        self._cache: Dict[Tuple[str, Hashable], Tuple[Hashable, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def register_font(self, font_name: str, font_path) -> bool:
+        """向reportlab注册TTF字体，同名字体已用同一未修改的文件注册过时跳过，返回是否重新注册"""
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        entry = (str(font_path), file_stamp(font_path))
+        if self._registered_fonts.get(font_name) == entry:
+            self.hits += 1
+            return False
+        self.misses += 1
+        pdfmetrics.registerFont(TTFont(font_name, str(font_path)))
+        self._registered_fonts[font_name] = entry
+        return True
+
+    def font_object(self, font_path, size: int = 40):
+        """PIL字体对象，字体文件修改后重新加载"""
+        from PIL import ImageFont
+
+        key = (str(font_path), size)
+        stamp = file_stamp(font_path)
+        cached = self._font_objects.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        font = ImageFont.truetype(str(font_path), size)
+        self._font_objects[key] = (stamp, font)
+        return font
+
+    def font_coverage(self, font_path) -> Dict[str, bool]:
+        """
+        字体的字符支持情况（字符 -> 是否支持），由调用方填充
+
+        每次生成开始时取一次，字体文件修改后返回新的空字典。
+        """
+        stamp = file_stamp(font_path)
+        cached = self._font_coverage.get(str(font_path))
+        if cached and cached[0] == stamp:
+            return cached[1]
+        coverage: Dict[str, bool] = {}
+        self._font_coverage[str(font_path)] = (stamp, coverage)
+        return coverage
+
+    def converters(self):
+        """简繁转换器(s2t, t2s)，OpenCC不可用时为(None, None)"""
+        if self._converters is None:
+            try:
+                import opencc
+                self._converters = (opencc.OpenCC('s2t'), opencc.OpenCC('t2s'))
+            except Exception:
+                self._converters = (None, None)
+        return self._converters
+
+    def canvas_generator(self, canvas_id: str, config_dir='canvas'):
+        """矢量背景生成器（canvas/canvas.py），背景图配置修改后重新读取"""
+        from canvas.canvas import CanvasGenerator
+
+        key = (str(config_dir), canvas_id)
+        stamp = file_stamp(Path(config_dir) / f"{canvas_id}.cfg")
+        cached = self._canvas_generators.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        generator = CanvasGenerator(canvas_id, config_dir=config_dir)
+        self._canvas_generators[key] = (stamp, generator)
+        return generator
+
+    def background(self, image_path, canvas_width: float, canvas_height: float, preset: str,
+                   canvas_dpi: float) -> Path:
+        """按预设处理的背景图（vrainBackground.prepare_background），背景图修改后重新处理"""
+        from vrainBackground import prepare_background
+
+        key = (str(image_path), canvas_width, canvas_height, preset, canvas_dpi)
+        return self.cached('background', key, file_stamp(image_path),
+                           lambda: prepare_background(image_path, canvas_width, canvas_height,
+                                                      preset, canvas_dpi))
+
+    def cached(self, namespace: str, name: Hashable, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        通用缓存：namespace和name确定缓存项，key与上次不同时调用loader重新生成
+
+        key应包含决定结果的全部输入，例如文件的file_stamp和相关配置项。
+        """
+        cached = self._cache.get((namespace, name))
+        if cached and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        value = loader()
+        self._cache[(namespace, name)] = (key, value)
+        return value
+
+    def clear(self):
+        """清空缓存（已注册的字体仍保留在reportlab中）"""
+        self._font_objects.clear()
+        self._font_coverage.clear()
+        self._canvas_generators.clear()
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self) -> str:
+        """缓存统计"""
+        return (f"字体{len(self._registered_fonts)}个，缓存{len(self._cache)}项，"
+                f"命中{self.hits}次，未命中{self.misses}次")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片生成与合并
+
+很长的书可以分给多台机器生成：每个节点运行
+
+    python vrain.py -b 01 -f 1 -t 30 --shard 2/4
+
+先预排版一遍得到分页索引（与预览使用的相同），按总页数均分为N段，只排版第i段的页，
+页码、版心标题与完整生成时一致；第1个分片包含封面。每个分片输出PDF片段和同名的.json说明文件，
+说明文件记录页码范围、目录和PDF元数据。片段收集到同一目录后运行
+
+    python vrain.py -b 01 -f 1 -t 30 --merge
+
+按页码顺序拼接片段，写入目录和元数据，页面内容与完整生成相同。每个片段都嵌入了自己的背景图和字体，
+拼接后合并内容相同的对象（vrainCompress的去重），背景图等只保留一份；字体子集按各片段用到的字生成，
+彼此不同，无法合并，因此文件比完整生成后再-c压缩的结果略大，分片越多差距越大。
+各节点的文本和配置须一致，说明文件中的排版指纹不一致时拒绝合并。
+"""
+
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+# 说明文件格式版本
+MANIFEST_VERSION = 1
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """
+    解析--shard参数
+
+    Args:
+        text: i/N，例如2/4
+
+    Returns:
+        Tuple[int, int]: (i, N)，i从1开始
+
+    Raises:
+        ValueError: 格式错误或i不在1到N之间
+    """
+    try:
+        i, n = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"分片参数应为i/N，例如2/4：{text}")
+    if not 1 <= i <= n:
+        raise ValueError(f"分片序号应在1到{n}之间：{text}")
+    return i, n
+
+
+def shard_range(total_pages: int, shard: int, shards: int) -> Tuple[int, int]:
+    """
+    第shard个分片的页码范围（正文页码，从1开始，含两端），页数不足时可能为空（起始大于结束）
+
+    Args:
+        total_pages: 正文总页数
+        shard: 分片序号，从1开始
+        shards: 分片数
+
+    Returns:
+        Tuple[int, int]: (起始页, 结束页)
+    """
+    return total_pages * (shard - 1) // shards + 1, total_pages * shard // shards
+
+
+def shard_paths(pdf_file, shard: int, shards: int) -> Tuple[Path, Path]:
+    """分片的PDF片段和说明文件路径，与最终PDF在同一目录"""
+    pdf_file = Path(pdf_file)
+    stem = f"{pdf_file.stem}.shard{shard}of{shards}"
+    return pdf_file.with_name(f"{stem}.pdf"), pdf_file.with_name(f"{stem}.json")
+
+
+def layout_fingerprint(dats: List[str], book: Dict[str, Any], total_pages: int) -> str:
+    """排版指纹：预处理后的文本、书籍配置和总页数，各节点一致时才能合并"""
+    digest = hashlib.sha1()
+    for dat in dats:
+        digest.update(dat.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(json.dumps(sorted(book.items()), ensure_ascii=False).encode('utf-8'))
+    digest.update(str(total_pages).encode('ascii'))
+    return digest.hexdigest()
+
+
+def write_manifest(path, manifest: Dict[str, Any]):
+    """写入分片说明文件"""
+    manifest = dict(manifest, version=MANIFEST_VERSION)
+    Path(path).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+def load_manifests(pdf_file) -> List[Dict[str, Any]]:
+    """
+    读取最终PDF对应的全部分片说明文件，检查分片齐全、页码连续、排版指纹一致
+
+    Args:
+        pdf_file: 最终PDF路径
+
+    Returns:
+        List[Dict[str, Any]]: 按分片序号排列的说明
+
+    Raises:
+        ValueError: 缺少分片或分片不一致
+    """
+    pdf_file = Path(pdf_file)
+    paths = sorted(pdf_file.parent.glob(f"{pdf_file.stem}.shard*of*.json"))
+    if not paths:
+        raise ValueError(f"未发现'{pdf_file.name}'的分片说明文件")
+    manifests = [json.loads(path.read_text(encoding='utf-8')) for path in paths]
+
+    shards = {m['shards'] for m in manifests}
+    if len(shards) != 1:
+        raise ValueError(f"分片数不一致：{sorted(shards)}，请删除旧的分片后重新生成")
+    shards = shards.pop()
+    by_shard = {m['shard']: m for m in manifests}
+    missing = [i for i in range(1, shards + 1) if i not in by_shard]
+    if missing:
+        raise ValueError(f"缺少分片：{'、'.join(f'{i}/{shards}' for i in missing)}")
+    manifests = [by_shard[i] for i in range(1, shards + 1)]
+
+    if len({m['fingerprint'] for m in manifests}) != 1:
+        raise ValueError("各分片的排版指纹不一致，请确认各节点的文本、配置相同后重新生成")
+    total = manifests[0]['total_pages']
+    expected = 1
+    for m in manifests:
+        if m['start'] <= m['end']:
+            if m['start'] != expected:
+                raise ValueError(f"分片{m['shard']}/{shards}的页码从{m['start']}开始，应从{expected}开始")
+            expected = m['end'] + 1
+    if expected != total + 1:
+        raise ValueError(f"分片只覆盖到第{expected - 1}页，共{total}页")
+    return manifests
+
+
+def merge_shards(pdf_file, remove: bool = True) -> Dict[str, Any]:
+    """
+    合并分片：按顺序拼接片段，写入目录和元数据
+
+    Args:
+        pdf_file: 最终PDF路径，分片与其在同一目录
+        remove: 合并成功后是否删除片段和说明文件
+
+    Returns:
+        Dict[str, Any]: shards（分片数）、pages（PDF页数）、outlines（目录条数）、
+            duplicates_removed（合并的重复对象数）
+
+    Raises:
+        ValueError: 缺少分片或分片不一致
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+    from vrainCompress import PDFCompressor
+
+    pdf_file = Path(pdf_file)
+    manifests = load_manifests(pdf_file)
+    first = manifests[0]
+
+    writer = PdfWriter()
+    for m in manifests:
+        if not m['fragment']:
+            continue
+        fragment = pdf_file.with_name(m['fragment'])
+        if not fragment.exists():
+            raise ValueError(f"未发现分片PDF'{fragment}'")
+        reader = PdfReader(str(fragment))
+        expected = (m['end'] - m['start'] + 1 if m['start'] <= m['end'] else 0) + (1 if m['cover'] else 0)
+        if len(reader.pages) != expected:
+            raise ValueError(f"分片PDF'{fragment.name}'有{len(reader.pages)}页，应为{expected}页")
+        for page in reader.pages:
+            writer.add_page(page)
+
+    # 目录页码为PDF页码（含封面），从1开始
+    for title, page in first['outlines']:
+        if 1 <= page <= len(writer.pages):
+            writer.add_outline_item(title, page - 1)
+    writer.add_metadata({f"/{key}": value for key, value in first['metadata'].items()})
+
+    # 先写出拼接结果，再合并各片段中重复的背景图等对象（不降采样图片）
+    merged_file = pdf_file.with_name(f"{pdf_file.stem}.merging.pdf")
+    with open(merged_file, 'wb') as f:
+        writer.write(f)
+    try:
+        stats = PDFCompressor(dpi=0).compress(merged_file, pdf_file)
+    finally:
+        merged_file.unlink(missing_ok=True)
+
+    if remove:
+        for m in manifests:
+            fragment, manifest = shard_paths(pdf_file, m['shard'], m['shards'])
+            fragment.unlink(missing_ok=True)
+            manifest.unlink(missing_ok=True)
+    return {'shards': len(manifests), 'pages': len(writer.pages), 'outlines': len(first['outlines']),
+            'duplicates_removed': stats['duplicates_removed']}
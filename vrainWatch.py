@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视模式
+
+vrain.py -b 01 --watch 生成一次后持续监视书籍的文本、配置、背景图和字体，
+文件保存后自动重新生成。只用标准库按间隔比较文件的修改时间和大小，不依赖外部服务。
+编辑器保存时常常连续写几次文件，检测到修改后等到一段时间内不再有新的修改才开始生成。
+
+修改按影响范围分类，每种范围只重新生成受影响的部分：
+    印章插图  yins.cfg、images.cfg：不重新排版，只重新叠加印章和插图
+    封面      cover.jpg：只重画封面页
+    文本      books/<id>/text/下的某个文本：该文本之前的页沿用上次的结果，从该文本的第一页起重新排版；
+              不在-f/-t范围内时不生成
+    背景      背景图片，或book.cfg中只改了canvas_preset、canvas_vector：不重新排版，只重画背景
+    排版      book.cfg的其它项、背景图配置、字体、文本文件增删：全部重新排版
+为此监视模式把输出分层保存（LayeredPdf）：封面页、正文各页、背景表单和印章插图，
+正文页通过同一个表单引用背景，印章插图在合成时逐页合并，修改后只重新生成受影响的层再合成输出。
+重新生成在同一个引擎会话中进行，未受影响的字体、预处理文本、背景等直接复用缓存。
+"""
+
+import re
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from vrainSession import Stamp, file_stamp
+
+# 影响范围，由小到大
+SCOPE_OVERLAY = 'overlay'
+SCOPE_COVER = 'cover'
+SCOPE_TEXT = 'text'
+SCOPE_CANVAS = 'canvas'
+SCOPE_LAYOUT = 'layout'
+SCOPE_ORDER = (SCOPE_OVERLAY, SCOPE_COVER, SCOPE_TEXT, SCOPE_CANVAS, SCOPE_LAYOUT)
+
+SCOPE_NAMES = {
+    SCOPE_OVERLAY: '印章插图',
+    SCOPE_COVER: '封面',
+    SCOPE_TEXT: '文本',
+    SCOPE_CANVAS: '背景',
+    SCOPE_LAYOUT: '排版',
+}
+
+# 只影响背景的book.cfg配置项，canvas_id会换用另一份背景图配置，属于排版
+CANVAS_CONFIG_KEYS = ('canvas_preset', 'canvas_vector')
+
+# 分层输出中正文页引用背景的表单名，及其在页面资源中的名称（reportlab加FormXob.前缀）
+BACKGROUND_FORM = 'vrainWatchBackground'
+BACKGROUND_XOBJECT = f'/FormXob.{BACKGROUND_FORM}'
+
+# 轮询间隔和防抖时间（秒）
+POLL_INTERVAL = 0.3
+DEBOUNCE = 0.5
+
+
+def read_config(path) -> Dict[str, str]:
+    """按vrain.py读取book.cfg的规则解析配置文件（不打印），文件不存在时为空"""
+    config: Dict[str, str] = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except OSError:
+        return config
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if '#' in line and '=#' not in line:
+            line = re.sub(r'#.*$', '', line)
+        line = re.sub(r'\s', '', line)
+        if '=' in line:
+            k, v = line.split('=', 1)
+            config[k] = v
+    return config
+
+
+class BookWatcher:
+    """
+    书籍文件监视器
+
+    snapshot记录被监视文件的(修改时间, 大小)；wait_for_changes轮询到修改后继续等待，
+    直到debounce秒内不再有新的修改，返回这一批修改的文件；classify判断影响范围。
+    """
+
+    def __init__(self, book_id: str, from_page: int, to_page: int,
+                 interval: float = POLL_INTERVAL, debounce: float = DEBOUNCE):
+        """
+        初始化监视器
+
+        Args:
+            book_id: 书籍ID
+            from_page: 起始文本序号
+            to_page: 结束文本序号
+            interval: 轮询间隔（秒）
+            debounce: 防抖时间（秒）
+        """
+        self.book_id = book_id
+        self.book_dir = Path(f"books/{book_id}")
+        self.from_page = from_page
+        self.to_page = to_page
+        self.interval = interval
+        self.debounce = debounce
+        self.book: Dict[str, str] = {}
+        self.stamps: Dict[Path, Stamp] = {}
+        self.snapshot()
+
+    def text_files(self) -> List[Path]:
+        """文本文件，顺序与vrain.py的load_texts一致"""
+        text_dir = self.book_dir / 'text'
+        return sorted([f for f in text_dir.glob('*.txt') if f.is_file() and not f.name.startswith('.')],
+                      key=lambda x: x.name)
+
+    def watched_files(self) -> List[Path]:
+        """被监视的文件：文本、书籍配置、印章插图配置、封面，以及书籍使用的背景和字体"""
+        files = self.text_files()
+        files += [self.book_dir / name for name in ('book.cfg', 'yins.cfg', 'images.cfg', 'cover.jpg')]
+        canvas_id = self.book.get('canvas_id')
+        if canvas_id:
+            files += [Path(f"canvas/{canvas_id}.cfg"), Path(f"canvas/{canvas_id}.jpg")]
+        for i in range(1, 6):
+            font_file = self.book.get(f'font{i}')
+            if font_file:
+                files.append(Path(f"fonts/{font_file}"))
+        return files
+
+    def snapshot(self):
+        """记录当前的书籍配置和全部被监视文件的状态"""
+        self.book = read_config(self.book_dir / 'book.cfg')
+        self.stamps = self.current()
+
+    def current(self) -> Dict[Path, Stamp]:
+        """全部被监视文件的当前状态"""
+        return {path: file_stamp(path) for path in self.watched_files()}
+
+    def diff(self, current: Dict[Path, Stamp]) -> Set[Path]:
+        """与上次记录相比发生变化的文件（含新增和删除的文件）"""
+        return {path for path in set(current) | set(self.stamps)
+                if current.get(path) != self.stamps.get(path)}
+
+    def wait_for_changes(self, should_stop: Optional[Callable[[], bool]] = None) -> Set[Path]:
+        """
+        等待一批修改：检测到修改后继续轮询，debounce秒内文件不再变化时返回
+
+        Args:
+            should_stop: 返回True时停止等待，返回空集合
+
+        Returns:
+            Set[Path]: 这一批修改的文件
+        """
+        last = None
+        quiet_since = time.time()
+        while True:
+            if should_stop and should_stop():
+                return set()
+            time.sleep(self.interval)
+            current = self.current()
+            if current != last:
+                last = current
+                quiet_since = time.time()
+                continue
+            changed = self.diff(current)
+            if changed and time.time() - quiet_since >= self.debounce:
+                return changed
+
+    def classify(self, changed: Set[Path]) -> Tuple[Set[str], List[int], str]:
+        """
+        判断一批修改的影响范围，并记录新的文件状态
+
+        Args:
+            changed: 修改的文件
+
+        Returns:
+            Tuple[Set[str], List[int], str]: 影响范围（空集合表示不需要重新生成）、
+                修改的文本序号（在-f/-t范围内的）和说明
+        """
+        old_book, old_stamps = self.book, self.stamps
+        self.snapshot()
+        scopes = set()
+        texts = []
+        notes = []
+
+        changed_texts = [path for path in changed if path.parent == self.book_dir / 'text']
+        if changed_texts:
+            if set(p for p in old_stamps if p.parent == self.book_dir / 'text') != set(self.text_files()):
+                scopes.add(SCOPE_LAYOUT)
+                notes.append('文本文件增删')
+            else:
+                order = {path: i for i, path in enumerate(self.text_files(), 1)}
+                texts = sorted(order[path] for path in changed_texts
+                               if self.from_page <= order[path] <= self.to_page)
+                if texts:
+                    scopes.add(SCOPE_TEXT)
+                notes.append('文本' + '、'.join(path.name for path in sorted(changed_texts)) +
+                             ('' if texts else '（不在本次生成范围内）'))
+
+        for path in changed:
+            if path.parent == self.book_dir / 'text':
+                continue
+            if path == self.book_dir / 'book.cfg':
+                keys = {k for k in set(old_book) | set(self.book) if old_book.get(k) != self.book.get(k)}
+                if keys:
+                    scopes.add(SCOPE_CANVAS if keys <= set(CANVAS_CONFIG_KEYS) else SCOPE_LAYOUT)
+                notes.append(f"book.cfg（{'、'.join(sorted(keys))}）" if keys else 'book.cfg（配置未变化）')
+            elif path.parts[0] == 'canvas':
+                # 背景图配置决定版框尺寸和文字坐标，背景图片只影响背景
+                scopes.add(SCOPE_CANVAS if path.suffix == '.jpg' else SCOPE_LAYOUT)
+                notes.append(str(path))
+            elif path.parts[0] == 'fonts':
+                scopes.add(SCOPE_LAYOUT)
+                notes.append(str(path))
+            elif path.name == 'cover.jpg':
+                scopes.add(SCOPE_COVER)
+                notes.append(path.name)
+            else:
+                scopes.add(SCOPE_OVERLAY)
+                notes.append(path.name)
+
+        return scopes, texts, '，'.join(notes)
+
+
+class LayeredPdf:
+    """
+    监视模式的分层输出
+
+    cover为封面页，pages为正文各页（第i页为pages[i-1]），background为背景表单；
+    正文页在资源中以BACKGROUND_XOBJECT引用背景，合成时统一指向当前的背景表单，
+    印章插图在合成时逐页合并，不进入各层。index为正文的分页索引，文本修改时据此找到该文本的第一页。
+    各层是PyPDF2的页面对象，保存时只复制被引用的对象，替换掉的旧页和旧背景不会写入输出。
+    """
+
+    def __init__(self):
+        self.cover = None
+        self.pages: List[Any] = []
+        self.background = None
+        self.index: Dict[int, tuple] = {}
+
+    def __bool__(self) -> bool:
+        return self.cover is not None and self.background is not None
+
+    @staticmethod
+    def _read(data: bytes):
+        from PyPDF2 import PdfReader
+        return PdfReader(BytesIO(data))
+
+    def set_cover(self, data: bytes):
+        """封面层：PDF的第1页"""
+        self.cover = self._read(data).pages[0]
+
+    def set_pages(self, data: bytes, first_page: int, index: Dict[int, tuple], cover: bool = False):
+        """
+        正文层：从第first_page页起换成data中的页，之前的页保留
+
+        Args:
+            data: PDF数据，第1页为封面或空白占位页，之后依次为第first_page页起的正文页
+            first_page: 重新排版的第一页
+            index: 新的分页索引
+            cover: 第1页是否为封面，是则同时替换封面层（同一文档中的页共用字体等对象）
+        """
+        pages = list(self._read(data).pages)
+        if cover:
+            self.cover = pages[0]
+        self.pages = self.pages[:first_page - 1] + pages[1:]
+        self.index = index
+
+    def set_background(self, data: bytes):
+        """背景层：PDF第1页资源中的背景表单"""
+        page = self._read(data).pages[0]
+        self.background = page['/Resources']['/XObject'].raw_get(BACKGROUND_XOBJECT)
+
+    def first_page_of(self, tid: int) -> Optional[int]:
+        """第tid个文本的第一页，未排版到该文本（例如-z测试模式）时为None"""
+        pages = [pid for pid, entry in self.index.items() if entry[0] == tid]
+        return min(pages) if pages else None
+
+    @property
+    def page_count(self) -> int:
+        """PDF页数（含封面）"""
+        return len(self.pages) + 1
+
+    def compose(self, path, metadata: Dict[str, str],
+                overlay: Optional[Tuple[bytes, Dict[int, int]]] = None) -> int:
+        """
+        合成输出PDF
+
+        Args:
+            path: 输出路径
+            metadata: PDF元数据（Title、Author等）
+            overlay: 印章插图，PageOverlays.render的结果
+
+        Returns:
+            int: PDF页数
+        """
+        from PyPDF2 import PdfWriter
+        from PyPDF2._page import PageObject
+        from PyPDF2.generic import NameObject
+
+        writer = PdfWriter()
+        for page in [self.cover] + self.pages:
+            xobjects = page['/Resources'].get('/XObject')
+            if xobjects is not None and BACKGROUND_XOBJECT in xobjects:
+                xobjects[NameObject(BACKGROUND_XOBJECT)] = self.background
+            writer.add_page(page)
+
+        if overlay:
+            # 在输出中的页（各层页的副本）上合并，叠加页先复制到输出文档中
+            data, overlay_pages = overlay
+            reader = self._read(data)
+            for pid, i in overlay_pages.items():
+                if pid <= len(writer.pages):
+                    stamp = PageObject(writer)
+                    stamp.update(reader.pages[i].clone(writer))
+                    page = writer.pages[pid - 1]
+                    page.merge_page(stamp)
+                    page.compress_content_streams()
+        writer.add_metadata({f"/{key}": value for key, value in metadata.items()})
+
+        with open(path, 'wb') as f:
+            writer.write(f)
+        return len(writer.pages)
+
+
+def run_rebuild(rebuild: Callable[[Set[str], List[int]], None], scopes: Set[str], texts: List[int]) -> bool:
+    """执行一次生成，失败时只打印原因，返回是否成功"""
+    start = time.time()
+    try:
+        rebuild(scopes, texts)
+    except SystemExit:
+        # vrain.py遇到配置错误时打印原因后sys.exit，修正后保存即可重新生成
+        print("生成失败，修正后保存文件将重新生成")
+        return False
+    except Exception as e:
+        print(f"生成失败：{e}，修正后保存文件将重新生成")
+        return False
+    print(f"生成完成，耗时{time.time() - start:.2f}秒")
+    return True
+
+
+def watch(book_id: str, from_page: int, to_page: int, rebuild: Callable[[Set[str], List[int]], None],
+          interval: float = POLL_INTERVAL, debounce: float = DEBOUNCE,
+          should_stop: Optional[Callable[[], bool]] = None):
+    """
+    先完整生成一次，然后监视书籍并在修改后重新生成，should_stop返回True时结束
+
+    Args:
+        book_id: 书籍ID
+        from_page: 起始文本序号
+        to_page: 结束文本序号
+        rebuild: 生成函数，参数为影响范围和修改的文本序号；抛出的异常和SystemExit只打印，不结束监视
+        interval: 轮询间隔（秒）
+        debounce: 防抖时间（秒）
+        should_stop: 返回True时结束监视
+    """
+    watcher = BookWatcher(book_id, from_page, to_page, interval, debounce)
+    run_rebuild(rebuild, {SCOPE_LAYOUT}, [])
+    print(f"监视'books/{book_id}'中的文本、配置、背景和字体，保存后自动重新生成（Ctrl+C结束）...")
+    while True:
+        changed = watcher.wait_for_changes(should_stop)
+        if not changed:
+            return
+        scopes, texts, note = watcher.classify(changed)
+        if not scopes:
+            print(f"检测到修改：{note}，无需重新生成")
+            continue
+        names = '、'.join(SCOPE_NAMES[scope] for scope in SCOPE_ORDER if scope in scopes)
+        print(f"检测到修改：{note}，影响范围：{names}，重新生成...")
+        run_rebuild(rebuild, scopes, texts)